@@ -5,3 +5,7 @@ import gtsa.temporal
 import gtsa.geospatial
 import gtsa.dataquery
 import gtsa.custom
+import gtsa.accumulators
+import gtsa.zonal
+import gtsa.catalog
+import gtsa.tileserver
@@ -0,0 +1,369 @@
+import numpy as np
+import dask.array as da
+
+"""
+Mergeable accumulators for streaming reductions.
+
+Each statistic is split into a chunk step, which summarizes a block of data,
+a combine step, which merges partial summaries, and an aggregate step, which
+turns the merged summary into the final value. Partial summaries from
+different time chunks can be merged in any order, so reductions do not
+require time-contiguous chunks.
+"""
+
+NMAD_SCALE = 1.4826
+SKETCH_SIZE = 32
+STREAMING_STATISTICS = ["count", "sum", "mean", "std", "min", "max", "median", "nmad"]
+
+
+def _flatten(partials):
+    """
+    Flattens the nested lists of partial summaries passed by dask.
+    """
+    if isinstance(partials, dict):
+        return [partials]
+    flat = []
+    for i in partials:
+        flat.extend(_flatten(i))
+    return flat
+
+
+def welford_chunk(array, axis=0):
+    """
+    Computes count, mean and sum of squared deviations along axis.
+    """
+    valid = np.isfinite(array)
+    n = valid.sum(axis=axis, keepdims=True).astype(float)
+    total = np.where(valid, array, 0).sum(axis=axis, keepdims=True)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = np.where(n > 0, total / n, 0)
+    m2 = np.where(valid, (array - mean) ** 2, 0).sum(axis=axis, keepdims=True)
+    return {"n": n, "mean": mean, "m2": m2}
+
+
+def welford_merge(a, b):
+    """
+    Merges two Welford summaries (Chan et al., 1979).
+    """
+    n = a["n"] + b["n"]
+    delta = b["mean"] - a["mean"]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = np.where(n > 0, a["mean"] + delta * b["n"] / n, 0)
+        m2 = np.where(n > 0, a["m2"] + b["m2"] + delta**2 * a["n"] * b["n"] / n, 0)
+    return {"n": n, "mean": mean, "m2": m2}
+
+
+def extrema_chunk(array, axis=0):
+    """
+    Computes running count, sum, min and max along axis.
+    """
+    valid = np.isfinite(array)
+    return {
+        "n": valid.sum(axis=axis, keepdims=True).astype(float),
+        "sum": np.where(valid, array, 0).sum(axis=axis, keepdims=True),
+        "min": np.where(valid, array, np.inf).min(axis=axis, keepdims=True),
+        "max": np.where(valid, array, -np.inf).max(axis=axis, keepdims=True),
+    }
+
+
+def extrema_merge(a, b):
+    """
+    Merges two count, sum, min and max summaries.
+    """
+    return {
+        "n": a["n"] + b["n"],
+        "sum": a["sum"] + b["sum"],
+        "min": np.minimum(a["min"], b["min"]),
+        "max": np.maximum(a["max"], b["max"]),
+    }
+
+
+def sketch_compress(groups, values, weights, n_groups, size=SKETCH_SIZE):
+    """
+    Compresses weighted values into at most `size` equal-weight centroids per group.
+
+    This is a merging digest with uniform centroid weights. Groups holding no
+    more than `size` values are kept exactly.
+
+    Inputs
+    groups   : array : integer group index for each value
+    values   : array : values to summarize
+    weights  : array : weight of each value
+    n_groups : int   : total number of groups
+    size     : int   : maximum number of centroids per group
+
+    Returns
+    means, weights : arrays of shape (n_groups, size). Empty centroids have zero weight.
+    """
+    groups = np.asarray(groups, dtype=np.int64).ravel()
+    values = np.asarray(values, dtype=float).ravel()
+    weights = np.asarray(weights, dtype=float).ravel()
+
+    keep = np.isfinite(values) & (weights > 0)
+    groups, values, weights = groups[keep], values[keep], weights[keep]
+
+    order = np.lexsort((values, groups))
+    groups, values, weights = groups[order], values[order], weights[order]
+
+    counts = np.bincount(groups, minlength=n_groups)
+    totals = np.bincount(groups, weights=weights, minlength=n_groups)
+    offsets = np.concatenate([[0], np.cumsum(totals)[:-1]])
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+
+    # Small groups keep one centroid per value, larger groups are binned by rank.
+    rank = np.arange(len(values)) - starts[groups]
+    midpoints = np.cumsum(weights) - weights / 2 - offsets[groups]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        binned = np.floor(midpoints / totals[groups] * size).astype(np.int64)
+    bins = np.where(counts[groups] <= size, rank, np.clip(binned, 0, size - 1))
+
+    key = groups * size + bins
+    weight_sums = np.bincount(key, weights=weights, minlength=n_groups * size)
+    value_sums = np.bincount(key, weights=weights * values, minlength=n_groups * size)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        means = np.where(weight_sums > 0, value_sums / weight_sums, np.nan)
+
+    return means.reshape(n_groups, size), weight_sums.reshape(n_groups, size)
+
+
+def sketch_merge(sketches, size=SKETCH_SIZE):
+    """
+    Merges (means, weights) sketches sharing the same groups.
+    """
+    means = np.concatenate([s[0] for s in sketches], axis=1)
+    weights = np.concatenate([s[1] for s in sketches], axis=1)
+    n_groups = means.shape[0]
+    groups = np.repeat(np.arange(n_groups), means.shape[1])
+    return sketch_compress(groups, means, weights, n_groups, size=size)
+
+
+def sketch_quantile(means, weights, q):
+    """
+    Interpolates quantile q from (means, weights) sketches of shape (n_groups, size).
+    Returns NaN for empty groups.
+    """
+    means = np.where(weights > 0, means, np.inf)
+    order = np.argsort(means, axis=1)
+    means = np.take_along_axis(means, order, axis=1)
+    weights = np.take_along_axis(weights, order, axis=1)
+
+    total = weights.sum(axis=1, keepdims=True)
+    midpoints = np.cumsum(weights, axis=1) - weights / 2
+    target = q * total
+    n_valid = (weights > 0).sum(axis=1, keepdims=True)
+
+    upper = np.clip((midpoints < target).sum(axis=1, keepdims=True), 1, None)
+    upper = np.minimum(upper, np.clip(n_valid - 1, 1, None))
+    lower = upper - 1
+    if means.shape[1] == 1:
+        upper = lower
+
+    m0 = np.take_along_axis(means, lower, axis=1)
+    m1 = np.take_along_axis(means, upper, axis=1)
+    c0 = np.take_along_axis(midpoints, lower, axis=1)
+    c1 = np.take_along_axis(midpoints, upper, axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        fraction = np.clip(np.where(c1 > c0, (target - c0) / (c1 - c0), 0), 0, 1)
+        result = np.where(fraction > 0, m0 + fraction * (m1 - m0), m0)
+    result = np.where(n_valid == 1, m0, result)
+    result = np.where(n_valid == 0, np.nan, result)
+    return result[:, 0]
+
+
+def sketch_nmad(means, weights):
+    """
+    Approximates the NMAD from (means, weights) sketches.
+    """
+    median = sketch_quantile(means, weights, 0.5)
+    deviations = np.abs(means - median[:, np.newaxis])
+    return NMAD_SCALE * sketch_quantile(deviations, weights, 0.5)
+
+
+def _sketch_chunk(array, axis=0, size=SKETCH_SIZE):
+    """
+    Summarizes a (time, ...) block as a per-pixel sketch.
+    """
+    array = np.moveaxis(array, axis, 0)
+    shape = array.shape[1:]
+    n_groups = int(np.prod(shape))
+    values = array.reshape(array.shape[0], n_groups)
+    groups = np.broadcast_to(np.arange(n_groups), values.shape)
+    means, weights = sketch_compress(
+        groups, values, np.ones(values.shape), n_groups, size=size
+    )
+    return {"shape": shape, "means": means, "weights": weights}
+
+
+def _sketch_combine(partials, size=SKETCH_SIZE):
+    partials = _flatten(partials)
+    means, weights = sketch_merge(
+        [(p["means"], p["weights"]) for p in partials], size=size
+    )
+    return {"shape": partials[0]["shape"], "means": means, "weights": weights}
+
+
+def _reduce(array, chunk, combine, aggregate, axis):
+    """
+    Runs a mergeable reduction on numpy or dask arrays.
+    """
+    if isinstance(axis, (tuple, list)):
+        if len(axis) != 1:
+            raise ValueError("Streaming reductions support a single axis.")
+        axis = axis[0]
+
+    if not isinstance(array, da.Array):
+        return aggregate(chunk(np.asarray(array), axis=axis))
+
+    # dask probes each step with empty arrays to infer metadata.
+    def _chunk(x, axis, keepdims, computing_meta=False):
+        if computing_meta:
+            return x
+        return chunk(x, axis=axis[0])
+
+    def _combine(partials, axis, keepdims, computing_meta=False):
+        if computing_meta:
+            return partials
+        return combine(partials)
+
+    def _aggregate(partials, axis, keepdims, computing_meta=False):
+        if computing_meta:
+            return partials
+        return aggregate(combine(partials))
+
+    return da.reduction(
+        array,
+        _chunk,
+        _aggregate,
+        combine=_combine,
+        axis=axis,
+        keepdims=False,
+        concatenate=False,
+        dtype=float,
+        meta=np.array((), dtype=float),
+    )
+
+
+def _welford_combine(partials):
+    partials = _flatten(partials)
+    result = partials[0]
+    for p in partials[1:]:
+        result = welford_merge(result, p)
+    return result
+
+
+def _extrema_combine(partials):
+    partials = _flatten(partials)
+    result = partials[0]
+    for p in partials[1:]:
+        result = extrema_merge(result, p)
+    return result
+
+
+def _squeeze(result, axis):
+    return np.squeeze(result, axis=axis)
+
+
+def streaming_count(array, axis=0):
+    return _reduce(
+        array,
+        extrema_chunk,
+        _extrema_combine,
+        lambda r: _squeeze(r["n"], axis),
+        axis,
+    )
+
+
+def streaming_sum(array, axis=0):
+    return _reduce(
+        array,
+        extrema_chunk,
+        _extrema_combine,
+        lambda r: _squeeze(np.where(r["n"] > 0, r["sum"], np.nan), axis),
+        axis,
+    )
+
+
+def streaming_min(array, axis=0):
+    return _reduce(
+        array,
+        extrema_chunk,
+        _extrema_combine,
+        lambda r: _squeeze(np.where(r["n"] > 0, r["min"], np.nan), axis),
+        axis,
+    )
+
+
+def streaming_max(array, axis=0):
+    return _reduce(
+        array,
+        extrema_chunk,
+        _extrema_combine,
+        lambda r: _squeeze(np.where(r["n"] > 0, r["max"], np.nan), axis),
+        axis,
+    )
+
+
+def streaming_mean(array, axis=0):
+    return _reduce(
+        array,
+        welford_chunk,
+        _welford_combine,
+        lambda r: _squeeze(np.where(r["n"] > 0, r["mean"], np.nan), axis),
+        axis,
+    )
+
+
+def streaming_std(array, axis=0, ddof=0):
+    def aggregate(r):
+        with np.errstate(invalid="ignore", divide="ignore"):
+            std = np.sqrt(r["m2"] / (r["n"] - ddof))
+        return _squeeze(np.where(r["n"] > ddof, std, np.nan), axis)
+
+    return _reduce(array, welford_chunk, _welford_combine, aggregate, axis)
+
+
+def streaming_median(array, axis=0, size=SKETCH_SIZE):
+    """
+    Approximate median from per-pixel sketches. Exact for series of up to `size` values.
+    """
+    return _reduce(
+        array,
+        lambda x, axis: _sketch_chunk(x, axis=axis, size=size),
+        lambda p: _sketch_combine(p, size=size),
+        lambda r: sketch_quantile(r["means"], r["weights"], 0.5).reshape(r["shape"]),
+        axis,
+    )
+
+
+def streaming_nmad(array, axis=0, size=SKETCH_SIZE):
+    """
+    Approximate NMAD from per-pixel sketches. Exact for series of up to `size` values.
+    """
+    return _reduce(
+        array,
+        lambda x, axis: _sketch_chunk(x, axis=axis, size=size),
+        lambda p: _sketch_combine(p, size=size),
+        lambda r: sketch_nmad(r["means"], r["weights"]).reshape(r["shape"]),
+        axis,
+    )
+
+
+def dask_streaming_stat(DataArray, stat, dim="time"):
+    """
+    Reduces DataArray along dim with a mergeable accumulator.
+    Works on any chunking along dim.
+
+    Inputs
+    DataArray : xr.DataArray
+    stat      : str : one of STREAMING_STATISTICS
+    dim       : str : dimension to reduce
+
+    Returns
+    xr.DataArray
+    """
+    if stat not in STREAMING_STATISTICS:
+        raise ValueError(f"stat must be one of {STREAMING_STATISTICS}")
+    func = globals()["streaming_" + stat]
+    result = DataArray.reduce(func, dim=dim)
+    result.name = stat
+    return result
@@ -0,0 +1,302 @@
+import concurrent.futures
+import json
+import sqlite3
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import psutil
+import rasterio
+import rasterio.warp
+import shapely
+from shapely.geometry import box
+
+from gtsa import io
+
+"""
+Persistent catalog of GeoTIFF metadata.
+
+Each file is opened once by a process pool scanner. Footprint, CRS, transform,
+resolution, dtype, nodata and parsed timestamp are stored in SQLite and only
+rescanned when the file modification time changes. Bounds, centroid and CRS
+checks then read from the catalog instead of reopening every raster.
+"""
+
+CATALOG_TABLE = "geotifs"
+CATALOG_COLUMNS = {
+    "path": "TEXT PRIMARY KEY",
+    "mtime": "REAL",
+    "size": "INTEGER",
+    "crs": "TEXT",
+    "epsg": "INTEGER",
+    "transform": "TEXT",
+    "width": "INTEGER",
+    "height": "INTEGER",
+    "count": "INTEGER",
+    "overviews": "INTEGER",
+    "xres": "REAL",
+    "yres": "REAL",
+    "xmin": "REAL",
+    "ymin": "REAL",
+    "xmax": "REAL",
+    "ymax": "REAL",
+    "dtype": "TEXT",
+    "nodata": "REAL",
+    "footprint": "TEXT",
+    "timestamp": "TEXT",
+}
+
+
+def _file_stat(file_name):
+    """
+    Returns modification time and size, or None for remote files.
+    """
+    if "://" in str(file_name):
+        return None, None
+    stat = Path(file_name).stat()
+    return stat.st_mtime, stat.st_size
+
+
+def scan_geotif(file_name):
+    """
+    Reads metadata of a single GeoTIFF.
+
+    Inputs
+    file_name : str : file path or URL
+
+    Returns
+    dict with one entry per catalog column
+    """
+    mtime, size = _file_stat(file_name)
+    env = {}
+    if "://" in str(file_name):
+        # read the header with a single range request, without listing sidecar files
+        env = {"GDAL_DISABLE_READDIR_ON_OPEN": "EMPTY_DIR"}
+    with rasterio.Env(**env), rasterio.open(file_name) as src:
+        xmin, ymin, xmax, ymax = src.bounds
+        xres, yres = src.res
+        return {
+            "path": str(file_name),
+            "mtime": mtime,
+            "size": size,
+            "crs": src.crs.to_wkt() if src.crs else None,
+            "epsg": src.crs.to_epsg() if src.crs else None,
+            "transform": json.dumps(list(src.transform)[:6]),
+            "width": src.width,
+            "height": src.height,
+            "count": src.count,
+            "overviews": len(src.overviews(1)),
+            "xres": xres,
+            "yres": yres,
+            "xmin": xmin,
+            "ymin": ymin,
+            "xmax": xmax,
+            "ymax": ymax,
+            "dtype": src.dtypes[0],
+            "nodata": src.nodata,
+            "footprint": box(xmin, ymin, xmax, ymax).wkt,
+            "timestamp": None,
+        }
+
+
+def _scan_records(files, workers=None):
+    files = [str(i) for i in files]
+    if all("://" in i for i in files):
+        # remote headers are bound by network latency, not cpu
+        workers = min(workers or 32, len(files))
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+            return list(pool.map(scan_geotif, files))
+    if not workers:
+        workers = max(psutil.cpu_count(logical=True) - 1, 1)
+    workers = min(workers, len(files))
+    if workers < 2:
+        return [scan_geotif(i) for i in files]
+    chunksize = max(len(files) // (workers * 4), 1)
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(scan_geotif, files, chunksize=chunksize))
+
+
+def scan_geotifs(files, workers=None):
+    """
+    Reads metadata of many GeoTIFFs with a process pool.
+
+    Returns
+    pd.DataFrame with one row per file
+    """
+    records = _scan_records(files, workers=workers)
+    return pd.DataFrame.from_records(records, columns=list(CATALOG_COLUMNS))
+
+
+def _connect(catalog_file):
+    connection = sqlite3.connect(str(catalog_file))
+    columns = ", ".join(f'"{k}" {v}' for k, v in CATALOG_COLUMNS.items())
+    connection.execute(f"CREATE TABLE IF NOT EXISTS {CATALOG_TABLE} ({columns})")
+    # add columns missing from catalogs written by earlier versions
+    existing = [i[1] for i in connection.execute(f"PRAGMA table_info({CATALOG_TABLE})")]
+    for k, v in CATALOG_COLUMNS.items():
+        if k not in existing:
+            connection.execute(f'ALTER TABLE {CATALOG_TABLE} ADD COLUMN "{k}" {v}')
+    return connection
+
+
+def read_catalog(catalog_file, files=None):
+    """
+    Reads the catalog as a DataFrame, optionally limited to files.
+    """
+    with _connect(catalog_file) as connection:
+        df = pd.read_sql_query(f"SELECT * FROM {CATALOG_TABLE}", connection)
+    connection.close()
+    if files is not None:
+        df = df.set_index("path").reindex([str(i) for i in files]).reset_index()
+    return df
+
+
+def update_catalog(
+    files,
+    catalog_file=None,
+    workers=None,
+    date_string_format=None,
+    date_string_pattern="_........_",
+    date_string_pattern_offset=1,
+    verbose=False,
+):
+    """
+    Adds new and modified GeoTIFFs to the catalog and returns their metadata.
+
+    Files are rescanned only if their modification time or size changed.
+    Timestamps are parsed from file names if date_string_format is set.
+
+    Inputs
+    files                      : list of file paths or URLs
+    catalog_file               : str : SQLite file. Default is an in-memory catalog.
+    workers                    : int : number of processes used for scanning
+    date_string_format         : str : format of the date string, e.g. '%Y%m%d'
+    date_string_pattern        : str : wildcard date string pattern, periods are wildcards
+    date_string_pattern_offset : int : length of prefix and suffix around the wildcard sequence
+
+    Returns
+    pd.DataFrame with one row per file, in the order of files
+    """
+    files = [str(i) for i in files]
+    connection = _connect(catalog_file or ":memory:")
+
+    known = pd.read_sql_query(
+        f"SELECT path, mtime, size FROM {CATALOG_TABLE}", connection
+    ).set_index("path")
+    stale = []
+    for file_name in files:
+        if file_name not in known.index:
+            stale.append(file_name)
+        elif "://" not in file_name:
+            mtime, size = _file_stat(file_name)
+            if (mtime, size) != tuple(known.loc[file_name, ["mtime", "size"]]):
+                stale.append(file_name)
+
+    if stale:
+        if verbose:
+            print(f"Scanning {len(stale)} of {len(files)} files")
+        records = _scan_records(stale, workers=workers)
+        columns = ", ".join(f'"{k}"' for k in CATALOG_COLUMNS)
+        placeholders = ", ".join("?" for _ in CATALOG_COLUMNS)
+        connection.executemany(
+            f"INSERT OR REPLACE INTO {CATALOG_TABLE} ({columns}) VALUES ({placeholders})",
+            [tuple(r[k] for k in CATALOG_COLUMNS) for r in records],
+        )
+
+    if date_string_format:
+        timestamps = io.parse_datetimes(
+            files, date_string_format, date_string_pattern, date_string_pattern_offset
+        )
+        connection.executemany(
+            f"UPDATE {CATALOG_TABLE} SET timestamp = ? WHERE path = ?",
+            [(t.isoformat() if t else None, i) for t, i in zip(timestamps, files)],
+        )
+    connection.commit()
+
+    df = pd.read_sql_query(f"SELECT * FROM {CATALOG_TABLE}", connection)
+    connection.close()
+    df = df.set_index("path").reindex(files).reset_index()
+    df["timestamp"] = pd.to_datetime(df["timestamp"])
+    return df
+
+
+def max_bounds(df):
+    """
+    Returns xmin, xmax, ymin, ymax over all catalog entries.
+    """
+    return df["xmin"].min(), df["xmax"].max(), df["ymin"].min(), df["ymax"].max()
+
+
+def centroid(df):
+    xmin, xmax, ymin, ymax = max_bounds(df)
+    cx = (xmax - xmin) / 2 + xmin
+    cy = (ymax - ymin) / 2 + ymin
+    return cx, cy
+
+
+def lonlat_bounds(df):
+    """
+    Returns xmin, xmax, ymin, ymax over all catalog entries in EPSG:4326.
+    Entries may have different CRS.
+    """
+    bounds = np.array(
+        [
+            rasterio.warp.transform_bounds(i[0], "EPSG:4326", *i[1:])
+            for i in df[["crs", "xmin", "ymin", "xmax", "ymax"]].itertuples(index=False)
+        ]
+    )
+    return (
+        bounds[:, 0].min(),
+        bounds[:, 2].max(),
+        bounds[:, 1].min(),
+        bounds[:, 3].max(),
+    )
+
+
+def lonlat_centroid(df):
+    xmin, xmax, ymin, ymax = lonlat_bounds(df)
+    cx = (xmax - xmin) / 2 + xmin
+    cy = (ymax - ymin) / 2 + ymin
+    return cx, cy
+
+
+def common_crs(df, verbose=True):
+    """
+    Checks all catalog entries share the same CRS.
+    Entries without an EPSG code are compared as CRS objects.
+    """
+    if df["epsg"].notna().all():
+        if df["epsg"].nunique() == 1:
+            return True
+    else:
+        crs = [rasterio.crs.CRS.from_wkt(i) if i else None for i in df["crs"].unique()]
+        if all(i == crs[0] for i in crs):
+            return True
+    if verbose:
+        print("Not all input files have the same CRS")
+        for i in df[["epsg", "path"]].itertuples(index=False):
+            print("epsg:" + str(i.epsg), i.path)
+    return False
+
+
+def query_footprints(df, gdf):
+    """
+    Selects catalog entries whose footprints intersect any geometry in gdf.
+
+    Footprints are indexed with an STRtree per CRS and the geometries are
+    transformed to each CRS once.
+
+    Inputs
+    df  : pd.DataFrame : catalog entries
+    gdf : GeoDataFrame : area of interest
+
+    Returns
+    boolean np.ndarray, True where footprints intersect
+    """
+    selected = np.zeros(len(df), dtype=bool)
+    for crs, group in df.groupby("crs", sort=False):
+        tree = shapely.STRtree(shapely.from_wkt(group["footprint"].values))
+        geometries = gdf.to_crs(crs).geometry.values
+        _, hits = tree.query(geometries, predicate="intersects")
+        selected[df.index.get_indexer(group.index[np.unique(hits)])] = True
+    return selected
@@ -1,5 +1,6 @@
 import click
 import json
+import os
 from pathlib import Path
 import gtsa
 
@@ -27,6 +28,74 @@ import gtsa
     default=11,
     help="Zoom start for map. Default is 11.",
 )
+@click.option(
+    "-tl",
+    "--tiler",
+    default=None,
+    help="XYZ tile URL template of an external titiler instance. Default is 'https://titiler.xyz/cog/tiles/WebMercatorQuad/{z}/{x}/{y}', or the built-in gtsa tile server if --serve is set.",
+)
+@click.option(
+    "-pt",
+    "--port",
+    default=8080,
+    type=int,
+    help="Port of the built-in tile server used with --serve. Default is 8080.",
+)
+@click.option(
+    "-cd",
+    "--cache_dir",
+    default=None,
+    help="Directory to cache tiles rendered by the built-in tile server on disk. Default is memory only.",
+)
+@click.option(
+    "-sv",
+    "--serve",
+    is_flag=True,
+    default=False,
+    help="Set to serve tiles with the built-in gtsa tile server until interrupted, instead of titiler.xyz.",
+)
+@click.option(
+    "-cat",
+    "--catalog_file",
+    default=None,
+    help="SQLite file caching COG metadata between runs. Default is '<pipeline>_catalog.sqlite' next to the pipeline file.",
+)
+@click.option(
+    "-td",
+    "--tile_dir",
+    default=None,
+    help="Set to pre-render static XYZ tiles into this directory. The map then loads tiles as plain files and needs no tile server.",
+)
+@click.option(
+    "-zr",
+    "--zoom_range",
+    nargs=2,
+    default=(10, 16),
+    type=int,
+    help="Minimum and maximum zoom level of pre-rendered tiles. Default is 10 16.",
+)
+@click.option(
+    "-tf",
+    "--tile_format",
+    default="png",
+    type=click.Choice(["png", "webp"]),
+    help="Format of pre-rendered tiles. Default is 'png'.",
+)
+@click.option(
+    "-rs",
+    "--rescale",
+    nargs=2,
+    default=(0, 255),
+    type=float,
+    help="Values mapped to black and white in pre-rendered tiles. Default is 0 255.",
+)
+@click.option(
+    "-mw",
+    "--workers",
+    default=None,
+    type=int,
+    help="Number of cores used to pre-render tiles. Default is logical cores -1.",
+)
 @click.option(
     "-ow",
     "--overwrite",
@@ -41,15 +110,76 @@ import gtsa
     default=False,
     help="Set to silence stdout.",
 )
-def main(pipeline, output_file, zoom_start, silent, overwrite):
+def main(
+    pipeline,
+    output_file,
+    zoom_start,
+    tiler,
+    port,
+    cache_dir,
+    serve,
+    catalog_file,
+    tile_dir,
+    zoom_range,
+    tile_format,
+    rescale,
+    workers,
+    silent,
+    overwrite,
+):
     verbose = not silent
 
     with open(pipeline) as json_file:
         payload = json.load(json_file)
 
+    if not catalog_file:
+        catalog_file = Path(pipeline).with_name(Path(pipeline).stem + "_catalog.sqlite")
+
+    max_native_zoom = None
+    server = None
+    if tile_dir:
+        # tile urls are relative to the map, so the two can be shared together
+        map_directory = Path(output_file).resolve().parent
+        for site, site_payload in payload["sites"].items():
+            site_payload["tile_urls"] = []
+            for cog_url, cog_name in zip(
+                site_payload["cog_urls"], site_payload["cog_names"]
+            ):
+                cog_tile_dir = Path(tile_dir, site, cog_name).resolve()
+                if not cog_tile_dir.exists() or overwrite:
+                    gtsa.tileserver.export_tiles(
+                        cog_url,
+                        cog_tile_dir,
+                        min_zoom=zoom_range[0],
+                        max_zoom=zoom_range[1],
+                        rescale=rescale,
+                        driver=tile_format.upper(),
+                        workers=workers,
+                        verbose=verbose,
+                    )
+                elif verbose:
+                    print(f"{cog_tile_dir} exists. Set --overwrite to overwrite.")
+                relative = Path(os.path.relpath(cog_tile_dir, map_directory))
+                site_payload["tile_urls"].append(
+                    relative.as_posix() + "/{z}/{x}/{y}." + tile_format
+                )
+        max_native_zoom = zoom_range[1]
+    elif serve and not tiler:
+        server = gtsa.tileserver.get_tile_server(port=port, cache_dir=cache_dir)
+        tiler = server.tiles_url
+    elif not tiler:
+        tiler = gtsa.plotting.TITILER_URL
+        if verbose:
+            print(
+                f"Tiles are served by {tiler}. Set --serve or --tile_dir to view the map without an external tile server."
+            )
+
     m = gtsa.plotting.plot_cogs_sites(
         payload,
+        tiler=tiler,
         zoom_start=zoom_start,
+        max_native_zoom=max_native_zoom,
+        catalog_file=catalog_file,
         verbose=verbose,
     )
     if not Path(output_file).exists() or overwrite:
@@ -58,6 +188,9 @@ def main(pipeline, output_file, zoom_start, silent, overwrite):
             print("map saved to", output_file)
     elif Path(output_file).exists() and not overwrite:
         print(f"{output_file} exists. Set --overwrite to overwrite.")
+
+    if server:
+        server.serve_forever()
     return
 
 
@@ -3,6 +3,8 @@ from pathlib import Path
 import psutil
 import gtsa
 
+VALID_RESAMPLING = ["nearest", "bilinear", "cubic"]
+
 
 @click.command(
     help="Create Cloud Optimized GeoTIFFs (COGs) in EPSG:4326 for visualization with Folium and TiTiler."
@@ -28,6 +30,20 @@ import gtsa
     type=int,
     help="Number of cores. Default is logical cores -1.",
 )
+@click.option(
+    "-rs",
+    "--resampling",
+    default="cubic",
+    type=click.Choice(VALID_RESAMPLING),
+    help=f"Resampling method used for warping and overviews. Valid options are {VALID_RESAMPLING}. Default is 'cubic'.",
+)
+@click.option(
+    "-mm",
+    "--max_memory",
+    default=None,
+    type=int,
+    help="GDAL cache in MB shared by all workers. Default is 1/4 of available memory.",
+)
 @click.option(
     "-ow",
     "--overwrite",
@@ -46,6 +62,8 @@ def main(
     datadir,
     outdir,
     workers,
+    resampling,
+    max_memory,
     silent,
     overwrite,
 ):
@@ -58,9 +76,11 @@ def main(
     out = gtsa.utils.create_cogs(
         files,
         output_directory=outdir,
-        crs="EPSG:4326",  # currently required for visualization with folium and titiler
+        crs="EPSG:4326",  # currently required for visualization with folium
         overwrite=overwrite,
         workers=workers,
+        resampling=resampling,
+        max_memory=max_memory,
         verbose=verbose,
     )
     print("DONE")
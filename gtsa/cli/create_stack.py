@@ -2,10 +2,13 @@ import click
 from pathlib import Path
 import shutil
 import psutil
-import pandas as pd
+import rasterio
+import geopandas as gpd
 
 import gtsa
 
+VALID_RESAMPLING = ["nearest", "bilinear", "cubic"]
+
 
 @click.command(
     help="Stack single-band GeoTIFFs for memory-efficient data retrieval and processing. Both spatial (*.nc) and temporal (.zarr) stacks are created. All input raster grids are reprojected to the reference raster grid. If no --reference_tif is specified, the last in time is selected.  "
@@ -51,6 +54,53 @@ import gtsa
     default=1,
     help="Character length of prefix and suffix before wildcard sequence in date_string_pattern. Length of prefix and suffix must be equal. Default is 1.",
 )
+@click.option(
+    "-s",
+    "--shape",
+    default=None,
+    help="Path to vector file with area of interest. Only intersecting GeoTIFFs are stacked, on the reference grid cropped to its bounds. Default is None.",
+)
+@click.option(
+    "-b",
+    "--bounds",
+    nargs=4,
+    type=float,
+    default=None,
+    help="Area of interest as xmin ymin xmax ymax, used like --shape. Default is None.",
+)
+@click.option(
+    "-bc",
+    "--bounds_crs",
+    default="EPSG:4326",
+    help="CRS of --bounds. Default is 'EPSG:4326'.",
+)
+@click.option(
+    "-rs",
+    "--resampling",
+    default="cubic",
+    type=click.Choice(VALID_RESAMPLING),
+    help=f"Resampling method used to match the reference grid. Valid options are {VALID_RESAMPLING}. Default is 'cubic'.",
+)
+@click.option(
+    "-nd",
+    "--native_dtype",
+    is_flag=True,
+    default=False,
+    help="Set to keep native dtypes, e.g. uint8 orthoimages, with nodata as fill value instead of NaN. 8-bit data are resampled with nearest neighbor.",
+)
+@click.option(
+    "-pl",
+    "--pyramid_levels",
+    default=0,
+    type=int,
+    help="Number of 2x coarsened pyramid levels written into the Zarr stack for quick-look analyses with 'gtsa --level'. Default is 0.",
+)
+@click.option(
+    "-cat",
+    "--catalog_file",
+    default=None,
+    help="SQLite catalog of GeoTIFF metadata, updated incrementally. Default is to scan files without saving a catalog.",
+)
 @click.option(
     "-mw",
     "--workers",
@@ -91,6 +141,20 @@ import gtsa
     default=False,
     help="Set to remove temporary files.",
 )
+@click.option(
+    "-str",
+    "--skip_time_rechunk",
+    is_flag=True,
+    default=False,
+    help="Set to keep the spatially chunked Zarr stack and skip rechunking along time. Use with 'gtsa --streaming'.",
+)
+@click.option(
+    "-ri",
+    "--reference_index",
+    is_flag=True,
+    default=False,
+    help="Set to write a JSON index referencing the tiles of GeoTIFFs already on the reference grid, instead of copying data. Open it with 'gtsa --input_file stack.json'.",
+)
 @click.option(
     "-si",
     "--silent",
@@ -105,12 +169,21 @@ def main(
     date_string_format,
     date_string_pattern,
     date_string_pattern_offset,
+    shape,
+    bounds,
+    bounds_crs,
+    resampling,
+    native_dtype,
+    pyramid_levels,
+    catalog_file,
     workers,
     dask_enabled,
     ip_address,
     port,
     overwrite,
     cleanup,
+    skip_time_rechunk,
+    reference_index,
     silent,
 ):
     verbose = not silent
@@ -126,18 +199,40 @@ def main(
             verbose=verbose,
         )
 
-    files = [x.as_posix() for x in sorted(Path(datadir).glob("*.tif"))]
-
-    date_strings = [
-        x[date_string_pattern_offset:-date_string_pattern_offset]
-        for x in gtsa.io.parse_timestamps(
-            files, date_string_pattern=date_string_pattern
-        )
-    ]
+    files = sorted(Path(datadir).glob("*.tif"))
+    catalog = gtsa.catalog.update_catalog(
+        files,
+        catalog_file=catalog_file,
+        workers=workers,
+        date_string_format=date_string_format,
+        date_string_pattern=date_string_pattern,
+        date_string_pattern_offset=date_string_pattern_offset,
+        verbose=verbose,
+    )
+    for file_name in catalog.loc[catalog["timestamp"].isna(), "path"]:
+        print("pattern not found in", file_name)
 
     # ensure chronological sorting
-    date_strings, files = list(zip(*sorted(zip(date_strings, files))))
-    date_times = [pd.to_datetime(x, format=date_string_format) for x in date_strings]
+    catalog = catalog.dropna(subset=["timestamp"]).sort_values(["timestamp", "path"])
+    files = catalog["path"].tolist()
+    date_times = catalog["timestamp"].tolist()
+    if verbose and not gtsa.catalog.common_crs(catalog):
+        print("GeoTIFFs will be reprojected to the reference grid")
+
+    aoi = None
+    if shape:
+        aoi = gpd.read_file(shape)
+    elif bounds:
+        aoi = gtsa.geospatial.bounds2polygon(*bounds, crs=bounds_crs)
+    if aoi is not None:
+        catalog = catalog[gtsa.catalog.query_footprints(catalog, aoi)]
+        if verbose:
+            print(f"Selected {len(catalog)} of {len(files)} GeoTIFFs intersecting AOI")
+        if catalog.empty:
+            print("No GeoTIFFs intersect the area of interest.")
+            return
+        files = catalog["path"].tolist()
+        date_times = catalog["timestamp"].tolist()
 
     if not reference_tif:
         reference_tif = files[-1]
@@ -148,11 +243,34 @@ def main(
                 )
             )
 
+    if reference_index:
+        output_file = Path(outdir, "temporal", "stack.json")
+        if output_file.exists() and not overwrite:
+            print(f"{output_file} exists. Set --overwrite to overwrite.")
+            return
+        gtsa.io.create_reference_index(
+            files,
+            date_times,
+            reference_tif,
+            output_file=output_file.as_posix(),
+            verbose=verbose,
+        )
+        if verbose:
+            print("DONE")
+        return
+
+    aoi_bounds = None
+    if aoi is not None:
+        with rasterio.open(reference_tif) as ref:
+            aoi_bounds = tuple(aoi.to_crs(ref.crs).total_bounds)
+
     ds = gtsa.io.xr_stack_geotifs(
         files,
         date_times,
         reference_tif,
-        resampling="cubic",
+        bounds=aoi_bounds,
+        masked=not native_dtype,
+        resampling=resampling,
         save_to_nc=True,
         nc_out_dir=Path(outdir, "spatial").as_posix(),
         overwrite=overwrite,
@@ -168,6 +286,8 @@ def main(
             overwrite=overwrite,
             verbose=verbose,
             cleanup=cleanup,
+            time_contiguous=not skip_time_rechunk,
+            pyramid_levels=pyramid_levels,
         )
 
         if cleanup:
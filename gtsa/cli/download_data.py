@@ -43,7 +43,7 @@ VALID_PRODUCTS = ["dem", "ortho"]
     "--workers",
     default=None,
     type=int,
-    help="Number of cores. Default is logical cores -1.",
+    help="Number of concurrent downloads. Default is logical cores + 4, at most 32.",
 )
 @click.option(
     "-ow",
@@ -69,8 +69,6 @@ def main(
     silent,
 ):
     verbose = not silent
-    if not workers:
-        workers = psutil.cpu_count(logical=True) - 1
     gtsa.dataquery.download_historical_data(
         site=site,
         product=product,
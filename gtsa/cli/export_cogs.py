@@ -0,0 +1,135 @@
+import click
+from pathlib import Path
+import psutil
+
+import gtsa
+
+
+@click.command(
+    help="Export Zarr outputs of gtsa, e.g. mean.zarr or polyfit_deg1.zarr, to Cloud Optimized GeoTIFFs (COGs). Tiles are written in parallel batches, then overviews are built and the file is copied to the COG layout."
+)
+@click.option(
+    "-if",
+    "--input_file",
+    prompt=True,
+    default="data/dems/south-cascade/outputs",
+    help="Path to Zarr file, or directory containing Zarr files. Default is 'data/dems/south-cascade/outputs'.",
+)
+@click.option(
+    "-od",
+    "--outdir",
+    default=None,
+    help="Output directory path. Default is the directory of the input Zarr files.",
+)
+@click.option(
+    "-vn",
+    "--variable_name",
+    multiple=True,
+    default=None,
+    help="Variable to export. Can be repeated. Default is all variables.",
+)
+@click.option(
+    "-b",
+    "--bands",
+    is_flag=True,
+    default=False,
+    help="Set to write steps along non-spatial dimensions, e.g. time or degree, as bands of one file instead of one file each.",
+)
+@click.option(
+    "-crs",
+    "--crs",
+    default=None,
+    help="CRS of inputs without stored crs. Default is None.",
+)
+@click.option(
+    "-nd",
+    "--nodata",
+    default=-9999,
+    type=float,
+    help="Nodata value. Default is -9999.",
+)
+@click.option(
+    "-bs",
+    "--blocksize",
+    default=512,
+    type=int,
+    help="Internal tile size. Default is 512.",
+)
+@click.option(
+    "-de",
+    "--dask_enabled",
+    is_flag=True,
+    default=False,
+    help="Set to use dask.",
+)
+@click.option(
+    "-mw",
+    "--workers",
+    default=None,
+    type=int,
+    help="Number of cores. Default is logical cores -1.",
+)
+@click.option(
+    "-ow",
+    "--overwrite",
+    is_flag=True,
+    default=False,
+    help="Set to overwrite.",
+)
+@click.option(
+    "-si",
+    "--silent",
+    is_flag=True,
+    default=False,
+    help="Set to silence stdout.",
+)
+def main(
+    input_file,
+    outdir,
+    variable_name,
+    bands,
+    crs,
+    nodata,
+    blocksize,
+    dask_enabled,
+    workers,
+    overwrite,
+    silent,
+):
+    verbose = not silent
+
+    if not workers:
+        workers = psutil.cpu_count(logical=True) - 1
+
+    if dask_enabled:
+        client = gtsa.io.dask_start_cluster(workers, verbose=verbose)
+
+    if Path(input_file).suffix == ".zarr":
+        zarr_files = [input_file]
+    else:
+        zarr_files = sorted(Path(input_file).glob("*.zarr"))
+
+    for zarr_file in zarr_files:
+        try:
+            gtsa.io.export_cogs(
+                zarr_file,
+                output_directory=outdir,
+                variables=list(variable_name),
+                bands=bands,
+                crs=crs,
+                nodata=nodata,
+                blocksize=blocksize,
+                overwrite=overwrite,
+                verbose=verbose,
+            )
+        except (ValueError, KeyError) as e:
+            if Path(input_file).suffix == ".zarr":
+                raise
+            print(f"Skipping {zarr_file}: {e}")
+
+    if verbose:
+        print("DONE")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+import click
+from pathlib import Path
+import psutil
+import pandas as pd
+import xarray as xr
+
+import gtsa
+
+VALID_METHODS = ["nearest", "bilinear"]
+
+
+@click.command(
+    help="Extract time series at points from a Zarr stack. Each chunk containing points is read once."
+)
+@click.option(
+    "-if",
+    "--input_file",
+    prompt=True,
+    default="data/dems/south-cascade/temporal/stack.zarr",
+    help="Path to Zarr file. Default is 'data/dems/south-cascade/temporal/stack.zarr'.",
+)
+@click.option(
+    "-pf",
+    "--points_file",
+    prompt=True,
+    help="Path to CSV or Parquet file with point coordinates.",
+)
+@click.option(
+    "-of",
+    "--output_file",
+    default="points.csv",
+    help="Output CSV or Parquet file in long format. Default is 'points.csv'.",
+)
+@click.option(
+    "-vn",
+    "--variable_name",
+    default="band1",
+    help="Variable name. Default is 'band1'.",
+)
+@click.option(
+    "-x",
+    "--x_column",
+    default="lon",
+    help="Column with x coordinates. Default is 'lon'.",
+)
+@click.option(
+    "-y",
+    "--y_column",
+    default="lat",
+    help="Column with y coordinates. Default is 'lat'.",
+)
+@click.option(
+    "-crs",
+    "--crs",
+    default="EPSG:4326",
+    help="CRS of point coordinates. Default is 'EPSG:4326'.",
+)
+@click.option(
+    "-id",
+    "--id_column",
+    default=None,
+    help="Column with point ids. Default is the row index.",
+)
+@click.option(
+    "-m",
+    "--method",
+    default="nearest",
+    type=click.Choice(VALID_METHODS),
+    help=f"Sampling method. Valid options are {VALID_METHODS}. Default is 'nearest'.",
+)
+@click.option(
+    "-de",
+    "--dask_enabled",
+    is_flag=True,
+    default=False,
+    help="Set to use dask.",
+)
+@click.option(
+    "-mw",
+    "--workers",
+    default=None,
+    type=int,
+    help="Number of cores. Default is logical cores -1.",
+)
+@click.option(
+    "-ow",
+    "--overwrite",
+    is_flag=True,
+    default=False,
+    help="Set to overwrite.",
+)
+@click.option(
+    "-si",
+    "--silent",
+    is_flag=True,
+    default=False,
+    help="Set to silence stdout.",
+)
+def main(
+    input_file,
+    points_file,
+    output_file,
+    variable_name,
+    x_column,
+    y_column,
+    crs,
+    id_column,
+    method,
+    dask_enabled,
+    workers,
+    overwrite,
+    silent,
+):
+    verbose = not silent
+
+    if Path(output_file).exists() and not overwrite:
+        print(f"{output_file} exists. Set --overwrite to overwrite.")
+        return
+
+    if not workers:
+        workers = psutil.cpu_count(logical=True) - 1
+
+    if dask_enabled:
+        client = gtsa.io.dask_start_cluster(workers, verbose=verbose)
+
+    if Path(points_file).suffix == ".parquet":
+        df = pd.read_parquet(points_file)
+    else:
+        df = pd.read_csv(points_file)
+
+    ds = xr.open_dataset(input_file, chunks={}, engine="zarr")
+    ds = ds.rio.write_crs(ds.rio.crs or ds.attrs["crs"])  # write crs to all bands
+
+    if verbose:
+        print(f"Extracting time series at {len(df)} points")
+    result = gtsa.geospatial.extract_point_timeseries(
+        ds[variable_name],
+        df,
+        x=x_column,
+        y=y_column,
+        crs=crs,
+        id_column=id_column,
+        method=method,
+    )
+
+    Path(output_file).parent.mkdir(parents=True, exist_ok=True)
+    if Path(output_file).suffix == ".parquet":
+        result.to_parquet(output_file, index=False)
+    else:
+        result.to_csv(output_file, index=False)
+    if verbose:
+        print("Saved", output_file)
+        print("DONE")
+
+
+if __name__ == "__main__":
+    main()
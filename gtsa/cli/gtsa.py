@@ -23,11 +23,34 @@ VALID_COMPUTATIONS = [
     "sum",
     "nmad",
     "polyfit",
+    "theilsen",
+    "irls",
+    "bootstrap",
+    "jackknife",
+    "pairwise",
+    "zonal",
+    "hypsometry",
     "custom",
 ]
+VALID_TABLE_FORMATS = ["csv", "parquet"]
 VALID_FREQUENCIES = ["1Y"]
 
 
+def save_table(df, output_file, overwrite=False, verbose=True):
+    output_file = Path(output_file)
+    if output_file.exists() and not overwrite:
+        if verbose:
+            print(f"File already exists. {output_file}")
+            print("Overwrite set to False. Skipping.")
+        return
+    if output_file.suffix == ".parquet":
+        df.to_parquet(output_file, index=False)
+    else:
+        df.to_csv(output_file, index=False)
+    if verbose:
+        print("Saved", output_file)
+
+
 def check_computations(compute):
     if compute in VALID_COMPUTATIONS:
         return compute
@@ -44,7 +67,58 @@ def check_computations(compute):
     "--input_file",
     prompt=True,
     default="data/dems/south-cascade/temporal/stack.zarr",
-    help="Path to Zarr file. Default is 'data/stack.zarr'.",
+    help="Path or URL (e.g. s3://, https://) to Zarr file, JSON reference index created with 'create_stack --reference_index', or directory of GeoTIFFs opened as a virtual stack without writing intermediates. Default is 'data/stack.zarr'.",
+)
+@click.option(
+    "-rcd",
+    "--remote_cache_dir",
+    default=None,
+    help="Directory caching blocks of remote inputs between runs. Default is memory only.",
+)
+@click.option(
+    "-rcm",
+    "--remote_cache_memory",
+    default=512,
+    type=int,
+    help="Memory cache size for remote inputs in MB. Default is 512.",
+)
+@click.option(
+    "-rcs",
+    "--remote_cache_size",
+    default=10240,
+    type=int,
+    help="Disk cache size for remote inputs in MB. Default is 10240.",
+)
+@click.option(
+    "-an",
+    "--anon",
+    is_flag=True,
+    default=False,
+    help="Set to access public s3:// inputs anonymously.",
+)
+@click.option(
+    "-rt",
+    "--reference_tif",
+    default=None,
+    help="Reference GeoTIFF grid for a virtual stack. Default is the most recent GeoTIFF.",
+)
+@click.option(
+    "-dsf",
+    "--date_string_format",
+    default="%Y%m%d",
+    help="Format of string pattern in GeoTIFF file names of a virtual stack. Default is '%Y%m%d'.",
+)
+@click.option(
+    "-dsp",
+    "--date_string_pattern",
+    default="_........_",
+    help="Wildcard date string pattern in GeoTIFF file names of a virtual stack. Default is '_........_'.",
+)
+@click.option(
+    "-dspo",
+    "--date_string_pattern_offset",
+    default=1,
+    help="Character length of prefix and suffix before wildcard sequence in date_string_pattern. Default is 1.",
 )
 @click.option(
     "-vn",
@@ -78,6 +152,25 @@ def check_computations(compute):
     default=False,
     help="Set to reduce to input --shape bounds. Values and coordinates outside bounds are removed. Recommended for large datasets.",
 )
+@click.option(
+    "-id",
+    "--id_column",
+    default=None,
+    help="Column in --shape with polygon ids for '--compute zonal'. Default is the row index.",
+)
+@click.option(
+    "-ref",
+    "--reference_dem",
+    default=None,
+    help="Reference DEM for '--compute hypsometry'. Default is the reference GeoTIFF used by create_stack.",
+)
+@click.option(
+    "-bw",
+    "--band_width",
+    default=50.0,
+    type=float,
+    help="Elevation band width for '--compute hypsometry'. Default is 50.",
+)
 @click.option(
     "-ic",
     "--inverse_clip",
@@ -100,6 +193,41 @@ def check_computations(compute):
     type=int,
     help="Degree for polynomial fit. Provide after specifying '--compute polyfit'.",
 )
+@click.option(
+    "-nr",
+    "--replicates",
+    default=1000,
+    type=int,
+    help="Number of replicates for '--compute bootstrap'. Default is 1000.",
+)
+@click.option(
+    "-rb",
+    "--replicate_batch_size",
+    default=100,
+    type=int,
+    help="Number of bootstrap or jackknife replicates solved at once. Bounds memory use. Default is 100.",
+)
+@click.option(
+    "-pr",
+    "--pair",
+    multiple=True,
+    default=None,
+    help="Time step indices 'i,j' of a pair for which to save the full difference grid with '--compute pairwise'. Can be repeated.",
+)
+@click.option(
+    "-of",
+    "--outlier_filter",
+    default=None,
+    type=click.Choice(gtsa.temporal.OUTLIER_METHODS),
+    help=f"Iterative outlier rejection applied before all computations. Valid options are {gtsa.temporal.OUTLIER_METHODS}. Outlier masks and counts are saved. Default is None.",
+)
+@click.option(
+    "-ot",
+    "--outlier_threshold",
+    default=3.0,
+    type=float,
+    help="Clipping threshold in units of the standard deviation or NMAD for --outlier_filter. Default is 3.",
+)
 @click.option(
     "-f",
     "--frequency",
@@ -108,6 +236,27 @@ def check_computations(compute):
     type=click.Choice(VALID_FREQUENCIES),
     help=f"Frequency for timestamp conversion and model fitting. E.g. if '1Y', datetimes are converted to decimal year floats. Valid options are {VALID_FREQUENCIES}. Default is '1Y'.",
 )
+@click.option(
+    "-st",
+    "--streaming",
+    is_flag=True,
+    default=False,
+    help=f"Set to compute {gtsa.accumulators.STREAMING_STATISTICS} with mergeable accumulators on the native Zarr chunks. Time series do not need to be contiguous in a chunk. Median and nmad are approximate for long time series.",
+)
+@click.option(
+    "-lv",
+    "--level",
+    default=0,
+    type=int,
+    help="Pyramid level to process. Level n is coarsened by 2**n and written to outdir/level<n>. Levels not stored in the Zarr stack are coarsened on the fly. Default is 0, full resolution.",
+)
+@click.option(
+    "-tf",
+    "--table_format",
+    default="csv",
+    type=click.Choice(VALID_TABLE_FORMATS),
+    help=f"File format for tabular outputs. Valid options are {VALID_TABLE_FORMATS}. Default is 'csv'.",
+)
 @click.option(
     "-de",
     "--dask_enabled",
@@ -164,11 +313,27 @@ def check_computations(compute):
 )
 def main(
     input_file,
+    remote_cache_dir,
+    remote_cache_memory,
+    remote_cache_size,
+    anon,
+    reference_tif,
+    date_string_format,
+    date_string_pattern,
+    date_string_pattern_offset,
     variable_name,
     compute,
     degree,
+    replicates,
+    replicate_batch_size,
+    pair,
+    outlier_filter,
+    outlier_threshold,
     frequency,
     outdir,
+    streaming,
+    level,
+    table_format,
     workers,
     dask_enabled,
     ip_address,
@@ -180,6 +345,9 @@ def main(
     shape,
     clip2shape,
     reduce2bounds,
+    id_column,
+    reference_dem,
+    band_width,
     inverse_clip,
 ):
     verbose = not silent
@@ -206,19 +374,58 @@ def main(
             verbose=verbose,
         )
 
-    ds = xr.open_dataset(
-        input_file, chunks={"time": -1, "y": "auto", "x": "auto"}, engine="zarr"
-    )
+    remote = gtsa.io.is_remote(input_file)
+    if remote:
+        gtsa.io.configure_remote_cache(
+            cache_dir=remote_cache_dir,
+            memory_size=remote_cache_memory,
+            disk_size=remote_cache_size,
+            storage_options={"anon": True} if anon else None,
+        )
 
-    # this reduces memory usage, but it's slower than the above
-    tc, yc, xc = gtsa.io.determine_optimal_chuck_size(ds, verbose=verbose)
-    ds = xr.open_dataset(
-        input_file, chunks={"time": tc, "y": yc, "x": xc}, engine="zarr"
-    )
+    if (remote and Path(input_file).suffix not in [".zarr", ".json"]) or (
+        Path(input_file).is_dir() and any(Path(input_file).glob("*.tif"))
+    ):
+        files, date_times = gtsa.io.list_geotifs_with_timestamps(
+            input_file,
+            date_string_format=date_string_format,
+            date_string_pattern=date_string_pattern,
+            date_string_pattern_offset=date_string_pattern_offset,
+        )
+        if not reference_tif:
+            reference_tif = files[-1]
+        if verbose:
+            print(f"Opening {len(files)} GeoTIFFs as virtual stack on {reference_tif}")
+        ds = gtsa.io.open_virtual_stack(
+            files, date_times, reference_tif, resampling="cubic"
+        )
+        if level:
+            ds = gtsa.io.coarsen_stack(ds, 2**level)
+        if not streaming:
+            ds = ds.chunk({"time": -1, "y": "auto", "x": "auto"})
+    elif Path(input_file).suffix == ".json":
+        ds = gtsa.io.open_reference_stack(input_file)
+        if level:
+            ds = gtsa.io.coarsen_stack(ds, 2**level)
+        if not streaming:
+            ds = ds.chunk({"time": -1, "y": "auto", "x": "auto"})
+    elif streaming:
+        # keep native chunks, time series are only made contiguous where needed
+        ds = gtsa.io.open_stack_level(input_file, level, chunks={})
+    else:
+        ds = gtsa.io.open_stack_level(
+            input_file, level, chunks={"time": -1, "y": "auto", "x": "auto"}
+        )
+
+        # this reduces memory usage, but it's slower than the above
+        tc, yc, xc = gtsa.io.determine_optimal_chuck_size(ds, verbose=verbose)
+        ds = gtsa.io.open_stack_level(
+            input_file, level, chunks={"time": tc, "y": yc, "x": xc}
+        )
 
     if not ds.rio.crs:
         try:
-            ds.rio.write_crs(ds.attrs["crs"])
+            ds = ds.rio.write_crs(ds.attrs["crs"])
         except KeyError:
             if verbose:
                 print(
@@ -227,6 +434,18 @@ def main(
     else:
         ds = ds.rio.write_crs(ds.rio.crs)  # write crs to all bands
 
+    if "hypsometry" in compute and not reference_dem:
+        try:
+            reference_dem = ds.attrs["reference_geotif_file"]
+        except KeyError:
+            raise ValueError(
+                "No reference DEM found in Zarr dataset attributes. Provide --reference_dem for '--compute hypsometry'."
+            )
+    if "zonal" in compute and not (shape and ds.rio.crs):
+        raise ValueError(
+            "Must provide --shape and a Zarr file with crs for '--compute zonal'."
+        )
+
     if shape and ds.rio.crs:
         gdf = gpd.read_file(shape)
         gdf = gdf.to_crs(ds.rio.crs)
@@ -243,9 +462,17 @@ def main(
                     print(f"Initial bounds: {initial_bounds}")
                     print(f"Reduced bounds: {reduced_bounds}")
             if clip2shape:
-                ds = ds.rio.clip(
-                    gdf["geometry"], invert=inverse_clip
-                )  # clip to actual shape
+                ds = gtsa.geospatial.clip_to_geometry(
+                    ds,
+                    gdf,
+                    invert=inverse_clip,
+                    cache_dir=(
+                        Path(outdir, "masks")
+                        if remote
+                        else Path(input_file).with_suffix(".masks")
+                    ),
+                    verbose=verbose,
+                )  # clip to actual shape, skipping chunks outside of it
                 if verbose:
                     print(
                         f"Clipped to input --shape geometry. --inverse_clip set to {inverse_clip}."
@@ -268,6 +495,8 @@ def main(
         )
 
     output_directory = Path(outdir)
+    if level:
+        output_directory = Path(outdir, f"level{level}")
     output_directory.mkdir(parents=True, exist_ok=True)
 
     # TODO enable custom scratch space with dask.config.set({'temporary_directory': 'path/to/dir'})
@@ -281,7 +510,31 @@ def main(
     computations = []
     if degree:
         degree_tmp = degree.copy()  # will need these again later
+    if streaming:
+        ds_streaming = ds
+        if outlier_filter or set(compute) - set(gtsa.accumulators.STREAMING_STATISTICS):
+            ds = ds.chunk({"time": -1})
+    if outlier_filter:
+        if verbose:
+            print(
+                f"Flagging outliers with {outlier_filter} clipping at {outlier_threshold}."
+            )
+        filtered, mask = gtsa.temporal.dask_outlier_filter(
+            ds[variable_name], method=outlier_filter, threshold=outlier_threshold
+        )
+        ds[variable_name] = filtered
+        if streaming:
+            ds_streaming = ds
+        outlier_count = mask.sum(axis=0)
+        outlier_count.name = "outlier_count"
+        computations.extend([mask, outlier_count])
     for c in compute:
+        if streaming and c in gtsa.accumulators.STREAMING_STATISTICS:
+            result = gtsa.accumulators.dask_streaming_stat(
+                ds_streaming[variable_name], c, dim="time"
+            )
+            computations.append(result)
+            continue
         if c in CORE_MODULES:
             m = getattr(ds[variable_name], c)
             result = m(axis=0)
@@ -304,14 +557,54 @@ def main(
                 dim="time", deg=degree_tmp.pop(0)
             )
             computations.append(result)
+        if c in ["theilsen", "irls"]:
+            min_count = 3
+            if verbose:
+                print(f"Excluding time series with count < {min_count}.")
+            count = ds[variable_name].count(axis=0)
+            result = gtsa.temporal.dask_apply_trend(
+                ds[variable_name].where(count > min_count), method=c, dim="time"
+            )
+            computations.append(result)
+        if c in gtsa.temporal.RESAMPLING_METHODS:
+            result = gtsa.temporal.dask_bootstrap_trend(
+                ds[variable_name],
+                method=c,
+                dim="time",
+                kwargs={
+                    "n_replicates": replicates,
+                    "batch_size": replicate_batch_size,
+                },
+            )
+            computations.append(result)
+        if c == "pairwise":
+            if verbose:
+                print("Computing pairwise difference summaries")
+            df = gtsa.temporal.pairwise_differences(ds[variable_name], dim="time")
+            save_table(
+                df,
+                Path(output_directory, "pairwise." + table_format),
+                overwrite=overwrite,
+                verbose=verbose,
+            )
+            if pair:
+                pairs = [tuple(int(i) for i in p.split(",")) for p in pair]
+                result = gtsa.temporal.pairwise_difference_grids(
+                    ds[variable_name], pairs, dim="time"
+                )
+                result.name = "pairwise_grids"
+                computations.append(result)
         if c == "custom":
             result = gtsa.custom.func(ds, variable_name=variable_name)
             result.name = c
             computations.append(result)
 
+    trends = {}
     for i, result in enumerate(computations):
         if isinstance(result, type(xr.Dataset())):
-            if "polyfit_coefficients" in list(result.data_vars):
+            if "method" in result.attrs:
+                c = result.attrs["method"]
+            elif "polyfit_coefficients" in list(result.data_vars):
                 c = "polyfit_deg" + str(degree.pop(0))
         elif isinstance(result, type(xr.DataArray())):
             c = result.name
@@ -319,17 +612,79 @@ def main(
         output_file = Path(output_directory, c + ".zarr")
 
         result = result.chunk("auto", balance=True)
+        if ds.rio.crs and {"x", "y"} <= set(result.dims):
+            # xarray drops spatial_ref in reductions like polyfit
+            result = result.rio.write_crs(ds.rio.crs)
+            result.attrs["crs"] = ds.rio.crs.to_wkt()
         if overwrite:
             shutil.rmtree(output_file, ignore_errors=True)
         if overwrite or not output_file.exists():
             if verbose:
                 print("Computing", c)
-                result.to_zarr(output_file)
+            result.to_zarr(output_file)
             if verbose:
                 print("Saved", output_file)
         elif verbose:
             print(f"File already exists. {output_file}")
             print("Overwrite set to False. Skipping.")
+        if isinstance(result, type(xr.Dataset())):
+            if "polyfit_coefficients" in list(result.data_vars):
+                # the degree 1 coefficient is a constant rate only for linear fits
+                if int(result["degree"].max()) == 1:
+                    trends[c] = output_file
+                elif verbose and {"hypsometry", "zonal"} & set(compute):
+                    print(
+                        f"Skipping {c} in trend tables. Only linear fits are tabulated."
+                    )
+
+    if "hypsometry" in compute:
+        if verbose:
+            print(f"Computing statistics in {band_width} elevation bands")
+        df = gtsa.zonal.hypsometric_statistics(
+            ds[variable_name], reference_dem, band_width=band_width
+        )
+        save_table(
+            df,
+            Path(output_directory, "hypsometry." + table_format),
+            overwrite=overwrite,
+            verbose=verbose,
+        )
+        for c, output_file in trends.items():
+            slope = xr.open_dataset(output_file, engine="zarr", chunks={})
+            slope = slope["polyfit_coefficients"].sel(degree=1)
+            slope = slope.rio.write_crs(ds.rio.crs)
+            df = gtsa.zonal.hypsometric_statistics(
+                slope, reference_dem, band_width=band_width
+            )
+            save_table(
+                df,
+                Path(output_directory, f"hypsometry_{c}." + table_format),
+                overwrite=overwrite,
+                verbose=verbose,
+            )
+
+    if "zonal" in compute:
+        if verbose:
+            print(f"Computing zonal statistics for {len(gdf)} polygons")
+        df = gtsa.zonal.zonal_statistics(ds[variable_name], gdf, id_column=id_column)
+        save_table(
+            df,
+            Path(output_directory, "zonal." + table_format),
+            overwrite=overwrite,
+            verbose=verbose,
+        )
+        # aggregate trends from the saved outputs, e.g. dh/dt per polygon
+        for c, output_file in trends.items():
+            slope = xr.open_dataset(output_file, engine="zarr", chunks={})
+            slope = slope["polyfit_coefficients"].sel(degree=1)
+            slope = slope.rio.write_crs(ds.rio.crs)
+            df = gtsa.zonal.zonal_statistics(slope, gdf, id_column=id_column)
+            save_table(
+                df,
+                Path(output_directory, f"zonal_{c}." + table_format),
+                overwrite=overwrite,
+                verbose=verbose,
+            )
     return
 
 
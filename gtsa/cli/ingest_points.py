@@ -0,0 +1,125 @@
+import click
+from pathlib import Path
+
+import gtsa
+
+
+@click.command(
+    help="Bin point elevations, e.g. ICESat-2 or ATM, onto the grid of a Zarr stack as parallel median and count variables."
+)
+@click.option(
+    "-pf",
+    "--points_file",
+    prompt=True,
+    help="Path to CSV or Parquet file with point elevations.",
+)
+@click.option(
+    "-if",
+    "--input_file",
+    prompt=True,
+    default="data/dems/south-cascade/temporal/stack.zarr",
+    help="Path to Zarr file. Default is 'data/dems/south-cascade/temporal/stack.zarr'.",
+)
+@click.option(
+    "-x",
+    "--x_column",
+    default="lon",
+    help="Column with x coordinates. Default is 'lon'.",
+)
+@click.option(
+    "-y",
+    "--y_column",
+    default="lat",
+    help="Column with y coordinates. Default is 'lat'.",
+)
+@click.option(
+    "-z",
+    "--z_column",
+    default="h",
+    help="Column with elevations. Default is 'h'.",
+)
+@click.option(
+    "-t",
+    "--time_column",
+    default="time",
+    help="Column with timestamps. Default is 'time'.",
+)
+@click.option(
+    "-crs",
+    "--crs",
+    default="EPSG:4326",
+    help="CRS of point coordinates. Default is 'EPSG:4326'.",
+)
+@click.option(
+    "-fr",
+    "--frequency",
+    default="D",
+    help="Pandas frequency used to bin timestamps into time slices. Default is 'D'.",
+)
+@click.option(
+    "-vp",
+    "--variable_prefix",
+    default="points",
+    help="Prefix for output variables. Default is 'points'.",
+)
+@click.option(
+    "-cs",
+    "--chunksize",
+    default=1000000,
+    type=int,
+    help="Number of rows read at once. Default is 1000000.",
+)
+@click.option(
+    "-ow",
+    "--overwrite",
+    is_flag=True,
+    default=False,
+    help="Set to overwrite.",
+)
+@click.option(
+    "-si",
+    "--silent",
+    is_flag=True,
+    default=False,
+    help="Set to silence stdout.",
+)
+def main(
+    points_file,
+    input_file,
+    x_column,
+    y_column,
+    z_column,
+    time_column,
+    crs,
+    frequency,
+    variable_prefix,
+    chunksize,
+    overwrite,
+    silent,
+):
+    verbose = not silent
+
+    if not Path(input_file).exists():
+        print(f"{input_file} does not exist. Run create_stack first.")
+        return
+
+    gtsa.io.ingest_points(
+        points_file,
+        input_file,
+        x=x_column,
+        y=y_column,
+        z=z_column,
+        time=time_column,
+        crs=crs,
+        frequency=frequency,
+        variable_prefix=variable_prefix,
+        chunksize=chunksize,
+        overwrite=overwrite,
+        verbose=verbose,
+    )
+    if verbose:
+        print("DONE")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+import click
+from pathlib import Path
+import psutil
+import gtsa
+
+VALID_RESAMPLING = [
+    "nearest",
+    "bilinear",
+    "cubic",
+    "cubic_spline",
+    "lanczos",
+    "average",
+]
+
+
+@click.command(
+    help="Resample all DEMs in a directory to a target resolution in parallel."
+)
+@click.option(
+    "-dd",
+    "--datadir",
+    prompt=True,
+    default="data/dems/south-cascade",
+    help="Path to directory containing DEM GeoTIFFs. Default is 'data/dems/south-cascade'.",
+)
+@click.option(
+    "-od",
+    "--outdir",
+    default=None,
+    help="Output directory path. Default is datadir/resampled.",
+)
+@click.option(
+    "-r",
+    "--res",
+    prompt=True,
+    default=1.0,
+    type=float,
+    help="Target resolution in units of the DEM crs. Default is 1.",
+)
+@click.option(
+    "-mw",
+    "--workers",
+    default=None,
+    type=int,
+    help="Number of cores. Default is logical cores -1.",
+)
+@click.option(
+    "-rs",
+    "--resampling",
+    default="cubic",
+    type=click.Choice(VALID_RESAMPLING),
+    help=f"Resampling method. Valid options are {VALID_RESAMPLING}. Default is 'cubic'.",
+)
+@click.option(
+    "-mm",
+    "--max_memory",
+    default=None,
+    type=int,
+    help="GDAL cache in MB shared by all workers. Default is 1/4 of available memory.",
+)
+@click.option(
+    "-ow",
+    "--overwrite",
+    is_flag=True,
+    default=False,
+    help="Set to overwrite.",
+)
+@click.option(
+    "-si",
+    "--silent",
+    is_flag=True,
+    default=False,
+    help="Set to silence stdout.",
+)
+def main(
+    datadir,
+    outdir,
+    res,
+    workers,
+    resampling,
+    max_memory,
+    overwrite,
+    silent,
+):
+    verbose = not silent
+
+    if not workers:
+        workers = psutil.cpu_count(logical=True) - 1
+    files = [x for x in sorted(Path(datadir).glob("*.tif"))]
+    if not outdir:
+        outdir = Path(datadir, "resampled")
+
+    gtsa.utils.resample_dems(
+        files,
+        res=res,
+        output_directory=outdir,
+        overwrite=overwrite,
+        workers=workers,
+        resampling=resampling,
+        max_memory=max_memory,
+        verbose=verbose,
+    )
+    print("DONE")
+
+
+if __name__ == "__main__":
+    main()
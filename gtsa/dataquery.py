@@ -1,44 +1,312 @@
-from bs4 import BeautifulSoup
+import hashlib
+import json
+import mmap
+import os
+import threading
 from pathlib import Path
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import psutil
 from tqdm import tqdm
-import concurrent
+import concurrent.futures
 import gdown
 
+ZENODO_URL = "https://zenodo.org"
+ZENODO_RECORD = "7297154"
+DOWNLOAD_CHUNK_SIZE = 2**20
+DOWNLOAD_RETRIES = 5
+DOWNLOAD_SEGMENT_SIZE = 64 * 2**20
+DOWNLOAD_SEGMENT_WORKERS = 8
 
-def download_data(payload):
+
+def _default_download_workers():
+    """
+    Downloads are bound by network latency, not cpu, so use more threads than cores.
+    """
+    return min(32, psutil.cpu_count(logical=True) + 4)
+
+
+def create_session(pool_size=10, retries=DOWNLOAD_RETRIES):
+    """
+    Creates a requests session with a connection pool and retries on transient errors.
+    """
+    retry = Retry(
+        total=retries,
+        backoff_factor=1,
+        status_forcelist=[429, 500, 502, 503, 504],
+        allowed_methods=["GET", "HEAD"],
+    )
+    adapter = HTTPAdapter(
+        pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry
+    )
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def file_checksum(file_name, algorithm="md5", chunk_size=DOWNLOAD_CHUNK_SIZE):
+    """
+    Returns hex digest of a file, read in chunks.
+    """
+    digest = hashlib.new(algorithm)
+    with open(file_name, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def verify_checksum(file_name, checksum):
+    """
+    Checks a file against a checksum formatted as '<algorithm>:<hexdigest>', e.g.
+    'md5:1a2b...' as listed in Zenodo record metadata.
+    """
+    algorithm, expected = checksum.split(":", 1)
+    return file_checksum(file_name, algorithm=algorithm) == expected
+
+
+def zenodo_files(record=ZENODO_RECORD, base_url=ZENODO_URL, session=None):
+    """
+    Lists files of a Zenodo record with the Zenodo REST API.
+
+    Returns
+    list of dicts with key, url, checksum and size
+    """
+    session = session or requests
+    r = session.get(f"{base_url}/api/records/{record}", timeout=60)
+    r.raise_for_status()
+    files = []
+    for i in r.json()["files"]:
+        files.append(
+            {
+                "key": i["key"],
+                "url": i["links"]["self"],
+                "checksum": i.get("checksum"),
+                "size": i.get("size"),
+            }
+        )
+    return files
+
+
+class RangeNotSupported(Exception):
+    """
+    Raised when a server ignores HTTP Range requests.
+    """
+
+
+def probe_ranges(url, session):
     """
-    Executes request for url and output file name contained in paylod.
+    Requests the first byte of url.
+
+    Returns
+    size, True if the server supports byte ranges. Size is None if unknown.
+    """
+    headers = {"Range": "bytes=0-0"}
+    with session.get(url, headers=headers, stream=True, timeout=60) as r:
+        r.raise_for_status()
+        if r.status_code == 206 and "/" in r.headers.get("Content-Range", ""):
+            size = r.headers["Content-Range"].split("/")[-1]
+            if size != "*":
+                return int(size), True
+        size = r.headers.get("Content-Length")
+        return (int(size) if size else None), False
+
+
+def _download_stream(url, part, session, chunk_size=DOWNLOAD_CHUNK_SIZE):
+    """
+    Streams url into part, resuming from its current size.
+    """
+    for attempt in range(DOWNLOAD_RETRIES):
+        offset = part.stat().st_size if part.exists() else 0
+        headers = {"Range": f"bytes={offset}-"} if offset else {}
+        try:
+            with session.get(url, headers=headers, stream=True, timeout=60) as r:
+                if r.status_code == 416:
+                    total = r.headers.get("Content-Range", "").split("/")[-1]
+                    if total == str(offset):
+                        # .part already holds the complete file
+                        return
+                    # .part does not match the remote file, start over
+                    part.unlink()
+                    continue
+                r.raise_for_status()
+                mode = "ab" if offset and r.status_code == 206 else "wb"
+                with open(part, mode) as f:
+                    for chunk in r.iter_content(chunk_size=chunk_size):
+                        f.write(chunk)
+            return
+        except (requests.ConnectionError, requests.exceptions.ChunkedEncodingError):
+            if attempt == DOWNLOAD_RETRIES - 1:
+                raise
+    raise requests.ConnectionError(f"Incomplete download of {url}")
+
+
+def _download_segment(url, buffer, start, stop, session, chunk_size):
+    """
+    Writes bytes start to stop - 1 of url into buffer, retrying from the last byte
+    written if the connection breaks.
+    """
+    position = start
+    for attempt in range(DOWNLOAD_RETRIES):
+        headers = {"Range": f"bytes={position}-{stop - 1}"}
+        try:
+            with session.get(url, headers=headers, stream=True, timeout=60) as r:
+                r.raise_for_status()
+                if r.status_code != 206:
+                    raise RangeNotSupported(url)
+                for chunk in r.iter_content(chunk_size=chunk_size):
+                    buffer[position : position + len(chunk)] = chunk
+                    position += len(chunk)
+            if position == stop:
+                return
+        except (requests.ConnectionError, requests.exceptions.ChunkedEncodingError):
+            pass
+    raise requests.ConnectionError(f"Incomplete segment {start}-{stop} of {url}")
+
+
+def _download_segments(
+    url,
+    part,
+    size,
+    session,
+    segment_size=DOWNLOAD_SEGMENT_SIZE,
+    workers=DOWNLOAD_SEGMENT_WORKERS,
+    chunk_size=DOWNLOAD_CHUNK_SIZE,
+):
+    """
+    Downloads byte ranges of url concurrently into a preallocated, memory-mapped part
+    file. Finished segments are recorded next to it, so reruns only fetch the rest.
+    """
+    state_file = Path(str(part) + ".json")
+    done = set()
+    if part.exists() and state_file.exists():
+        state = json.loads(state_file.read_text())
+        if state["size"] == size and state["segment_size"] == segment_size:
+            done = set(state["done"])
+    if not done:
+        # record the preallocation first, so a zero-filled part is never mistaken
+        # for a streamed partial download
+        state = {"size": size, "segment_size": segment_size, "done": []}
+        state_file.write_text(json.dumps(state))
+        with open(part, "wb") as f:
+            f.truncate(size)
+
+    segments = [
+        (i, start, min(start + segment_size, size))
+        for i, start in enumerate(range(0, size, segment_size))
+        if i not in done
+    ]
+    lock = threading.Lock()
+
+    def fetch(segment):
+        i, start, stop = segment
+        _download_segment(url, buffer, start, stop, session, chunk_size)
+        with lock:
+            done.add(i)
+            state = {"size": size, "segment_size": segment_size, "done": sorted(done)}
+            state_file.write_text(json.dumps(state))
+
+    with open(part, "r+b") as f, mmap.mmap(f.fileno(), size) as buffer:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+            # list() raises the first segment error
+            list(pool.map(fetch, segments))
+        buffer.flush()
+    state_file.unlink()
+
+
+def download_data(
+    payload,
+    session=None,
+    chunk_size=DOWNLOAD_CHUNK_SIZE,
+    segment_size=DOWNLOAD_SEGMENT_SIZE,
+    segment_workers=DOWNLOAD_SEGMENT_WORKERS,
+):
+    """
+    Downloads url to output file name contained in payload.
+
+    Data are written to a .part file next to the output, which is renamed once
+    complete and, if a checksum is given, verified. Files larger than two segments
+    are fetched as concurrent byte ranges if the server supports them, otherwise
+    streamed in chunks. Interrupted downloads resume on the next call.
 
     Input
-    payload : tuple : tuple of url, filename
+    payload         : tuple : tuple of url, filename and optionally checksum
+    session         : requests.Session : shared session. Default creates a new one.
+    chunk_size      : int : bytes per write
+    segment_size    : int : bytes per range request. Set to None to always stream.
+    segment_workers : int : number of concurrent range requests per file
+
+    Returns
+    filename
     """
 
-    url, out = payload
-    r = requests.get(url)
-    open(out, "wb").write(r.content)
+    url, out = payload[:2]
+    checksum = payload[2] if len(payload) > 2 else None
+    session = session or create_session(pool_size=segment_workers)
+    part = Path(str(out) + ".part")
+
+    size, ranges = None, False
+    if segment_size:
+        size, ranges = probe_ranges(url, session)
+
+    state_file = Path(str(part) + ".json")
+    if ranges and size > 2 * segment_size:
+        try:
+            _download_segments(
+                url, part, size, session, segment_size, segment_workers, chunk_size
+            )
+        except RangeNotSupported:
+            ranges = False
+    if not (ranges and size > 2 * segment_size):
+        if state_file.exists():
+            # preallocated by an earlier segmented download, can not be appended to
+            part.unlink(missing_ok=True)
+            state_file.unlink()
+        _download_stream(url, part, session, chunk_size)
+
+    if checksum and not verify_checksum(part, checksum):
+        part.unlink()
+        raise ValueError(f"Checksum mismatch for {url}. Removed partial download.")
+    os.replace(part, out)
     return out
 
 
-def thread_downloads(payload, workers=None):
+def thread_downloads(payload, workers=None, verbose=True):
     """
     Executes multithreaded requests for urls and output file names contained in payload.
 
     Inputs
-    payload          : list : list of url, filename tuples
-    workers      : int  : number of threads to execture concurrent requests with. defaults to virtually available cores -1
+    payload : list : list of url, filename and optionally checksum tuples
+    workers : int  : number of concurrent downloads. defaults to logical cores + 4, at most 32.
 
+    Returns
+    list of downloaded file names
     """
 
     if not workers:
-        workers = psutil.cpu_count(logical=True) - 1
-
-    with tqdm(total=len(payload)) as pbar:
-        pool = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
-        future_to_url = {pool.submit(download_data, x): x for x in payload}
-        for future in concurrent.futures.as_completed(future_to_url):
-            pbar.update(1)
+        workers = _default_download_workers()
+
+    session = create_session(pool_size=workers * DOWNLOAD_SEGMENT_WORKERS)
+    outputs = []
+    failures = []
+    with tqdm(total=len(payload), disable=not verbose) as pbar:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+            future_to_url = {
+                pool.submit(download_data, x, session=session): x for x in payload
+            }
+            for future in concurrent.futures.as_completed(future_to_url):
+                try:
+                    outputs.append(future.result())
+                except Exception as e:
+                    failures.append((future_to_url[future][0], e))
+                pbar.update(1)
+
+    for url, e in failures:
+        print("Failed to download", url, e)
+    if failures:
+        print("Rerun to resume incomplete downloads.")
+    return outputs
 
 
 def download_historical_data(
@@ -48,14 +316,20 @@ def download_historical_data(
     include_refdem=False,
     overwrite=False,
     workers=None,
+    base_url=ZENODO_URL,
     verbose=True,
 ):
     """
     Downloads 1m DEMs from https://zenodo.org/record/7297154
 
+    Files are listed with the Zenodo API and verified against the record checksums.
+    Rerunning resumes interrupted downloads.
+
     Inputs
-    site    : str : 'mount-baker' or 'south-cascade'
-    product : str : 'dem' or 'ortho'
+    site     : str : 'mount-baker' or 'south-cascade'
+    product  : str : 'dem' or 'ortho'
+    workers  : int : number of concurrent downloads
+    base_url : str : Zenodo server, e.g. a mirror
     """
 
     if site != "mount-baker" and site != "south-cascade":
@@ -82,36 +356,30 @@ def download_historical_data(
             )
 
         if not workers:
-            workers = psutil.cpu_count(logical=True) - 1
-
-        base = "https://zenodo.org/"
-        url = base + "record/7297154"
-
-        reqs = requests.get(url)
-        soup = BeautifulSoup(reqs.text, "html.parser")
+            workers = _default_download_workers()
 
         output_directory = Path(output_directory, product + "s", site)
         output_directory.mkdir(parents=True, exist_ok=True)
 
-        urls = []
-        for link in soup.find_all("a"):
-            url = link.get("href")
-            if url:
-                if product_key in url and site in url and 'files' in url:
-                    urls.append(base + url[1:])
-        urls = sorted(set(urls))
-        outputs = [
-            Path(output_directory, url.split("/")[-1].split("?")[0]) for url in urls
+        files = [
+            i
+            for i in zenodo_files(base_url=base_url)
+            if product_key in i["key"] and site in i["key"]
         ]
+        files = sorted(files, key=lambda i: i["key"])
+        urls = [i["url"] for i in files]
+        outputs = [Path(output_directory, i["key"]) for i in files]
+        url = f"{base_url}/records/{ZENODO_RECORD}"
 
         payload = []
         omissions = []
         for i, v in enumerate(outputs):
-            if v.exists() and not overwrite:
+            # files left incomplete by earlier versions do not match the record size
+            complete = v.exists() and v.stat().st_size == files[i]["size"]
+            if complete and not overwrite:
                 omissions.append(str(v))
             else:
-                zipped = list(zip([urls[i], str(v)]))
-                payload.append((zipped[0][0], zipped[1][0]))
+                payload.append((urls[i], str(v), files[i]["checksum"]))
 
         if omissions and verbose:
             print("Skipping existing files:")
@@ -125,17 +393,18 @@ def download_historical_data(
 
         if payload:
             if verbose:
-                print("Downloading data from https://zenodo.org/record/7297154")
+                print("Downloading data from", url)
                 print("Site:", site)
-                print("Using", workers, "cores")
+                print("Using", workers, "concurrent downloads")
                 print("Downloading:")
                 for i in payload:
-                    print(i[0].replace("?download=1", ""))
+                    print(i[0])
                 print("Writing to", str(output_directory))
 
             thread_downloads(
                 payload,
                 workers=workers,
+                verbose=verbose,
             )
         if not payload and omissions and verbose:
             print("All files already exist")
@@ -192,6 +461,8 @@ def download_reference_dems(
     else:
         if verbose:
             print("Downloading reference dem for", site)
-        gdown.download(id=blob_id, output=output.as_posix(), quiet=not verbose)
+        gdown.download(
+            id=blob_id, output=output.as_posix(), quiet=not verbose, resume=True
+        )
 
     return
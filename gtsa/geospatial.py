@@ -1,11 +1,19 @@
 import geopandas as gpd
 import numpy as np
+import pandas as pd
+import pyproj
 import scipy
 import math
 import rasterio
-from shapely.geometry import Point, Polygon
-import concurrent
+from shapely.geometry import Polygon
 import rioxarray
+import rasterio.features
+import hashlib
+import dask
+import dask.array
+from pathlib import Path
+
+from gtsa import catalog
 
 
 def df_xy_coords_to_gdf(
@@ -17,7 +25,7 @@ def df_xy_coords_to_gdf(
     """
     Function to convert pandas dataframe containing lat, lon coordinates to geopandas dataframe.
     """
-    geometry = [Point(xy) for xy in zip(df[lon], df[lat])]
+    geometry = gpd.points_from_xy(df[lon], df[lat])
     gdf = gpd.GeoDataFrame(df, geometry=geometry, crs=crs)
 
     return gdf
@@ -40,40 +48,304 @@ def extract_gpd_geometry(point_gdf):
     """
     Function to extract x, y, z coordinates and add as columns to input geopandas data frame.
     """
-    x = []
-    y = []
-    z = []
-    for i in range(len(point_gdf)):
-        x.append(point_gdf["geometry"].iloc[i].coords[:][0][0])
-        y.append(point_gdf["geometry"].iloc[i].coords[:][0][1])
-        if len(point_gdf["geometry"].iloc[i].coords[:][0]) == 3:
-            z.append(point_gdf["geometry"].iloc[i].coords[:][0][2])
-
-    point_gdf["x"] = x
-    point_gdf["y"] = y
-    if len(point_gdf["geometry"].iloc[0].coords[:][0]) == 3:
-        point_gdf["z"] = z
+    point_gdf["x"] = point_gdf.geometry.x
+    point_gdf["y"] = point_gdf.geometry.y
+    if point_gdf.geometry.iloc[0].has_z:
+        point_gdf["z"] = point_gdf.geometry.z
     return point_gdf
 
 
-def dem_stack_bounds2polygon(tifs):
+def _sample_window(window, rows, cols, row_fractions, col_fractions, method):
+    """
+    Samples an in-memory (..., y, x) window at integer pixel indices.
+    Bilinear sampling interpolates between (row, col) and (row + 1, col + 1).
+    """
+    if method == "nearest":
+        return window[..., rows, cols]
+    top = (
+        window[..., rows, cols] * (1 - col_fractions)
+        + window[..., rows, cols + 1] * col_fractions
+    )
+    bottom = (
+        window[..., rows + 1, cols] * (1 - col_fractions)
+        + window[..., rows + 1, cols + 1] * col_fractions
+    )
+    return top * (1 - row_fractions) + bottom * row_fractions
+
+
+def extract_point_timeseries(
+    DataArray,
+    df,
+    x="lon",
+    y="lat",
+    crs="epsg:4326",
+    id_column=None,
+    method="nearest",
+    dim="time",
+):
+    """
+    Extracts time series at many points, reading each chunk that contains points once.
+
+    Points are transformed to the crs of DataArray and mapped to chunks in a vectorized way.
+    For each chunk, only the window spanning its points is read.
+
+    Inputs
+    DataArray : xr.DataArray with rioxarray extension : (time, y, x) or (y, x)
+    df        : pd.DataFrame : point table
+    x, y      : str : coordinate columns in df
+    crs       : str : crs of coordinates in df
+    id_column : str : column with point ids. Default is the DataFrame index.
+    method    : str : 'nearest' or 'bilinear'
+
+    Returns
+    pd.DataFrame in long format with one row per point and time step.
+    Points outside the grid are omitted.
+    """
+    if method not in ["nearest", "bilinear"]:
+        raise ValueError("method must be 'nearest' or 'bilinear'")
+
+    transformer = pyproj.Transformer.from_crs(crs, DataArray.rio.crs, always_xy=True)
+    xs, ys = transformer.transform(df[x].values, df[y].values)
+    cols, rows = ~DataArray.rio.transform() * (np.asarray(xs), np.asarray(ys))
+    ids = df[id_column].values if id_column else df.index.values
+
+    height, width = DataArray.rio.height, DataArray.rio.width
+    inside = (rows >= 0) & (rows < height) & (cols >= 0) & (cols < width)
+    if method == "bilinear":
+        # interpolate between pixel centers, clamped at the grid edges
+        rows = np.clip(rows - 0.5, 0, height - 1)
+        cols = np.clip(cols - 0.5, 0, width - 1)
+        row_index = np.clip(np.floor(rows), 0, max(height - 2, 0)).astype(int)
+        col_index = np.clip(np.floor(cols), 0, max(width - 2, 0)).astype(int)
+        row_fractions = rows - row_index
+        col_fractions = cols - col_index
+        halo = 1
+    else:
+        row_index = np.floor(rows).astype(int)
+        col_index = np.floor(cols).astype(int)
+        row_fractions = col_fractions = np.zeros(len(rows))
+        halo = 0
+
+    y_dim, x_dim = DataArray.rio.y_dim, DataArray.rio.x_dim
+    DataArray = DataArray.transpose(..., y_dim, x_dim)
+    data = DataArray.data
+    if not isinstance(data, dask.array.Array):
+        data = dask.array.from_array(data)
+    y_edges = np.cumsum((0,) + data.chunks[-2])
+    x_edges = np.cumsum((0,) + data.chunks[-1])
+
+    points = np.flatnonzero(inside)
+    chunk_ids = (np.searchsorted(y_edges, row_index[points], side="right") - 1) * len(
+        x_edges
+    ) + np.searchsorted(x_edges, col_index[points], side="right")
+
+    sample = dask.delayed(_sample_window)
+    tasks = []
+    groups = []
+    for chunk_id in np.unique(chunk_ids):
+        group = points[chunk_ids == chunk_id]
+        r0, r1 = row_index[group].min(), row_index[group].max() + 1 + halo
+        c0, c1 = col_index[group].min(), col_index[group].max() + 1 + halo
+        tasks.append(
+            sample(
+                data[..., r0:r1, c0:c1],
+                row_index[group] - r0,
+                col_index[group] - c0,
+                row_fractions[group],
+                col_fractions[group],
+                method,
+            )
+        )
+        groups.append(group)
+    results = dask.compute(*tasks)
+
+    has_time = dim in DataArray.dims
+    times = DataArray[dim].values if has_time else [None]
+    frames = []
+    for group, values in zip(groups, results):
+        values = np.atleast_2d(values)
+        frame = pd.DataFrame(
+            {
+                id_column or "id": np.tile(ids[group], len(times)),
+                "x": np.tile(np.asarray(xs)[group], len(times)),
+                "y": np.tile(np.asarray(ys)[group], len(times)),
+                "value": values.ravel(),
+            }
+        )
+        if has_time:
+            frame.insert(1, dim, np.repeat(times, len(group)))
+        frames.append(frame)
+    if not frames:
+        return pd.DataFrame(columns=[id_column or "id", dim, "x", "y", "value"])
+
+    return pd.concat(frames, ignore_index=True)
+
+
+def dem_stack_bounds2polygon(tifs, catalog_file=None):
     """
     Function to return polygon for max bounds in stack of DEMs.
 
     Input:
     tifs : list : DEM file paths
+    catalog_file : str : optional SQLite catalog, see gtsa.catalog
 
     Returns:
     polygon as GeoDataFrame
     """
-
-    if _check_common_epsg(tifs):
-        epsg_code = _get_epsg_code(tifs[0])
-        xmin, xmax, ymin, ymax = _get_max_bounds(tifs)
-        polygon_gdf = bounds2polygon(xmin, xmax, ymin, ymax, epsg_code=epsg_code)
+    df = catalog.update_catalog(tifs, catalog_file=catalog_file)
+    if catalog.common_crs(df):
+        xmin, xmax, ymin, ymax = catalog.max_bounds(df)
+        polygon_gdf = bounds2polygon(xmin, ymin, xmax, ymax, crs=df["crs"].iloc[0])
         return polygon_gdf
 
 
+def rasterize_geometry_mask(gdf, ds, cache_dir=None, all_touched=False, verbose=True):
+    """
+    Rasterizes geometries to a boolean mask on the grid of ds. True inside geometries.
+
+    Masks are cached as .npy files in cache_dir, keyed by a hash of the geometries and grid.
+
+    Inputs
+    gdf         : GeoDataFrame : geometries in the crs of ds
+    ds          : xr.Dataset or xr.DataArray with rioxarray extension
+    cache_dir   : str  : directory to cache masks in. Default is None, which disables caching.
+    all_touched : bool : include all pixels touched by geometries
+
+    Returns
+    np.ndarray of shape (y, x)
+    """
+    transform = ds.rio.transform()
+    shape = (ds.rio.height, ds.rio.width)
+
+    key = hashlib.sha1()
+    for geometry in gdf.geometry:
+        key.update(geometry.wkb)
+    key.update(str((tuple(transform), shape, all_touched)).encode())
+    key = key.hexdigest()
+
+    if cache_dir:
+        cache_file = Path(cache_dir, key + ".npy")
+        if cache_file.exists():
+            if verbose:
+                print("Using cached geometry mask", cache_file)
+            return np.load(cache_file)
+
+    mask = rasterio.features.geometry_mask(
+        gdf.geometry,
+        out_shape=shape,
+        transform=transform,
+        all_touched=all_touched,
+        invert=True,
+    )
+
+    if cache_dir:
+        cache_file.parent.mkdir(parents=True, exist_ok=True)
+        np.save(cache_file, mask)
+        if verbose:
+            print("Cached geometry mask", cache_file)
+    return mask
+
+
+def _block_any(mask, y_chunks, x_chunks):
+    """
+    Returns (y_blocks, x_blocks) array, True where a chunk contains any True pixel.
+    """
+    y_edges = np.cumsum((0,) + tuple(y_chunks))[:-1]
+    x_edges = np.cumsum((0,) + tuple(x_chunks))[:-1]
+    rows = np.logical_or.reduceat(mask, y_edges, axis=0)
+    return np.logical_or.reduceat(rows, x_edges, axis=1)
+
+
+def _prune_blocks(data, keep, y_axis, x_axis):
+    """
+    Rebuilds a dask array from its blocks, masking blocks that intersect keep and
+    replacing all other blocks with NaN so that they are never read.
+    """
+    y_edges = np.cumsum((0,) + data.chunks[y_axis])
+    x_edges = np.cumsum((0,) + data.chunks[x_axis])
+    blocks = np.empty(data.numblocks, dtype=object)
+
+    for index in np.ndindex(*data.numblocks):
+        block = data.blocks[index]
+        yi, xi = index[y_axis], index[x_axis]
+        block_keep = keep[y_edges[yi] : y_edges[yi + 1], x_edges[xi] : x_edges[xi + 1]]
+        if block_keep.all():
+            blocks[index] = block
+        elif block_keep.any():
+            shape = [1] * data.ndim
+            shape[y_axis], shape[x_axis] = block_keep.shape
+            blocks[index] = dask.array.where(block_keep.reshape(shape), block, np.nan)
+        else:
+            blocks[index] = dask.array.full(
+                block.shape, np.nan, dtype=np.result_type(data.dtype, float)
+            )
+
+    return dask.array.block(blocks.tolist())
+
+
+def clip_to_geometry(
+    ds, gdf, invert=False, cache_dir=None, all_touched=False, verbose=True
+):
+    """
+    Clips ds to geometries in gdf. Values outside geometries are set to NaN.
+
+    The geometries are rasterized once to a compact mask, which is cached in cache_dir.
+    Unless invert is set, ds is cropped to the extent of the mask.
+    Chunks that do not intersect the geometries are replaced by NaN before any read,
+    so they are dropped from the task graph.
+
+    Inputs
+    ds          : xr.Dataset with rioxarray extension
+    gdf         : GeoDataFrame : geometries in the crs of ds
+    invert      : bool : set values inside geometries to NaN instead
+    cache_dir   : str  : directory to cache masks in
+    all_touched : bool : include all pixels touched by geometries
+
+    Returns
+    xr.Dataset
+    """
+    x_dim, y_dim = ds.rio.x_dim, ds.rio.y_dim
+    keep = rasterize_geometry_mask(
+        gdf, ds, cache_dir=cache_dir, all_touched=all_touched, verbose=verbose
+    )
+    if invert:
+        keep = ~keep
+    else:
+        rows = np.flatnonzero(keep.any(axis=1))
+        cols = np.flatnonzero(keep.any(axis=0))
+        if not len(rows):
+            raise ValueError("Geometries do not intersect the dataset.")
+        ds = ds.isel(
+            {
+                y_dim: slice(rows[0], rows[-1] + 1),
+                x_dim: slice(cols[0], cols[-1] + 1),
+            }
+        )
+        keep = keep[rows[0] : rows[-1] + 1, cols[0] : cols[-1] + 1]
+
+    ds = ds.copy()
+    for name, variable in ds.data_vars.items():
+        if y_dim not in variable.dims or x_dim not in variable.dims:
+            continue
+        y_axis = variable.dims.index(y_dim)
+        x_axis = variable.dims.index(x_dim)
+        if isinstance(variable.data, dask.array.Array):
+            data = _prune_blocks(variable.data, keep, y_axis, x_axis)
+            if verbose:
+                chunks = variable.data.chunks
+                intersecting = _block_any(keep, chunks[y_axis], chunks[x_axis])
+                print(
+                    f"{name}: reading {intersecting.sum()} of {intersecting.size} spatial chunks"
+                )
+        else:
+            shape = [1] * variable.ndim
+            shape[y_axis], shape[x_axis] = keep.shape
+            data = np.where(keep.reshape(shape), variable.data, np.nan)
+        ds[name] = variable.copy(data=data)
+
+    return ds
+
+
 def extract_dataset_center_window(ds, xdim="x", ydim="y", size=256, verbose=True):
     xmode = np.abs(scipy.stats.mode(ds["y"].diff("y"))[0])
     ymode = np.abs(scipy.stats.mode(ds["y"].diff("y"))[0])
@@ -109,79 +381,40 @@ def _get_dataset_centroid(ds):
 
 
 def _get_raster_centroid(filename):
-    src = rasterio.open(filename)
-    xmin, ymin, xmax, ymax = src.bounds
+    with rasterio.open(filename) as src:
+        xmin, ymin, xmax, ymax = src.bounds
     cx = (xmax - xmin) / 2 + xmin
     cy = (ymax - ymin) / 2 + ymin
     return cx, cy
 
 
-def _get_rasters_centroid(tifs):
-    xmin, xmax, ymin, ymax = _get_max_bounds(tifs)
+def _get_rasters_centroid(tifs, catalog_file=None):
+    xmin, xmax, ymin, ymax = _get_max_bounds(tifs, catalog_file=catalog_file)
     cx = (xmax - xmin) / 2 + xmin
     cy = (ymax - ymin) / 2 + ymin
     return cx, cy
 
 
 def _get_bounds(tif):
-    src = rasterio.open(tif)
-    xmin, ymin, xmax, ymax = src.bounds
+    with rasterio.open(tif) as src:
+        xmin, ymin, xmax, ymax = src.bounds
     return xmin, xmax, ymin, ymax
 
 
-def _get_max_bounds(tifs):
+def _get_max_bounds(tifs, catalog_file=None):
     """
     Function to return max bounds for stack ov overlapping geotiffs.
 
     Input:
     tifs : list : file paths
+    catalog_file : str : optional SQLite catalog, see gtsa.catalog
 
     Returns:
     xmin, xmax, ymin, ymax : coordinates
     """
-
-    pool = concurrent.futures.ThreadPoolExecutor(max_workers=10)
-
-    # check all tifs are in same CRS
-    epsg_codes = []
-    futures = {pool.submit(_get_epsg_code, x): x for x in tifs}
-    epsg_codes = [f.result() for f in concurrent.futures.as_completed(futures)]
-    if len(list(set(epsg_codes))) != 1:
-        print("Not all input files have the same CRS")
-        for i in list(zip(epsg_codes, tifs)):
-            print(i)
-
-    # find max bounds
-    else:
-        xmin_vals = []
-        ymin_vals = []
-        xmax_vals = []
-        ymax_vals = []
-
-        ## submitting in parallel isn't faster for some reason...
-        #         futures = {pool.submit(_get_bounds, x): x for x in tifs}
-        #         results = [f.result() for f in concurrent.futures.as_completed(futures)]
-        #         for r in results:
-        #             xmin, xmax, ymin, ymax = r
-        #             xmin_vals.append(xmin)
-        #             ymin_vals.append(ymin)
-        #             xmax_vals.append(xmax)
-        #             ymax_vals.append(ymax)
-
-        for fn in tifs:
-            src = rasterio.open(fn, masked=True)
-            xmin, ymin, xmax, ymax = src.bounds
-            xmin_vals.append(xmin)
-            ymin_vals.append(ymin)
-            xmax_vals.append(xmax)
-            ymax_vals.append(ymax)
-
-        xmin = np.min(xmin_vals)
-        ymin = np.min(ymin_vals)
-        xmax = np.max(xmax_vals)
-        ymax = np.max(ymax_vals)
-
-        return xmin, xmax, ymin, ymax
+    df = catalog.update_catalog(tifs, catalog_file=catalog_file)
+    if catalog.common_crs(df):
+        return catalog.max_bounds(df)
 
 
 def _get_epsg_code(tif):
@@ -195,27 +428,18 @@ def _get_epsg_code(tif):
     str : EPSG code
     """
 
-    src = rasterio.open(tif)
-    epsg_code = str(src.crs.to_epsg())
+    with rasterio.open(tif) as src:
+        epsg_code = str(src.crs.to_epsg())
 
     return epsg_code
 
 
-def _check_common_epsg(tifs):
+def _check_common_epsg(tifs, catalog_file=None):
     """
     Checks all input tif files have the same epsg code
     """
-    epsg_codes = []
-    for i in tifs:
-        epsg_codes.append(_get_epsg_code(i))
-    epsg_codes_set = list(set(epsg_codes))
-    if len(epsg_codes_set):
-        return True
-    else:
-        print("List of input tif files contains multiple epsg codes.")
-        for i in list(zip([j.name for j in tifs], epsg_codes)):
-            print("epsg:" + i[1], i[0])
-        return False
+    df = catalog.update_catalog(tifs, catalog_file=catalog_file)
+    return catalog.common_crs(df)
 
 
 def _lon_lat_to_utm_epsg_code(lon, lat):
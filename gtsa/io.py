@@ -2,18 +2,41 @@ from pathlib import Path
 from datetime import datetime
 from subprocess import Popen, PIPE, STDOUT
 import fsspec
+import asyncio
+import atexit
+import hashlib
+import io
+import os
 import re
 import shutil
+import threading
+import json
+import base64
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+import pyproj
 import rioxarray
 import xarray as xr
 import dask
+import dask.array
+import rasterio
 from rasterio.enums import Resampling
+import rasterio.shutil
+from rasterio.vrt import WarpedVRT
+from rasterio.windows import Window
+from affine import Affine
 import zarr
+import numcodecs
+import numcodecs.abc
+import numcodecs.compat
 from dask.distributed import Client, LocalCluster
 import logging
 import webbrowser
 from contextlib import contextmanager, redirect_stderr, redirect_stdout
 
+from gtsa import accumulators, utils
+
 """
 Basic io functions.
 """
@@ -77,6 +100,7 @@ def run_command(command, verbose=True):
     run_command(call)
 
     Use a space seperated string if your command contains nested strings.
+    Returns the exit code.
     """
 
     if isinstance(command, type(str())):
@@ -88,16 +112,19 @@ def run_command(command, verbose=True):
             print(*command)
         shell = False
 
-    p = Popen(command, stdout=PIPE, stderr=STDOUT, shell=shell)
-
-    while p.poll() is None:
-        if verbose:
-            try:
-                line = (p.stdout.readline()).decode("ASCII").rstrip("\n")
-            except:
-                line = p.stdout.read()
-                pass
-            print(line)
+    # block on the pipe instead of polling, output is streamed line by line
+    with Popen(
+        command,
+        stdout=PIPE,
+        stderr=STDOUT,
+        shell=shell,
+        text=True,
+        errors="replace",
+    ) as p:
+        for line in p.stdout:
+            if verbose:
+                print(line.rstrip("\n"))
+    return p.returncode
 
 
 def parse_timestamps(
@@ -114,6 +141,42 @@ def parse_timestamps(
     return results
 
 
+def parse_datetimes(
+    file_list,
+    date_string_format="%Y%m%d",
+    date_string_pattern="_........_",
+    date_string_pattern_offset=1,
+):
+    """
+    Parses datetimes from file paths, as parse_timestamps does.
+    Inputs
+    ----------
+    file_list                  : list of file paths or URLs
+    date_string_format         : format of the date string, e.g. '%Y%m%d'
+    date_string_pattern        : wildcard date string pattern, periods are wildcards
+    date_string_pattern_offset : length of prefix and suffix around the wildcard sequence
+    Returns
+    -------
+    list of pd.Timestamp, None where the pattern is not found or does not parse
+    """
+    tmp = re.compile(date_string_pattern)
+    offset = date_string_pattern_offset
+    results = []
+    for x in file_list:
+        match = tmp.search(str(x))
+        if not match:
+            results.append(None)
+            continue
+        date_string = match.group(0)
+        if offset:
+            date_string = date_string[offset:-offset]
+        try:
+            results.append(pd.to_datetime(date_string, format=date_string_format))
+        except ValueError:
+            results.append(None)
+    return results
+
+
 def dask_start_cluster(
     workers,
     threads=1,
@@ -178,14 +241,21 @@ def xr_read_geotif(geotif_file_path, chunks="auto", masked=True):
     Reads in single or multi-band GeoTIFF as dask array.
     Inputs
     ----------
-    GeoTIFF_file_path : GeoTIFF file path
+    GeoTIFF_file_path : GeoTIFF file path or fsspec URL, read through REMOTE_CACHE
+    masked            : bool : set nodata to NaN. Set False to keep the native dtype,
+                        with nodata kept as the _FillValue attribute.
     Returns
     -------
     ds : xarray.Dataset
         Includes rioxarray extension to xarray.Dataset
     """
 
-    da = rioxarray.open_rasterio(geotif_file_path, chunks=chunks, masked=True)
+    da = rioxarray.open_rasterio(
+        geotif_file_path,
+        chunks=chunks,
+        masked=masked,
+        **_open_kwargs(geotif_file_path),
+    )
 
     # Extract bands and assign as variables in xr.Dataset()
     ds = xr.Dataset()
@@ -212,6 +282,17 @@ def xr_read_geotif(geotif_file_path, chunks="auto", masked=True):
     return ds
 
 
+def _native_resampling(ds, resampling, masked):
+    """
+    Uses nearest neighbor for 8-bit data kept in their native dtype.
+    """
+    if masked:
+        return resampling
+    if any(ds[i].dtype.itemsize == 1 for i in ds.data_vars):
+        return Resampling.nearest
+    return resampling
+
+
 def xr_stack_geotifs(
     geotif_files_list,
     datetimes_list,
@@ -221,6 +302,8 @@ def xr_stack_geotifs(
     nc_out_dir=None,
     overwrite=True,
     cleanup=False,
+    bounds=None,
+    masked=True,
     verbose=True,
 ):
     """
@@ -231,14 +314,22 @@ def xr_stack_geotifs(
     return an out-of-memory dask array.
     Inputs
     ----------
-    geotif_files_list     : list of GeoTIFF file paths
+    geotif_files_list     : list of GeoTIFF file paths or fsspec URLs. Intermediate files
+                            of remote GeoTIFFs are written to nc_out_dir, or the
+                            working directory.
     datetimes_list        : list of datetime objects for each GeoTIFF
     reference_geotif_file : GeoTIFF file path
+    bounds                : optional (xmin, ymin, xmax, ymax) in the reference crs.
+                            The reference grid and each GeoTIFF are cropped to it
+                            before reprojection.
+    masked                : bool : set nodata to NaN. Set False to keep native dtypes
+                            with nodata as fill value. 8-bit data are then resampled
+                            with nearest neighbor.
     Returns
     -------
     ds : xr.Dataset()
     """
-    ## TODO: Parameterize crs, res, bounds, transform
+    ## TODO: Parameterize crs, res
     ## TODO: rewrite with dask delayed https://tutorial.dask.org/03_dask.delayed.html
 
     if save_to_nc and nc_out_dir:
@@ -267,37 +358,62 @@ def xr_stack_geotifs(
         resampling = Resampling.bilinear
 
     ## Get target object with desired crs, res, bounds, transform
-    ref = xr_read_geotif(reference_geotif_file)
+    ref = xr_read_geotif(reference_geotif_file, masked=masked)
+    if bounds is not None:
+        ref = ref.rio.clip_box(*bounds)
+        # pad source windows so resampling kernels are complete at the edges
+        pad = 4 * max(abs(i) for i in ref.rio.resolution())
+        xmin, ymin, xmax, ymax = ref.rio.bounds()
+        padded_bounds = (xmin - pad, ymin - pad, xmax + pad, ymax + pad)
 
     ## Stack geotifs and dimension in time
     datasets = []
     nc_files = []
     out_dirs = []
 
+    # netCDF3 cannot store unsigned integers, so native dtypes are written to Zarr
+    suffix = ".nc" if masked else ".zarr"
+    engine = None if masked else "zarr"
+
     c = 0
     for index, file_name in enumerate(geotif_files_list):
-        if not nc_out_dir:
-            out_fn = str(Path(file_name).with_suffix("")) + ".nc"
+        if not nc_out_dir and is_remote(file_name):
+            out_fn = Path(file_name).with_suffix("").name + suffix
+        elif not nc_out_dir:
+            out_fn = str(Path(file_name).with_suffix("")) + suffix
         else:
-            out_fn = str(Path(nc_out_dir, Path(file_name).with_suffix("").name + ".nc"))
+            out_fn = str(
+                Path(nc_out_dir, Path(file_name).with_suffix("").name + suffix)
+            )
 
         if Path(out_fn).exists() and not overwrite:
             nc_files.append(out_fn)
             out_dir = str(Path(out_fn).parents[0])
             out_dirs.append(out_dir)
-            src = xr.open_dataset(out_fn, chunks="auto")
+            src = xr.open_dataset(
+                out_fn, chunks="auto", mask_and_scale=masked, engine=engine
+            )
             datasets.append(src)
 
         else:
+            if Path(out_fn).is_dir():
+                shutil.rmtree(out_fn)
             Path(out_fn).unlink(missing_ok=True)
-            src = xr_read_geotif(file_name)
+            src = xr_read_geotif(file_name, masked=masked)
+            if bounds is not None:
+                src = src.rio.clip_box(*padded_bounds, crs=ref.rio.crs)
             #             if not check_xr_rio_ds_match(src, ref):
-            src = src.rio.reproject_match(ref, resampling=resampling)
+            src = src.rio.reproject_match(
+                ref, resampling=_native_resampling(src, resampling, masked)
+            )
             c += 1
             src = src.assign_coords({"time": datetimes_list[index]})
             src = src.expand_dims("time")
             if save_to_nc:
-                src.to_netcdf(out_fn)
+                if masked:
+                    src.to_netcdf(out_fn)
+                else:
+                    src.to_zarr(out_fn)
                 nc_files.append(out_fn)
                 out_dir = str(Path(out_fn).parents[0])
                 out_dirs.append(out_dir)
@@ -318,17 +434,711 @@ def xr_stack_geotifs(
     if save_to_nc:
         if verbose:
             print("Reading files from", ",".join([str(i) for i in list(set(out_dirs))]))
-        ds = xr.open_mfdataset(nc_files, chunks="auto")
+        ds = xr.open_mfdataset(
+            nc_files, chunks="auto", mask_and_scale=masked, engine=engine
+        )
         ds = ds.sortby("time")
         ds.rio.write_crs(ref.rio.crs, inplace=True)
+        ds.attrs["reference_geotif_file"] = str(reference_geotif_file)
         return ds.chunk("auto", balance=True)
 
     ds = xr.concat(datasets, dim="time", combine_attrs="no_conflicts")
     ds = ds.sortby("time")
     ds.rio.write_crs(ref.rio.crs, inplace=True)
+    ds.attrs["reference_geotif_file"] = str(reference_geotif_file)
     return ds.chunk("auto", balance=True)
 
 
+def list_geotifs_with_timestamps(
+    datadir,
+    date_string_format="%Y%m%d",
+    date_string_pattern="_........_",
+    date_string_pattern_offset=1,
+):
+    """
+    Lists GeoTIFFs in datadir with timestamps parsed from their file names.
+    Inputs
+    ----------
+    datadir                    : directory or fsspec URL prefix containing GeoTIFFs
+    date_string_format         : format of the date string, e.g. '%Y%m%d'
+    date_string_pattern        : wildcard date string pattern, periods are wildcards
+    date_string_pattern_offset : length of prefix and suffix around the wildcard sequence
+    Returns
+    -------
+    files, datetimes : chronologically sorted lists
+    """
+    if is_remote(datadir):
+        fs, path = REMOTE_CACHE.filesystem(datadir)
+        files = [fs.unstrip_protocol(x) for x in sorted(fs.glob(path + "/*.tif"))]
+    else:
+        files = [x.as_posix() for x in sorted(Path(datadir).glob("*.tif"))]
+
+    datetimes = parse_datetimes(
+        files, date_string_format, date_string_pattern, date_string_pattern_offset
+    )
+    for x, t in zip(files, datetimes):
+        if t is None:
+            print("pattern not found in", x)
+
+    # ensure chronological sorting
+    datetimes, files = list(
+        zip(*sorted((t, x) for t, x in zip(datetimes, files) if t is not None))
+    )
+    return list(files), list(datetimes)
+
+
+class _BlockCache:
+    """
+    Thread-safe least recently used cache for arrays read from source rasters.
+    """
+
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self._blocks = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._blocks:
+                return None
+            self._blocks.move_to_end(key)
+            return self._blocks[key]
+
+    def put(self, key, block):
+        with self._lock:
+            self._blocks[key] = block
+            self._blocks.move_to_end(key)
+            while len(self._blocks) > self.maxsize:
+                self._blocks.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._blocks.clear()
+
+
+VIRTUAL_BLOCK_CACHE = _BlockCache()
+
+
+def is_remote(path):
+    """
+    True for fsspec URLs such as s3://, gs:// or http(s)://.
+    """
+    return "://" in str(path) and not str(path).startswith("file://")
+
+
+class RemoteCache:
+    """
+    Memory and disk cache for byte blocks of remote files read with fsspec.
+
+    Missing blocks of a read are fetched concurrently with fsspec cat_ranges. Blocks
+    are kept in a least recently used memory cache and written to cache_dir, which
+    is pruned to disk_size. Remote files are assumed not to change. Delete cache_dir
+    otherwise.
+
+    Inputs
+    cache_dir       : str  : directory for the disk cache. Default is memory only.
+    memory_size     : int  : memory cache size in MB
+    disk_size       : int  : disk cache size in MB
+    block_size      : int  : bytes per block
+    storage_options : dict : passed to fsspec, e.g. {'anon': True}
+    """
+
+    def __init__(
+        self,
+        cache_dir=None,
+        memory_size=512,
+        disk_size=10240,
+        block_size=2**21,
+        storage_options=None,
+    ):
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        self.memory_size = memory_size * 2**20
+        self.disk_size = disk_size * 2**20
+        self.block_size = block_size
+        self.storage_options = storage_options or {}
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._disk_bytes = None
+        self._sizes = {}
+        self._lock = threading.Lock()
+
+    def _file(self, url, key):
+        name = hashlib.sha1(str(url).encode()).hexdigest()[:20]
+        return Path(self.cache_dir, name[:2], name, str(key))
+
+    def get(self, url, key):
+        with self._lock:
+            if (url, key) in self._memory:
+                self._memory.move_to_end((url, key))
+                return self._memory[(url, key)]
+        if self.cache_dir:
+            file_name = self._file(url, key)
+            try:
+                data = file_name.read_bytes()
+            except FileNotFoundError:
+                return None
+            os.utime(file_name)  # mark as recently used
+            self._put_memory(url, key, data)
+            return data
+        return None
+
+    def _put_memory(self, url, key, data):
+        with self._lock:
+            if (url, key) not in self._memory:
+                self._memory_bytes += len(data)
+            self._memory[(url, key)] = data
+            self._memory.move_to_end((url, key))
+            while self._memory_bytes > self.memory_size and len(self._memory) > 1:
+                _, evicted = self._memory.popitem(last=False)
+                self._memory_bytes -= len(evicted)
+
+    def put(self, url, key, data):
+        self._put_memory(url, key, data)
+        if not self.cache_dir:
+            return
+        file_name = self._file(url, key)
+        file_name.parent.mkdir(parents=True, exist_ok=True)
+        tmp_file = file_name.with_name(f"{file_name.name}.{threading.get_ident()}.tmp")
+        tmp_file.write_bytes(data)
+        os.replace(tmp_file, file_name)
+        with self._lock:
+            if self._disk_bytes is None:
+                self._disk_bytes = sum(
+                    i.stat().st_size for i in self.cache_dir.rglob("*") if i.is_file()
+                )
+            else:
+                self._disk_bytes += len(data)
+            if self._disk_bytes > self.disk_size:
+                self._prune()
+
+    def _prune(self):
+        """
+        Removes least recently used files until the disk cache is at 90% of disk_size.
+        """
+        files = [i for i in self.cache_dir.rglob("*") if i.is_file()]
+        stats = sorted(((i.stat(), i) for i in files), key=lambda i: i[0].st_mtime)
+        total = sum(stat.st_size for stat, _ in stats)
+        for stat, file_name in stats:
+            if total <= 0.9 * self.disk_size:
+                break
+            file_name.unlink(missing_ok=True)
+            total -= stat.st_size
+        self._disk_bytes = total
+
+    def filesystem(self, url):
+        return fsspec.core.url_to_fs(url, **self.storage_options)
+
+    def size(self, url):
+        """
+        Returns the size of url. Raises FileNotFoundError for missing files, which are
+        remembered, since GDAL probes for sidecar files on every open.
+        """
+        if url not in self._sizes:
+            cached = self.get(url, "size")
+            if cached is None:
+                fs, path = self.filesystem(url)
+                try:
+                    cached = str(fs.size(path)).encode()
+                except FileNotFoundError:
+                    self._sizes[url] = None
+                    raise
+                self.put(url, "size", cached)
+            self._sizes[url] = int(cached)
+        if self._sizes[url] is None:
+            raise FileNotFoundError(url)
+        return self._sizes[url]
+
+    def read(self, url, start, stop):
+        """
+        Returns bytes start to stop - 1 of url.
+        """
+        stop = min(stop, self.size(url))
+        if stop <= start:
+            return b""
+        indices = range(start // self.block_size, (stop - 1) // self.block_size + 1)
+        blocks = {i: self.get(url, i) for i in indices}
+        missing = [i for i, block in blocks.items() if block is None]
+        if missing:
+            fs, path = self.filesystem(url)
+            size = self.size(url)
+            starts = [i * self.block_size for i in missing]
+            stops = [min(i + self.block_size, size) for i in starts]
+            for i, data in zip(
+                missing, fs.cat_ranges([path] * len(missing), starts, stops)
+            ):
+                self.put(url, i, data)
+                blocks[i] = data
+        data = b"".join(blocks[i] for i in indices)
+        offset = indices[0] * self.block_size
+        return data[start - offset : stop - offset]
+
+    def open(self, url, mode="rb"):
+        self.size(url)
+        return _RemoteFile(self, url)
+
+
+class _RemoteFile(io.RawIOBase):
+    """
+    Read-only, seekable file object over a RemoteCache, e.g. for rasterio openers.
+    """
+
+    def __init__(self, cache, url):
+        self.cache = cache
+        self.url = url
+        self.position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            self.position = offset
+        elif whence == io.SEEK_CUR:
+            self.position += offset
+        else:
+            self.position = self.cache.size(self.url) + offset
+        return self.position
+
+    def readinto(self, buffer):
+        data = self.cache.read(self.url, self.position, self.position + len(buffer))
+        buffer[: len(data)] = data
+        self.position += len(data)
+        return len(data)
+
+
+REMOTE_CACHE = RemoteCache()
+
+# close datasets read through _remote_opener before the interpreter tears down
+atexit.register(xr.backends.file_manager.FILE_CACHE.clear)
+
+
+def configure_remote_cache(
+    cache_dir=None, memory_size=512, disk_size=10240, storage_options=None
+):
+    """
+    Replaces the cache used for remote GeoTIFFs and Zarr stacks. Sizes are in MB.
+    """
+    global REMOTE_CACHE
+    REMOTE_CACHE = RemoteCache(
+        cache_dir=cache_dir,
+        memory_size=memory_size,
+        disk_size=disk_size,
+        storage_options=storage_options,
+    )
+    return REMOTE_CACHE
+
+
+def _remote_opener(url, mode="rb"):
+    """
+    Module level, so that datasets opened with it can be pickled by dask.
+    """
+    return REMOTE_CACHE.open(url, mode)
+
+
+def _open_kwargs(file_name):
+    return {"opener": _remote_opener} if is_remote(file_name) else {}
+
+
+ZARR_METADATA_KEYS = ("zarr.json", ".zarray", ".zattrs", ".zgroup", ".zmetadata")
+
+
+class _CachedFsspecStore(zarr.storage.FsspecStore):
+    """
+    Read-only FsspecStore that keeps chunk objects in REMOTE_CACHE.
+    Metadata are always read from the remote store.
+    """
+
+    async def get(self, key, prototype, byte_range=None):
+        if byte_range is not None or key.endswith(ZARR_METADATA_KEYS):
+            return await super().get(key, prototype, byte_range)
+        url = f"{self.fs.protocol}:{self.path}/{key}"
+        data = await asyncio.to_thread(REMOTE_CACHE.get, url, "object")
+        if data is None:
+            value = await super().get(key, prototype)
+            if value is None:
+                return None
+            data = value.to_bytes()
+            await asyncio.to_thread(REMOTE_CACHE.put, url, "object", data)
+        return prototype.buffer.from_bytes(data)
+
+
+def _zarr_store(zarr_file):
+    """
+    Returns a cached, read-only store for remote Zarr URLs, e.g. s3://bucket/stack.zarr.
+    """
+    if not is_remote(zarr_file):
+        return zarr_file
+    return _CachedFsspecStore.from_url(
+        zarr_file, storage_options=REMOTE_CACHE.storage_options, read_only=True
+    )
+
+
+def _read_virtual_block(file_name, grid, window, resampling):
+    """
+    Reads one window of the reference grid from a source raster through a WarpedVRT.
+    """
+    mtime = None if is_remote(file_name) else Path(file_name).stat().st_mtime
+    key = (file_name, mtime, grid, window, resampling)
+    block = VIRTUAL_BLOCK_CACHE.get(key)
+    if block is None:
+        crs, transform, width, height = grid
+        row_off, col_off, rows, cols = window
+        with rasterio.open(file_name, **_open_kwargs(file_name)) as src:
+            with WarpedVRT(
+                src,
+                crs=crs,
+                transform=Affine(*transform),
+                width=width,
+                height=height,
+                resampling=Resampling[resampling],
+            ) as vrt:
+                data = vrt.read(
+                    1, window=Window(col_off, row_off, cols, rows), masked=True
+                )
+        block = data.astype(float).filled(np.nan)
+        VIRTUAL_BLOCK_CACHE.put(key, block)
+    return block.copy()[np.newaxis]
+
+
+def open_virtual_stack(
+    geotif_files_list,
+    datetimes_list,
+    reference_geotif_file,
+    resampling="bilinear",
+    chunks=512,
+    cache_size=256,
+    variable_name="band1",
+):
+    """
+    Opens GeoTIFFs as a lazy (time, y, x) stack on the grid of reference_geotif_file
+    without writing intermediate files.
+
+    Each chunk is a single task that reads one window of one file through a WarpedVRT.
+    Blocks are kept in an LRU cache so repeated computations do not reread sources.
+    Inputs
+    ----------
+    geotif_files_list     : list of GeoTIFF file paths
+    datetimes_list        : list of datetime objects for each GeoTIFF
+    reference_geotif_file : GeoTIFF file path defining crs, transform and shape
+    resampling            : resampling method name, e.g. 'bilinear'
+    chunks                : int or (y, x) : spatial chunk shape
+    cache_size            : int : maximum number of blocks held in the cache
+    variable_name         : str : name of the data variable
+    Returns
+    -------
+    ds : xr.Dataset()
+    """
+    if len(datetimes_list) != len(geotif_files_list):
+        print("length of datetimes does not match length of GeoTIFF list")
+        print("datetimes:", len(datetimes_list))
+        print("geotifs:", len(geotif_files_list))
+        return None
+
+    with rasterio.open(
+        reference_geotif_file, **_open_kwargs(reference_geotif_file)
+    ) as ref:
+        crs = ref.crs
+        transform = ref.transform
+        width, height = ref.width, ref.height
+    grid = (crs.to_wkt(), tuple(transform)[:6], width, height)
+
+    VIRTUAL_BLOCK_CACHE.maxsize = cache_size
+    if isinstance(chunks, int):
+        chunks = (chunks, chunks)
+    y_chunks = dask.array.core.normalize_chunks(chunks[0], (height,))[0]
+    x_chunks = dask.array.core.normalize_chunks(chunks[1], (width,))[0]
+    y_offsets = np.cumsum((0,) + y_chunks)
+    x_offsets = np.cumsum((0,) + x_chunks)
+
+    order = np.argsort(np.array(datetimes_list, dtype="datetime64[ns]"), kind="stable")
+    read = dask.delayed(_read_virtual_block, pure=True)
+    layers = []
+    for index in order:
+        rows = []
+        for i, y_size in enumerate(y_chunks):
+            row = []
+            for j, x_size in enumerate(x_chunks):
+                window = (int(y_offsets[i]), int(x_offsets[j]), y_size, x_size)
+                block = read(str(geotif_files_list[index]), grid, window, resampling)
+                row.append(
+                    dask.array.from_delayed(block, (1, y_size, x_size), dtype=float)
+                )
+            rows.append(row)
+        layers.append(rows)
+    data = dask.array.block(layers)
+
+    xs, _ = transform * (np.arange(width) + 0.5, np.full(width, 0.5))
+    _, ys = transform * (np.full(height, 0.5), np.arange(height) + 0.5)
+    times = np.array(datetimes_list, dtype="datetime64[ns]")[order]
+
+    ds = xr.Dataset(
+        {variable_name: (("time", "y", "x"), data)},
+        coords={"time": times, "y": ys, "x": xs},
+    )
+    ds.rio.write_crs(crs, inplace=True)
+    ds.rio.write_transform(transform, inplace=True)
+    ds.attrs["crs"] = crs.to_wkt()
+    ds.attrs["reference_geotif_file"] = str(reference_geotif_file)
+    return ds
+
+
+class TiffPredictor(numcodecs.abc.Codec):
+    """
+    Decodes TIFF horizontal (2) and floating point (3) predictors per tile row.
+    Used as a Zarr filter when TIFF tiles are read through a reference index.
+    """
+
+    codec_id = "gtsa_tiff_predictor"
+
+    def __init__(self, predictor, dtype, shape):
+        self.predictor = int(predictor)
+        self.dtype = str(np.dtype(dtype))
+        self.shape = tuple(shape)
+
+    def encode(self, buf):
+        raise NotImplementedError("TiffPredictor only supports decoding.")
+
+    def decode(self, buf, out=None):
+        dtype = np.dtype(self.dtype)
+        rows, cols = self.shape
+        if self.predictor == 2:
+            data = np.frombuffer(buf, dtype=dtype).reshape(rows, cols)
+            data = np.cumsum(data, axis=1, dtype=dtype)
+        else:
+            # bytes are delta coded per row and grouped by significance, most first
+            data = np.frombuffer(buf, dtype=np.uint8).reshape(rows, -1)
+            data = np.cumsum(data, axis=1, dtype=np.uint8)
+            data = data.reshape(rows, dtype.itemsize, cols).transpose(0, 2, 1)
+            data = np.ascontiguousarray(data[..., ::-1]).view(dtype.newbyteorder("<"))
+            data = data.reshape(rows, cols).astype(dtype)
+        return numcodecs.compat.ndarray_copy(data, out)
+
+    def get_config(self):
+        return {
+            "id": self.codec_id,
+            "predictor": self.predictor,
+            "dtype": self.dtype,
+            "shape": list(self.shape),
+        }
+
+
+numcodecs.register_codec(TiffPredictor)
+
+TIFF_COMPRESSORS = {
+    "NONE": None,
+    "DEFLATE": {"id": "zlib", "level": 1},
+    "ZSTD": {"id": "zstd", "level": 1},
+}
+
+
+def _inline_array(name, values, attrs):
+    """
+    Returns reference entries for a small array stored inline in the index.
+    """
+    values = np.ascontiguousarray(values)
+    zarray = {
+        "chunks": [len(values)],
+        "compressor": None,
+        "dtype": values.dtype.str,
+        "fill_value": None,
+        "filters": None,
+        "order": "C",
+        "shape": [len(values)],
+        "zarr_format": 2,
+    }
+    return {
+        f"{name}/.zarray": json.dumps(zarray),
+        f"{name}/.zattrs": json.dumps({"_ARRAY_DIMENSIONS": [name], **attrs}),
+        f"{name}/0": "base64:" + base64.b64encode(values.tobytes()).decode(),
+    }
+
+
+def _tiff_tile_references(file_name, n_tiles_y, n_tiles_x):
+    """
+    Reads byte offsets and sizes of all internal tiles of band 1.
+    """
+    references = {}
+    with rasterio.open(file_name) as src:
+        for i in range(n_tiles_y):
+            for j in range(n_tiles_x):
+                offset = src.get_tag_item(f"BLOCK_OFFSET_{j}_{i}", "TIFF", bidx=1)
+                size = src.get_tag_item(f"BLOCK_SIZE_{j}_{i}", "TIFF", bidx=1)
+                # sparse tiles have no data and read as the fill value
+                if offset and size and int(size) > 0:
+                    references[(i, j)] = (int(offset), int(size))
+    return references
+
+
+def create_reference_index(
+    geotif_files_list,
+    datetimes_list,
+    reference_geotif_file,
+    output_file="stack.json",
+    variable_name="band1",
+    verbose=True,
+):
+    """
+    Writes a Kerchunk-style reference index that maps every internal tile of tiled
+    GeoTIFFs, e.g. COGs, to a chunk of a virtual (time, y, x) Zarr array.
+
+    The stack can then be opened with open_reference_stack without copying data.
+    All GeoTIFFs must be on the grid of reference_geotif_file and share tiling,
+    data type and compression. Files can be local paths or URLs.
+    Inputs
+    ----------
+    geotif_files_list     : list of GeoTIFF file paths or URLs
+    datetimes_list        : list of datetime objects for each GeoTIFF
+    reference_geotif_file : GeoTIFF file path defining crs, transform and shape
+    output_file           : path to JSON index
+    variable_name         : str : name of the data variable
+    Returns
+    -------
+    output_file
+    """
+    if len(datetimes_list) != len(geotif_files_list):
+        raise ValueError("length of datetimes does not match length of GeoTIFF list")
+
+    with rasterio.open(reference_geotif_file) as ref:
+        grid = (ref.crs, ref.transform, ref.width, ref.height)
+        crs = ref.crs
+
+    order = np.argsort(np.array(datetimes_list, dtype="datetime64[ns]"), kind="stable")
+    files = [str(geotif_files_list[i]) for i in order]
+    files = [f if "://" in f else Path(f).resolve().as_posix() for f in files]
+    times = np.array(datetimes_list, dtype="datetime64[ns]")[order]
+
+    layout = None
+    for file_name in files:
+        with rasterio.open(file_name) as src:
+            if (src.crs, src.transform, src.width, src.height) != grid:
+                raise ValueError(
+                    f"{file_name} is not on the grid of {reference_geotif_file}. "
+                    "Use open_virtual_stack or create_stack instead."
+                )
+            if not src.profile.get("tiled"):
+                raise ValueError(f"{file_name} is not tiled. Convert it to a COG.")
+            structure = src.tags(ns="IMAGE_STRUCTURE")
+            file_layout = (
+                src.block_shapes[0],
+                src.dtypes[0],
+                src.nodata,
+                structure.get("COMPRESSION", "NONE"),
+                structure.get("PREDICTOR", "1"),
+            )
+        with fsspec.open(file_name, "rb") as f:
+            file_layout += ("<" if f.read(2) == b"II" else ">",)
+        if layout is None:
+            layout = file_layout
+        elif file_layout != layout:
+            raise ValueError(
+                f"{file_name} differs in tiling, data type, nodata or compression."
+            )
+
+    (tile_y, tile_x), dtype, nodata, compression, predictor, byteorder = layout
+    if compression not in TIFF_COMPRESSORS:
+        raise ValueError(
+            f"{compression} compression is not supported. "
+            f"Valid options are {list(TIFF_COMPRESSORS)}."
+        )
+    dtype = np.dtype(dtype).newbyteorder(byteorder)
+    filters = None
+    if predictor != "1":
+        filters = [TiffPredictor(predictor, dtype, (tile_y, tile_x)).get_config()]
+
+    _, _, width, height = grid
+    n_tiles_y, n_tiles_x = -(-height // tile_y), -(-width // tile_x)
+
+    if nodata is None:
+        fill_value = None
+    elif np.isnan(nodata):
+        fill_value = "NaN"
+    else:
+        fill_value = nodata
+
+    zarray = {
+        "chunks": [1, tile_y, tile_x],
+        "compressor": TIFF_COMPRESSORS[compression],
+        "dtype": dtype.str,
+        "fill_value": fill_value,
+        "filters": filters,
+        "order": "C",
+        "shape": [len(files), height, width],
+        "zarr_format": 2,
+    }
+    refs = {
+        ".zgroup": json.dumps({"zarr_format": 2}),
+        ".zattrs": json.dumps(
+            {
+                "crs": crs.to_wkt(),
+                "reference_geotif_file": str(reference_geotif_file),
+            }
+        ),
+        f"{variable_name}/.zarray": json.dumps(zarray),
+        f"{variable_name}/.zattrs": json.dumps(
+            {"_ARRAY_DIMENSIONS": ["time", "y", "x"]}
+        ),
+    }
+
+    transform = grid[1]
+    xs, _ = transform * (np.arange(width) + 0.5, np.full(width, 0.5))
+    _, ys = transform * (np.full(height, 0.5), np.arange(height) + 0.5)
+    refs.update(
+        _inline_array(
+            "time",
+            times.astype(np.int64),
+            {
+                "units": "nanoseconds since 1970-01-01",
+                "calendar": "proleptic_gregorian",
+            },
+        )
+    )
+    refs.update(_inline_array("y", np.asarray(ys, dtype=float), {}))
+    refs.update(_inline_array("x", np.asarray(xs, dtype=float), {}))
+
+    for t, file_name in enumerate(files):
+        tiles = _tiff_tile_references(file_name, n_tiles_y, n_tiles_x)
+        for (i, j), (offset, size) in tiles.items():
+            refs[f"{variable_name}/{t}.{i}.{j}"] = [file_name, offset, size]
+        if verbose:
+            print(f"Indexed {len(tiles)} tiles in {file_name}")
+
+    Path(output_file).parent.mkdir(parents=True, exist_ok=True)
+    with open(output_file, "w") as f:
+        json.dump({"version": 1, "refs": refs}, f)
+    if verbose:
+        print("Reference index at", output_file)
+    return output_file
+
+
+def open_reference_stack(reference_index_file, chunks={}):
+    """
+    Opens a reference index written by create_reference_index as an xr.Dataset.
+    Chunks are read directly from the tiles of the source GeoTIFFs.
+    """
+    # zarr reads through async filesystems, e.g. for tiles referenced by URL
+    fs = fsspec.filesystem(
+        "reference",
+        fo=str(reference_index_file),
+        asynchronous=True,
+        remote_options={"asynchronous": True},
+    )
+    ds = xr.open_dataset(
+        zarr.storage.FsspecStore(fs, read_only=True),
+        engine="zarr",
+        chunks=chunks,
+        consolidated=False,
+        zarr_format=2,
+    )
+    ds = ds.rio.write_crs(ds.attrs["crs"])
+    return ds
+
+
 def check_xr_rio_ds_match(ds1, ds2):
     """
     Checks if spatial attributes, crs, bounds, and transform match.
@@ -361,9 +1171,25 @@ def create_zarr_stack(
     overwrite=False,
     verbose=True,
     cleanup=False,
+    time_contiguous=True,
+    pyramid_levels=0,
 ):
+    """
+    Writes xarray_dataset to a Zarr stack.
+
+    By default the stack is rechunked so that each chunk holds complete time series.
+    Set time_contiguous to False to keep the spatially chunked first write and skip the
+    rechunking pass. The resulting store can be reduced with gtsa.accumulators.
+    Integer data are kept in their native dtype.
+
+    Set pyramid_levels to also write 2x, 4x, ... coarsened copies into the groups
+    pyramid/2, pyramid/4, ... of the store, in the same pass as the full resolution.
+    Open them with open_stack_level.
+    """
     ds = xarray_dataset
     crs = ds.rio.crs
+    # keep integer data in their native dtype with nodata as fill value
+    mask_and_scale = not np.issubdtype(ds[variable_name].dtype, np.integer)
     print(crs)
 
     output_directory = Path(output_directory)
@@ -381,7 +1207,9 @@ def create_zarr_stack(
                 print("Removing temporary zarr stack")
             shutil.rmtree(zarr_stack_tmp, ignore_errors=True)
 
-        ds = xr.open_dataset(zarr_stack_fn, chunks="auto", engine="zarr")
+        ds = xr.open_dataset(
+            zarr_stack_fn, chunks="auto", engine="zarr", mask_and_scale=mask_and_scale
+        )
         if verbose:
             print("Zarr file already exists")
             print("Zarr file info")
@@ -392,10 +1220,18 @@ def create_zarr_stack(
             del source_group
             del source_array
 
-        tc, yc, xc = determine_optimal_chuck_size(ds, verbose=verbose)
-        ds = xr.open_dataset(
-            zarr_stack_fn, chunks={"time": tc, "y": yc, "x": xc}, engine="zarr"
-        )
+        if time_contiguous:
+            tc, yc, xc = determine_optimal_chuck_size(ds, verbose=verbose)
+            ds = xr.open_dataset(
+                zarr_stack_fn,
+                chunks={"time": tc, "y": yc, "x": xc},
+                engine="zarr",
+                mask_and_scale=mask_and_scale,
+            )
+        else:
+            ds = xr.open_dataset(
+                zarr_stack_fn, chunks={}, engine="zarr", mask_and_scale=mask_and_scale
+            )
 
     else:
         if zarr_stack_tmp.exists():
@@ -420,6 +1256,28 @@ def create_zarr_stack(
         arr = ds[variable_name].data
         t, y, x = arr.chunks[0][0], arr.chunks[1][0], arr.chunks[2][0]
         ds[variable_name].encoding = {"chunks": (t, y, x)}
+
+        if not time_contiguous:
+            ds.attrs["crs"] = crs.to_wkt()
+            writes = [ds.to_zarr(zarr_stack_fn, compute=False)]
+            writes += write_pyramid(ds, zarr_stack_fn, pyramid_levels, compute=False)
+            dask.compute(*writes)
+            if verbose:
+                print("Skipping rechunking along time")
+                source_group = zarr.open(zarr_stack_fn)
+                source_array = source_group[variable_name]
+                print(source_group.tree())
+                print(source_array.info)
+                del source_group
+                del source_array
+                print("Zarr file at", zarr_stack_fn)
+            ds = xr.open_dataset(
+                zarr_stack_fn, chunks={}, engine="zarr", mask_and_scale=mask_and_scale
+            )
+            ds.rio.write_crs(crs, inplace=True)
+            ds.attrs["crs"] = crs.to_wkt()
+            return ds
+
         ds.to_zarr(zarr_stack_tmp)
 
         if verbose:
@@ -437,12 +1295,17 @@ def create_zarr_stack(
         )
         t, y, x = arr.chunks[0][0], arr.chunks[1][0], arr.chunks[2][0]
         ds = xr.open_dataset(
-            zarr_stack_tmp, chunks={"time": t, "y": y, "x": x}, engine="zarr"
+            zarr_stack_tmp,
+            chunks={"time": t, "y": y, "x": x},
+            engine="zarr",
+            mask_and_scale=mask_and_scale,
         )
         ds[variable_name].encoding = {"chunks": (t, y, x)}
         ds.rio.write_crs(crs, inplace=True)
         ds.attrs["crs"] = crs.to_wkt()
-        ds.to_zarr(zarr_stack_fn)
+        writes = [ds.to_zarr(zarr_stack_fn, compute=False)]
+        writes += write_pyramid(ds, zarr_stack_fn, pyramid_levels, compute=False)
+        dask.compute(*writes)
 
         if verbose:
             print("Rechunked zarr file info")
@@ -459,7 +1322,10 @@ def create_zarr_stack(
 
         tc, yc, xc = determine_optimal_chuck_size(ds, verbose=verbose)
         ds = xr.open_dataset(
-            zarr_stack_fn, chunks={"time": tc, "y": yc, "x": xc}, engine="zarr"
+            zarr_stack_fn,
+            chunks={"time": tc, "y": yc, "x": xc},
+            engine="zarr",
+            mask_and_scale=mask_and_scale,
         )
 
     if verbose:
@@ -470,6 +1336,75 @@ def create_zarr_stack(
     return ds
 
 
+def coarsen_stack(ds, factor):
+    """
+    Averages factor x factor pixel blocks, ignoring NaN and nodata.
+    Edge pixels that do not fill a complete block are trimmed.
+    """
+    variables = {}
+    for name, DataArray in ds.data_vars.items():
+        if not {"x", "y"} <= set(DataArray.dims):
+            continue
+        fill = DataArray.attrs.get("_FillValue", DataArray.encoding.get("_FillValue"))
+        if np.issubdtype(DataArray.dtype, np.integer) and fill is not None:
+            DataArray = DataArray.where(DataArray != fill)
+        variables[name] = DataArray.astype("float32")
+    coarse = xr.Dataset(variables).coarsen(x=factor, y=factor, boundary="trim").mean()
+    for name in coarse.data_vars:
+        coarse[name].attrs = {
+            k: v for k, v in ds[name].attrs.items() if k != "_FillValue"
+        }
+    coarse.attrs = ds.attrs
+    return coarse
+
+
+def write_pyramid(ds, zarr_stack_file, levels, compute=True):
+    """
+    Writes coarsened copies of ds to the groups pyramid/2, pyramid/4, ... of a Zarr store.
+
+    With compute False, returns the delayed writes so they can be computed together
+    with the full resolution write and share its reads.
+    """
+    writes = []
+    for level in range(1, levels + 1):
+        factor = 2**level
+        coarse = coarsen_stack(ds, factor)
+        for name in coarse.variables:
+            coarse[name].encoding = {}
+        coarse = coarse.chunk({"y": "auto", "x": "auto"})
+        writes.append(
+            coarse.to_zarr(
+                zarr_stack_file, group=f"pyramid/{factor}", mode="w", compute=compute
+            )
+        )
+    return writes
+
+
+def open_stack_level(zarr_stack_file, level=0, chunks={}, **kwargs):
+    """
+    Opens pyramid level of a local or remote Zarr stack. Level 0 is full resolution,
+    level n is coarsened by 2**n. Levels not stored in the file are coarsened on the fly.
+    Chunks of remote stacks are cached in REMOTE_CACHE.
+    """
+    store = _zarr_store(zarr_stack_file)
+    if not level:
+        return xr.open_dataset(store, chunks=chunks, engine="zarr", **kwargs)
+    factor = 2**level
+    try:
+        ds = xr.open_dataset(
+            store,
+            chunks=chunks,
+            engine="zarr",
+            group=f"pyramid/{factor}",
+            **kwargs,
+        )
+    except (FileNotFoundError, KeyError, OSError):
+        print(f"Pyramid level {level} not found. Coarsening by {factor} on the fly.")
+        ds = xr.open_dataset(store, chunks=chunks, engine="zarr", **kwargs)
+        ds = coarsen_stack(ds, factor)
+    return ds
+
+
 def determine_optimal_chuck_size(
     ds, variable_name="band1", x_dim="x", y_dim="y", verbose=True
 ):
@@ -511,3 +1446,390 @@ def determine_optimal_chuck_size(
         )
 
     return tc, yc, xc
+
+
+def read_table_chunks(file_name, chunksize=1000000, columns=None):
+    """
+    Streams a CSV or Parquet file as pandas DataFrames of up to chunksize rows.
+    """
+    if Path(file_name).suffix == ".parquet":
+        import pyarrow.parquet
+
+        parquet_file = pyarrow.parquet.ParquetFile(file_name)
+        for batch in parquet_file.iter_batches(batch_size=chunksize, columns=columns):
+            yield batch.to_pandas()
+    else:
+        for df in pd.read_csv(file_name, chunksize=chunksize, usecols=columns):
+            yield df
+
+
+def _merge_point_cells(cells, sketch_size):
+    """
+    Merges sparse (time, pixel) cell sketches that may contain duplicate cells.
+    """
+    keys = np.stack([cells["time"], cells["pixel"]], axis=1)
+    unique, inverse = np.unique(keys, axis=0, return_inverse=True)
+    groups = np.repeat(inverse.ravel(), cells["means"].shape[1])
+    means, weights = accumulators.sketch_compress(
+        groups, cells["means"], cells["weights"], len(unique), size=sketch_size
+    )
+    return {
+        "time": unique[:, 0],
+        "pixel": unique[:, 1],
+        "means": means,
+        "weights": weights,
+    }
+
+
+def _merge_pending_cells(cells, pending, sketch_size):
+    """
+    Merges a list of cell sketches into the merged cells, which may be None.
+    """
+    if cells is not None:
+        pending = [cells] + pending
+    return _merge_point_cells(
+        {k: np.concatenate([i[k] for i in pending]) for k in pending[0]}, sketch_size
+    )
+
+
+def ingest_points(
+    points_file,
+    zarr_stack_file,
+    x="lon",
+    y="lat",
+    z="h",
+    time="time",
+    crs="EPSG:4326",
+    frequency="D",
+    variable_prefix="points",
+    chunksize=1000000,
+    sketch_size=16,
+    overwrite=False,
+    verbose=True,
+):
+    """
+    Bins point elevations, e.g. ICESat-2 or ATM, onto the grid of a Zarr stack.
+
+    The point file is streamed in chunks. Points are mapped to pixels and time slices
+    of the given frequency with vectorized index computations and reduced to per-cell
+    median and count with grouped sketches. Results are written to the Zarr stack as
+    parallel variables {variable_prefix}_median and {variable_prefix}_count along
+    a {variable_prefix}_time dimension. Only chunks that contain points are written.
+
+    Inputs
+    points_file     : str : CSV or Parquet file
+    zarr_stack_file : str : Zarr stack created with create_zarr_stack
+    x, y, z, time   : str : columns with coordinates, elevations and timestamps
+    crs             : str : crs of point coordinates
+    frequency       : str : pandas frequency used to bin timestamps into time slices
+    variable_prefix : str : prefix for output variables
+    chunksize       : int : rows read at once
+    sketch_size     : int : centroids per cell used to approximate the median
+
+    Returns
+    xr.Dataset with the new variables
+    """
+    time_dim = variable_prefix + "_time"
+    names = [variable_prefix + "_median", variable_prefix + "_count"]
+
+    ds = xr.open_dataset(zarr_stack_file, chunks={}, engine="zarr")
+    existing = [i for i in names if i in ds.data_vars]
+    if existing and not overwrite:
+        print(f"{existing} already exist in {zarr_stack_file}. Set overwrite to True.")
+        return ds[existing]
+
+    attrs = ds.attrs
+    stack_crs = ds.rio.crs or attrs["crs"]
+    ds = ds.rio.write_crs(stack_crs)
+    transform = ds.rio.transform()
+    height, width = ds.rio.height, ds.rio.width
+    y_chunks, x_chunks = ds[list(ds.data_vars)[0]].chunks[-2:]
+
+    if existing:
+        group = zarr.open_group(zarr_stack_file, mode="a")
+        for name in existing + [time_dim]:
+            if name in group:
+                del group[name]
+        zarr.consolidate_metadata(zarr_stack_file)
+    transformer = pyproj.Transformer.from_crs(crs, stack_crs, always_xy=True)
+
+    # merge chunk cells once they outnumber the merged cells, so that each cell is
+    # only re-merged a logarithmic number of times
+    cells = None
+    pending = []
+    n_pending = 0
+    n_points = 0
+    for df in read_table_chunks(points_file, chunksize, columns=[x, y, z, time]):
+        xs, ys = transformer.transform(df[x].values, df[y].values)
+        cols, rows = ~transform * (np.asarray(xs), np.asarray(ys))
+        rows, cols = np.floor(rows), np.floor(cols)
+        values = df[z].values.astype(float)
+        inside = (
+            (rows >= 0)
+            & (rows < height)
+            & (cols >= 0)
+            & (cols < width)
+            & np.isfinite(values)
+        )
+        times = pd.to_datetime(df[time].values[inside]).floor(frequency)
+        pixels = (rows[inside] * width + cols[inside]).astype(np.int64)
+        n_points += inside.sum()
+
+        chunk_cells = {
+            "time": times.values.astype("datetime64[ns]").astype(np.int64),
+            "pixel": pixels,
+            "means": values[inside][:, np.newaxis],
+            "weights": np.ones((inside.sum(), 1)),
+        }
+        pending.append(_merge_point_cells(chunk_cells, sketch_size))
+        n_pending += len(pending[-1]["pixel"])
+        if cells is None or n_pending >= len(cells["pixel"]):
+            cells = _merge_pending_cells(cells, pending, sketch_size)
+            pending, n_pending = [], 0
+        if verbose:
+            print(f"Binned {n_points} points")
+    if pending:
+        cells = _merge_pending_cells(cells, pending, sketch_size)
+
+    if cells is None or not len(cells["pixel"]):
+        print("No points within the stack bounds.")
+        return None
+    if verbose:
+        print(f"Merged {n_points} points into {len(cells['pixel'])} cells")
+
+    median = accumulators.sketch_quantile(cells["means"], cells["weights"], 0.5)
+    count = cells["weights"].sum(axis=1)
+    slices = np.unique(cells["time"])
+
+    # initialize metadata only, chunks without points are never written
+    template = xr.Dataset(
+        {
+            name: (
+                (time_dim, "y", "x"),
+                dask.array.full(
+                    (len(slices), height, width),
+                    fill,
+                    chunks=(1, y_chunks, x_chunks),
+                    dtype=dtype,
+                ),
+            )
+            for name, fill, dtype in zip(names, [np.nan, 0], [float, "uint32"])
+        },
+        coords={time_dim: slices.astype("datetime64[ns]")},
+        attrs=attrs,
+    )
+    template.to_zarr(zarr_stack_file, mode="a", compute=False)
+
+    group = zarr.open_group(zarr_stack_file, mode="r+")
+    arrays = [group[name] for name in names]
+    _, chunk_y, chunk_x = arrays[0].chunks
+    n_chunks_x = -(-width // chunk_x)
+
+    for i, t in enumerate(slices):
+        selection = cells["time"] == t
+        rows, cols = np.divmod(cells["pixel"][selection], width)
+        values = [median[selection], count[selection]]
+        keys = (rows // chunk_y) * n_chunks_x + cols // chunk_x
+        order = np.argsort(keys, kind="stable")
+        blocks, starts = np.unique(keys[order], return_index=True)
+        for block, indices in zip(blocks, np.split(order, starts[1:])):
+            y0 = int(block // n_chunks_x) * chunk_y
+            x0 = int(block % n_chunks_x) * chunk_x
+            y1, x1 = min(y0 + chunk_y, height), min(x0 + chunk_x, width)
+            for array, value, fill in zip(arrays, values, [np.nan, 0]):
+                grid = np.full((y1 - y0, x1 - x0), fill, dtype=array.dtype)
+                grid[rows[indices] - y0, cols[indices] - x0] = value[indices]
+                array[i, y0:y1, x0:x1] = grid
+
+    if verbose:
+        print(f"Wrote {len(slices)} time slices to {zarr_stack_file}")
+
+    ds = xr.open_dataset(zarr_stack_file, chunks={}, engine="zarr")
+    return ds[names]
+
+
+def _label(dim, value):
+    if dim == "time" and np.issubdtype(type(value), np.floating):
+        # decimal years, e.g. from gtsa --frequency 1Y
+        value = pd.Timestamp(utils.decyear_to_date_time(float(value))).round("s")
+    if isinstance(value, (np.datetime64, datetime)):
+        return pd.Timestamp(value).strftime("%Y%m%d")
+    return f"{dim}{value}"
+
+
+def write_cog(
+    DataArray,
+    output_file,
+    crs=None,
+    nodata=-9999,
+    blocksize=512,
+    overview_resampling="average",
+    batch_size=16,
+):
+    """
+    Writes a (y, x) or (band, y, x) DataArray to a COG with bounded memory.
+
+    Tiles are computed in parallel with dask, batch_size at a time, and written to a
+    temporary tiled GeoTIFF as each batch completes. Overviews are then built from the
+    written tiles, and the file is copied to the COG layout. That is three passes over
+    the data. Peak memory is about batch_size * blocksize**2 * 4 bytes, 16 MB with the
+    defaults, plus the GDAL block cache used by the last two passes (GDAL_CACHEMAX).
+
+    Inputs
+    DataArray           : xr.DataArray with x and y coordinates
+    output_file         : str : output COG
+    crs                 : crs of DataArray if not set with rioxarray
+    nodata              : float : value written where data are NaN
+    blocksize           : int : internal tile size
+    overview_resampling : str : resampling used for overviews
+    batch_size          : int : tiles computed at once
+    """
+    if DataArray.ndim == 2:
+        DataArray = DataArray.expand_dims("band")
+    crs = DataArray.rio.crs or crs
+    transform = DataArray.rio.transform()
+    count, height, width = DataArray.shape
+
+    data = DataArray.data
+    if not isinstance(data, dask.array.Array):
+        data = dask.array.from_array(data)
+    data = data.astype("float32")
+    data = dask.array.where(dask.array.isnan(data), nodata, data)
+    data = data.rechunk((1, blocksize, blocksize))
+
+    output_file = Path(output_file)
+    output_file.parent.mkdir(parents=True, exist_ok=True)
+    tmp_file = output_file.with_suffix(".tmp.tif")
+    profile = {
+        "driver": "GTiff",
+        "width": width,
+        "height": height,
+        "count": count,
+        "dtype": "float32",
+        "crs": crs,
+        "transform": transform,
+        "nodata": nodata,
+        "tiled": True,
+        "blockxsize": blocksize,
+        "blockysize": blocksize,
+        "compress": "deflate",
+        "BIGTIFF": "IF_SAFER",
+    }
+    with rasterio.open(tmp_file, "w", **profile) as dst:
+        # compute a bounded number of blocks at a time and write them as they arrive
+        offsets = [np.cumsum((0,) + c) for c in data.chunks]
+        blocks = list(np.ndenumerate(data.to_delayed()))
+        for start in range(0, len(blocks), batch_size):
+            batch = blocks[start : start + batch_size]
+            results = dask.compute(*[block for _, block in batch])
+            for (index, _), block in zip(batch, results):
+                band, row, col = [int(o[i]) for o, i in zip(offsets, index)]
+                window = Window(col, row, block.shape[2], block.shape[1])
+                dst.write(
+                    block,
+                    indexes=list(range(band + 1, band + 1 + block.shape[0])),
+                    window=window,
+                )
+        if "band" in DataArray.coords:
+            for i, value in enumerate(DataArray["band"].values):
+                dst.set_band_description(i + 1, str(value))
+        factors = []
+        while max(height, width) / 2 ** (len(factors) + 1) >= blocksize / 2:
+            factors.append(2 ** (len(factors) + 1))
+        if factors:
+            dst.build_overviews(factors, Resampling[overview_resampling])
+
+    # the COG driver reuses the overviews of its source
+    rasterio.shutil.copy(
+        tmp_file,
+        output_file,
+        driver="COG",
+        COMPRESS="DEFLATE",
+        BLOCKSIZE=blocksize,
+        BIGTIFF="IF_SAFER",
+        NUM_THREADS="ALL_CPUS",
+    )
+    tmp_file.unlink()
+    return output_file.as_posix()
+
+
+def export_cogs(
+    zarr_file,
+    output_directory=None,
+    variables=None,
+    bands=False,
+    crs=None,
+    nodata=-9999,
+    blocksize=512,
+    overview_resampling="average",
+    overwrite=False,
+    verbose=True,
+):
+    """
+    Exports variables of a Zarr output, e.g. mean.zarr or polyfit_deg1.zarr, to COGs.
+
+    Each step along non-spatial dimensions, e.g. degree or time, is written to its
+    own file, or to its own band of one file per variable if bands is True.
+
+    Inputs
+    zarr_file        : str  : Zarr file
+    output_directory : str  : Default is the parent directory of zarr_file
+    variables        : list : variables to export. Default is all with x and y dimensions.
+    bands            : bool : write steps as bands of one file
+    crs              : crs of zarr_file if not stored in it
+
+    Returns
+    list of COG file paths
+    """
+    ds = xr.open_dataset(zarr_file, engine="zarr", chunks={})
+    crs = ds.rio.crs or ds.attrs.get("crs") or crs
+    if not crs:
+        raise ValueError(f"No crs found in {zarr_file}. Specify crs.")
+    ds = ds.rio.write_crs(crs)
+
+    if not output_directory:
+        output_directory = Path(zarr_file).parent
+    name = Path(zarr_file).with_suffix("").name
+    if not variables:
+        variables = [i for i in ds.data_vars if {"x", "y"} <= set(ds[i].dims)]
+
+    outputs = []
+    for variable in variables:
+        DataArray = ds[variable]
+        steps = [i for i in DataArray.dims if i not in ("y", "x")]
+        if steps:
+            DataArray = DataArray.stack(band=steps).transpose("band", "y", "x")
+            labels = [
+                "_".join(_label(k, v) for k, v in zip(steps, np.atleast_1d(i)))
+                for i in DataArray["band"].values
+            ]
+            DataArray = DataArray.drop_vars(["band"] + steps).assign_coords(band=labels)
+
+        prefix = variable if variable == name else f"{name}_{variable}"
+        if steps and not bands:
+            jobs = [
+                (DataArray.isel(band=i), f"{prefix}_{label}.tif")
+                for i, label in enumerate(labels)
+            ]
+        else:
+            jobs = [(DataArray, f"{prefix}.tif")]
+
+        for array, file_name in jobs:
+            output_file = Path(output_directory, file_name)
+            if output_file.exists() and not overwrite:
+                if verbose:
+                    print(output_file, "exists. Set overwrite to True.")
+                outputs.append(output_file.as_posix())
+                continue
+            write_cog(
+                array,
+                output_file,
+                crs=crs,
+                nodata=nodata,
+                blocksize=blocksize,
+                overview_resampling=overview_resampling,
+            )
+            if verbose:
+                print("Saved", output_file)
+            outputs.append(output_file.as_posix())
+    return outputs
@@ -2,14 +2,16 @@ import numpy as np
 import folium
 from folium import plugins
 
-from gtsa import geospatial
+from gtsa import catalog
+
+TITILER_URL = "https://titiler.xyz/cog/tiles/WebMercatorQuad/{z}/{x}/{y}"
 
 
 def plot_cogs_sites(
     payload,
     html_file_name=None,
     cogs_attribution="gtsa",
-    tiler="https://titiler.xyz/cog/tiles/WebMercatorQuad/{z}/{x}/{y}",
+    tiler=TITILER_URL,
     expression="expression=b1&rescale=0,255",
     folium_map_object=None,
     zoom_start=10,
@@ -20,20 +22,37 @@ def plot_cogs_sites(
     draw=True,
     layer_control=True,
     fullscreen=True,
+    max_native_zoom=None,
+    catalog_file=None,
     verbose=False,
 ):
+    """
+    Plots Cloud Optimized GeoTIFFs (COG) for several sites on interactive Folium map.
+    Tiles are served by titiler.xyz unless another tiler is given, e.g. the local
+    gtsa.tileserver.get_tile_server().tiles_url, or read from static tile
+    directories listed under "tile_urls" for each site.
+    COG metadata used to center the map are cached in catalog_file, see gtsa.catalog.
+    """
     site_names = list(payload["sites"].keys())
     cog_urls_by_site = [payload["sites"][i]["cog_urls"] for i in site_names]
     cog_names_by_site = [payload["sites"][i]["cog_names"] for i in site_names]
     site_marker_coords = [payload["sites"][i]["marker_coords"] for i in site_names]
     site_marker_names = [payload["sites"][i]["marker_name"] for i in site_names]
     cog_overview_indices = [payload["sites"][i]["overview_index"] for i in site_names]
+    tile_urls_by_site = [payload["sites"][i].get("tile_urls") for i in site_names]
     map_center_lat, map_center_lon = payload["map_center"]
 
     if not folium_map_object:
         if not map_center_lon or not map_center_lat:
+            # resolve metadata of all sites concurrently, cached in catalog_file
+            df = catalog.update_catalog(
+                [url for urls in cog_urls_by_site for url in urls],
+                catalog_file=catalog_file,
+                verbose=verbose,
+            )
             centroids = [
-                geospatial._get_rasters_centroid(urls) for urls in cog_urls_by_site
+                catalog.lonlat_centroid(df[df["path"].isin(urls)])
+                for urls in cog_urls_by_site
             ]
             lats = np.array(centroids)[:, 1]
             lons = np.array(centroids)[:, 0]
@@ -61,9 +80,13 @@ def plot_cogs_sites(
         feature_group.add_to(m)
 
         for j, cog_url in enumerate(cog_urls):
-            virtual_tiles = f"{tiler}?url={cog_url}"
-            if expression:
-                virtual_tiles = f"{virtual_tiles}&{expression}"
+            if tile_urls_by_site[i]:
+                # pre-rendered static tiles, see gtsa.tileserver.export_tiles
+                virtual_tiles = tile_urls_by_site[i][j]
+            else:
+                virtual_tiles = f"{tiler}?url={cog_url}"
+                if expression:
+                    virtual_tiles = f"{virtual_tiles}&{expression}"
 
             if j == overview_cog_index:
                 show = True
@@ -73,6 +96,7 @@ def plot_cogs_sites(
                     show=show,
                     name=cog_names[j],
                     attr=cogs_attribution,
+                    max_native_zoom=max_native_zoom,
                 ).add_to(m)
             else:
                 show = False
@@ -82,6 +106,7 @@ def plot_cogs_sites(
                     show=show,
                     name=cog_names[j],
                     attr=cogs_attribution,
+                    max_native_zoom=max_native_zoom,
                 ).add_to(m).add_to(cog_feature_group)
 
         site_icon = plugins.BeautifyIcon(
@@ -138,7 +163,7 @@ def plot_cogs(
     map_center_lat=None,
     overview_cog_index=0,
     cogs_attribution="gtsa",
-    tiler="https://titiler.xyz/cog/tiles/WebMercatorQuad/{z}/{x}/{y}",
+    tiler=TITILER_URL,
     expression="expression=b1&rescale=0,255",
     folium_map_object=None,
     zoom_start=10,
@@ -149,11 +174,18 @@ def plot_cogs(
     draw=True,
     layer_control=True,
     fullscreen=True,
+    catalog_file=None,
     verbose=False,
 ):
+    """
+    Plots Cloud Optimized GeoTIFFs (COG) on interactive Folium map.
+    Tiles are served by titiler.xyz unless another tiler is given, e.g. the local
+    gtsa.tileserver.get_tile_server().tiles_url.
+    """
     if not folium_map_object:
         if not map_center_lon or not map_center_lat:
-            map_center_lon, map_center_lat = geospatial._get_rasters_centroid(cog_urls)
+            df = catalog.update_catalog(cog_urls, catalog_file=catalog_file)
+            map_center_lon, map_center_lat = catalog.lonlat_centroid(df)
 
     m = folium_map_object
     if not m:
@@ -217,7 +249,7 @@ def plot_cog(
     html_file_name=None,
     cog_name="my raster",
     cog_attribution="gtsa",
-    tiler="https://titiler.xyz/cog/tiles/WebMercatorQuad/{z}/{x}/{y}",
+    tiler=TITILER_URL,
     expression="expression=b1&rescale=0,255",
     folium_map_object=None,
     zoom_start=11,
@@ -228,14 +260,13 @@ def plot_cog(
     map_center_lon = None, 
     map_center_lat = None,
     show=True,
+    catalog_file=None,
 ):
     """
     Plots Cloud Optimized GeoTIFFs (COG) on interactive Folium map.
+    Tiles are served by titiler.xyz unless another tiler is given, e.g. the local
+    gtsa.tileserver.get_tile_server().tiles_url.
     """
-    # TODO add check that cog is in EPSG:4326
-
-
-
     virtual_tiles = f"{tiler}?url={cog_url}"
     if expression:
         virtual_tiles = f"{virtual_tiles}&{expression}"
@@ -243,7 +274,8 @@ def plot_cog(
     m = folium_map_object
     if not m:
         if not map_center_lon or not map_center_lat:
-            map_center_lon, map_center_lat = geospatial._get_raster_centroid(cog_url)
+            df = catalog.update_catalog([cog_url], catalog_file=catalog_file)
+            map_center_lon, map_center_lat = catalog.lonlat_centroid(df)
         m = _initialize_folium_map(
             map_center_lon,
             map_center_lat,
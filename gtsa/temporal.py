@@ -1,9 +1,17 @@
 import numpy as np
 import numbers
+import warnings
 import pandas as pd
+import scipy
 from sklearn.gaussian_process import GaussianProcessRegressor
 import xarray as xr
+import dask
+import dask.array
 from gtsa import utils
+from gtsa import accumulators
+
+OUTLIER_METHODS = ["sigma", "nmad", "residual"]
+RESAMPLING_METHODS = ["bootstrap", "jackknife"]
 
 
 def create_prediction_timeseries(
@@ -144,3 +152,569 @@ def dask_apply_func(DataArray, func):
         dask="allowed",
     )
     return result
+
+
+def _pixel_batches(n_pixels, bytes_per_pixel, max_bytes=2.5e8):
+    """
+    Yields pixel slices so that each batch stays below max_bytes of working memory.
+    """
+    batch_size = max(1, int(max_bytes // max(bytes_per_pixel, 1)))
+    for start in range(0, n_pixels, batch_size):
+        yield slice(start, min(start + batch_size, n_pixels))
+
+
+def theilsen(values, times, z=1.96, max_bytes=2.5e8):
+    """
+    Block-vectorized Theil-Sen estimator along the last axis.
+
+    The slope is the median of all pairwise slopes. The slope uncertainty is derived
+    from the rank-based confidence interval of the pairwise slopes (Gilbert, 1987)
+    and expressed as a standard deviation.
+
+    Inputs
+    values    : array : (..., time) observations, NaN where missing
+    times     : array : (time,) numeric timestamps
+    z         : float : normal quantile of the confidence interval used for the uncertainty
+    max_bytes : float : working memory per pixel batch
+
+    Returns
+    coefficients, std : arrays of shape (..., 2) ordered as [slope, intercept]
+    """
+    times = np.asarray(times, dtype=float)
+    shape = values.shape[:-1]
+    n = values.shape[-1]
+    values = values.reshape(-1, n).astype(float)
+
+    i, j = np.triu_indices(n, k=1)
+    dt = times[j] - times[i]
+    keep = dt != 0
+    i, j, dt = i[keep], j[keep], dt[keep]
+
+    coefficients = np.full((values.shape[0], 2), np.nan)
+    std = np.full((values.shape[0], 2), np.nan)
+
+    for b in _pixel_batches(values.shape[0], 8 * len(dt), max_bytes=max_bytes):
+        v = values[b]
+        slopes = (v[:, j] - v[:, i]) / dt
+        slopes.sort(axis=1)  # NaN are sorted last
+        n_pairs = np.isfinite(slopes).sum(axis=1)
+        n_obs = np.isfinite(v).sum(axis=1)
+        valid = n_pairs > 0
+        rows = np.arange(len(v))
+
+        low = np.clip((n_pairs - 1) // 2, 0, None)
+        high = np.clip(n_pairs // 2, 0, None)
+        slope = (slopes[rows, low] + slopes[rows, high]) / 2
+
+        var_s = n_obs * (n_obs - 1) * (2 * n_obs + 5) / 18
+        c = z * np.sqrt(var_s)
+        lower = np.clip(np.round((n_pairs - c) / 2).astype(int) - 1, 0, None)
+        upper = np.clip(np.round((n_pairs + c) / 2).astype(int), 0, None)
+        lower = np.minimum(lower, np.clip(n_pairs - 1, 0, None))
+        upper = np.minimum(upper, np.clip(n_pairs - 1, 0, None))
+        slope_std = (slopes[rows, upper] - slopes[rows, lower]) / (2 * z)
+
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)
+            residuals = v - slope[:, np.newaxis] * times
+            intercept = np.nanmedian(residuals, axis=1)
+            scale = 1.4826 * np.nanmedian(
+                np.abs(residuals - intercept[:, np.newaxis]), axis=1
+            )
+            time_mean = np.nanmean(np.where(np.isfinite(v), times, np.nan), axis=1)
+            intercept_std = np.sqrt(scale**2 / n_obs + (time_mean * slope_std) ** 2)
+
+        coefficients[b] = np.where(
+            valid[:, np.newaxis], np.stack([slope, intercept], axis=1), np.nan
+        )
+        std[b] = np.where(
+            valid[:, np.newaxis], np.stack([slope_std, intercept_std], axis=1), np.nan
+        )
+
+    return coefficients.reshape(shape + (2,)), std.reshape(shape + (2,))
+
+
+def irls(values, times, deg=1, max_iter=10, tuning=4.685, tol=1e-8):
+    """
+    Block-vectorized polynomial fit by iteratively reweighted least squares
+    with Tukey bisquare weights along the last axis.
+
+    All pixels are solved at once with batched QR decompositions.
+
+    Inputs
+    values   : array : (..., time) observations, NaN where missing
+    times    : array : (time,) numeric timestamps
+    deg      : int   : polynomial degree
+    max_iter : int   : maximum number of reweighting iterations
+    tuning   : float : bisquare tuning constant in units of the robust residual scale
+    tol      : float : relative change in coefficients at which iterations stop
+
+    Returns
+    coefficients, std : arrays of shape (..., deg + 1) ordered from highest degree
+    """
+    times = np.asarray(times, dtype=float)
+    shape = values.shape[:-1]
+    n = values.shape[-1]
+    k = deg + 1
+    values = values.reshape(-1, n).astype(float)
+
+    # scale design columns for numerical stability, as in xarray.polyfit
+    X = np.vander(times, k)
+    scale = np.sqrt((X * X).sum(axis=0))
+    X = X / scale
+
+    valid = np.isfinite(values)
+    y = np.where(valid, values, 0)
+    n_obs = valid.sum(axis=1)
+    weights = valid.astype(float)
+    beta = np.zeros((values.shape[0], k))
+
+    def solve(w):
+        # QR of the weighted design avoids squaring its condition number
+        sw = np.sqrt(w)
+        Q, R = np.linalg.qr(sw[:, :, np.newaxis] * X)
+        R_inv = np.linalg.pinv(R)
+        b = np.einsum("pnk,pn->pk", Q, sw * y)
+        A_inv = R_inv @ np.swapaxes(R_inv, 1, 2)
+        return np.einsum("pkl,pl->pk", R_inv, b), A_inv
+
+    for _ in range(max_iter):
+        beta_new, A_inv = solve(weights)
+        residuals = np.where(valid, y - beta_new @ X.T, np.nan)
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)
+            sigma = 1.4826 * np.nanmedian(np.abs(residuals), axis=1)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            u = residuals / (tuning * sigma[:, np.newaxis])
+        # keep the previous weights where the scale is zero, e.g. for exact fits
+        scaled = (sigma > 0)[:, np.newaxis]
+        bisquare = np.where(valid & (np.abs(u) < 1), (1 - u**2) ** 2, 0)
+        weights = np.where(scaled, bisquare, weights)
+        change = np.abs(beta_new - beta).max(axis=1)
+        converged = np.all(change <= tol * np.abs(beta_new).max(axis=1))
+        beta = beta_new
+        if converged:
+            break
+
+    beta, A_inv = solve(weights)
+    residuals = np.where(valid, y - beta @ X.T, 0)
+    dof = weights.sum(axis=1) - k
+    with np.errstate(invalid="ignore", divide="ignore"):
+        variance = (weights * residuals**2).sum(axis=1) / dof
+    covariance = variance[:, np.newaxis, np.newaxis] * A_inv
+    std = np.sqrt(np.abs(np.diagonal(covariance, axis1=1, axis2=2)))
+
+    beta = beta / scale
+    std = std / scale
+    insufficient = (n_obs < k)[:, np.newaxis]
+    beta = np.where(insufficient, np.nan, beta)
+    std = np.where(insufficient | (dof <= 0)[:, np.newaxis], np.nan, std)
+
+    return beta.reshape(shape + (k,)), std.reshape(shape + (k,))
+
+
+def dask_apply_trend(DataArray, method="theilsen", dim="time", kwargs=None):
+    """
+    Applies a block-vectorized robust trend estimator along dim.
+
+    Inputs
+    DataArray : xr.DataArray : chunks must hold complete time series
+    method    : str  : 'theilsen' or 'irls'
+    dim       : str  : dimension with numeric coordinates to fit along
+    kwargs    : dict : keyword arguments passed to the estimator
+
+    Returns
+    xr.Dataset with polyfit_coefficients and polyfit_coefficients_std,
+    following the xarray.DataArray.polyfit convention.
+    """
+    kwargs = dict(kwargs or {})
+    estimators = {"theilsen": theilsen, "irls": irls}
+    if method not in estimators:
+        raise ValueError(f"method must be one of {list(estimators)}")
+    if method == "theilsen":
+        degrees = [1, 0]
+    else:
+        degrees = list(range(kwargs.get("deg", 1), -1, -1))
+
+    kwargs["times"] = DataArray[dim].values
+    coefficients, std = xr.apply_ufunc(
+        estimators[method],
+        DataArray,
+        kwargs=kwargs,
+        input_core_dims=[[dim]],
+        output_core_dims=[["degree"], ["degree"]],
+        dask_gufunc_kwargs={"output_sizes": {"degree": len(degrees)}},
+        output_dtypes=[float, float],
+        dask="parallelized",
+    )
+
+    ds = xr.Dataset(
+        {"polyfit_coefficients": coefficients, "polyfit_coefficients_std": std}
+    )
+    ds = ds.assign_coords({"degree": degrees})
+    ds = ds.transpose("degree", ...)
+    ds.attrs["method"] = method
+    return ds
+
+
+def outlier_filter(
+    values, times, method="nmad", threshold=3, max_iter=5, deg=1, min_count=4
+):
+    """
+    Block-vectorized iterative outlier detection along the last axis.
+
+    Inputs
+    values    : array : (..., time) observations, NaN where missing
+    times     : array : (time,) numeric timestamps
+    method    : str   : 'sigma' clips around the mean in units of the standard deviation,
+                        'nmad' clips around the median in units of the NMAD,
+                        'residual' clips residuals to a provisional polynomial trend
+                        in units of the residual NMAD
+    threshold : float : clipping threshold
+    max_iter  : int   : maximum number of clipping iterations
+    deg       : int   : degree of the provisional trend for method 'residual'
+    min_count : int   : time series with fewer remaining values are not clipped further
+
+    Returns
+    mask : bool array of shape (..., time). True where values are outliers.
+    """
+    if method not in OUTLIER_METHODS:
+        raise ValueError(f"method must be one of {OUTLIER_METHODS}")
+
+    values = np.asarray(values, dtype=float)
+    mask = np.zeros(values.shape, dtype=bool)
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        for _ in range(max_iter):
+            kept = np.where(mask, np.nan, values)
+            if method == "sigma":
+                deviations = kept - np.nanmean(kept, axis=-1, keepdims=True)
+                scale = np.nanstd(kept, axis=-1, keepdims=True)
+            else:
+                if method == "residual":
+                    # ordinary least squares on the values kept so far
+                    coefficients, _ = irls(kept, times, deg=deg, max_iter=0)
+                    trend = coefficients @ np.vander(times, deg + 1).T
+                    deviations = kept - trend
+                    center = np.nanmedian(deviations, axis=-1, keepdims=True)
+                    deviations = deviations - center
+                else:
+                    deviations = kept - np.nanmedian(kept, axis=-1, keepdims=True)
+                scale = 1.4826 * np.nanmedian(
+                    np.abs(deviations), axis=-1, keepdims=True
+                )
+            outliers = np.abs(deviations) > threshold * scale
+            enough = np.isfinite(kept).sum(axis=-1, keepdims=True) >= min_count
+            outliers &= enough
+            if not np.any(outliers & ~mask):
+                break
+            mask |= outliers
+
+    return mask
+
+
+def dask_outlier_filter(
+    DataArray, method="nmad", threshold=3, max_iter=5, deg=1, min_count=4, dim="time"
+):
+    """
+    Lazily flags outliers along dim so that filtering runs in the same graph as
+    any subsequent model fit.
+
+    Inputs
+    DataArray : xr.DataArray : chunks must hold complete time series
+    See outlier_filter for other inputs.
+
+    Returns
+    filtered : xr.DataArray with outliers set to NaN
+    mask     : xr.DataArray, True where values are outliers
+    """
+    mask = xr.apply_ufunc(
+        outlier_filter,
+        DataArray,
+        kwargs={
+            "times": DataArray[dim].values,
+            "method": method,
+            "threshold": threshold,
+            "max_iter": max_iter,
+            "deg": deg,
+            "min_count": min_count,
+        },
+        input_core_dims=[[dim]],
+        output_core_dims=[[dim]],
+        output_dtypes=[bool],
+        dask="parallelized",
+    )
+    mask = mask.transpose(*DataArray.dims)
+    mask.name = "outlier_mask"
+    filtered = DataArray.where(~mask)
+    filtered.name = DataArray.name
+    return filtered, mask
+
+
+def bootstrap_trend(
+    values,
+    times,
+    method="bootstrap",
+    n_replicates=1000,
+    percentiles=(2.5, 50, 97.5),
+    batch_size=100,
+    min_count=3,
+    seed=0,
+    max_bytes=2.5e8,
+):
+    """
+    Vectorized bootstrap or jackknife percentiles of the linear trend along the last axis.
+
+    Pixels are grouped by their observation mask. Resample index sets are drawn once per
+    group and all replicates of a batch are solved with one batched least squares call.
+    Pixels are processed in batches so that their replicate slopes stay below max_bytes.
+
+    Inputs
+    values       : array : (..., time) observations, NaN where missing
+    times        : array : (time,) numeric timestamps
+    method       : str   : 'bootstrap' resamples observations with replacement,
+                           'jackknife' leaves one observation out per replicate and
+                           returns normal-approximation percentiles
+    n_replicates : int   : number of bootstrap replicates
+    percentiles  : tuple : percentiles of the slope to return
+    batch_size   : int   : number of replicates solved at once
+    min_count    : int   : minimum number of observations
+    seed         : int   : random seed. Resamples only depend on seed and observation mask.
+    max_bytes    : float : working memory per pixel batch
+
+    Returns
+    array of shape (..., len(percentiles))
+    """
+    if method not in RESAMPLING_METHODS:
+        raise ValueError(f"method must be one of {RESAMPLING_METHODS}")
+
+    times = np.asarray(times, dtype=float)
+    shape = values.shape[:-1]
+    n = values.shape[-1]
+    values = values.reshape(-1, n).astype(float)
+    percentiles = np.asarray(percentiles, dtype=float)
+
+    result = np.full((values.shape[0], len(percentiles)), np.nan)
+    masks, groups = np.unique(np.isfinite(values), axis=0, return_inverse=True)
+    groups = groups.ravel()
+
+    for g, mask in enumerate(masks):
+        k = int(mask.sum())
+        if k < min_count:
+            continue
+        pixels = np.flatnonzero(groups == g)
+        y = values[pixels][:, mask]
+        t = times[mask]
+
+        if method == "bootstrap":
+            rng = np.random.default_rng([seed, *np.packbits(mask).tolist()])
+            samples = rng.integers(0, k, (n_replicates, k))
+        else:
+            samples = np.array([np.delete(np.arange(k), i) for i in range(k)])
+
+        # solve each batch of replicates once for all pixels of the group
+        solvers = []
+        for start in range(0, len(samples), batch_size):
+            tb = t[samples[start : start + batch_size]]
+            X = np.stack([tb, np.ones(tb.shape)], axis=-1)
+            degenerate = np.ptp(tb, axis=1) == 0
+            solvers.append((start, np.linalg.pinv(X)[:, 0, :], degenerate))
+
+        # all replicate slopes of a pixel are needed for percentiles, so pixels are
+        # batched to keep slopes and resampled values below max_bytes
+        bytes_per_pixel = 8 * (len(samples) + batch_size * k)
+        for b in _pixel_batches(len(pixels), bytes_per_pixel, max_bytes=max_bytes):
+            yb = y[b]
+            slopes = np.full((len(yb), len(samples)), np.nan)
+            for start, solver, degenerate in solvers:
+                batch = samples[start : start + batch_size]
+                slope = np.einsum("bm,pbm->pb", solver, yb[:, batch])
+                slopes[:, start : start + batch_size] = np.where(
+                    degenerate, np.nan, slope
+                )
+
+            if method == "bootstrap":
+                with warnings.catch_warnings():
+                    warnings.simplefilter("ignore", RuntimeWarning)
+                    result[pixels[b]] = np.nanpercentile(slopes, percentiles, axis=1).T
+            else:
+                X = np.stack([t, np.ones(k)], axis=-1)
+                slope = yb @ np.linalg.pinv(X)[0]
+                se = np.sqrt(
+                    (k - 1)
+                    / k
+                    * ((slopes - slopes.mean(axis=1, keepdims=True)) ** 2).sum(axis=1)
+                )
+                z = scipy.stats.norm.ppf(percentiles / 100)
+                result[pixels[b]] = slope[:, np.newaxis] + se[:, np.newaxis] * z
+
+    return result.reshape(shape + (len(percentiles),))
+
+
+def dask_bootstrap_trend(DataArray, method="bootstrap", dim="time", kwargs=None):
+    """
+    Applies bootstrap_trend along dim.
+
+    Inputs
+    DataArray : xr.DataArray : chunks must hold complete time series
+    method    : str  : 'bootstrap' or 'jackknife'
+    dim       : str  : dimension with numeric coordinates to fit along
+    kwargs    : dict : keyword arguments passed to bootstrap_trend
+
+    Returns
+    xr.Dataset with slope percentiles along a percentile dimension
+    """
+    kwargs = dict(kwargs or {})
+    kwargs["times"] = DataArray[dim].values
+    kwargs["method"] = method
+    percentiles = list(kwargs.get("percentiles", (2.5, 50, 97.5)))
+
+    result = xr.apply_ufunc(
+        bootstrap_trend,
+        DataArray,
+        kwargs=kwargs,
+        input_core_dims=[[dim]],
+        output_core_dims=[["percentile"]],
+        dask_gufunc_kwargs={"output_sizes": {"percentile": len(percentiles)}},
+        output_dtypes=[float],
+        dask="parallelized",
+    )
+    result = result.assign_coords({"percentile": percentiles})
+    result = result.transpose("percentile", ...)
+
+    ds = xr.Dataset({"slope": result})
+    ds.attrs["method"] = method
+    return ds
+
+
+def _pairwise_block_summary(block, first, second, max_bytes, sketch_size):
+    """
+    Summarizes differences for all pairs within an in-memory (time, y, x) block.
+    """
+    values = block.reshape(block.shape[0], -1).astype(float)
+    n_pixels = values.shape[1]
+    batch_size = max(1, int(max_bytes // (8 * max(n_pixels, 1))))
+
+    summaries = []
+    for start in range(0, len(first), batch_size):
+        i = first[start : start + batch_size]
+        j = second[start : start + batch_size]
+        dh = values[j] - values[i]
+        summary = accumulators.welford_chunk(dh, axis=1)
+        groups = np.broadcast_to(np.arange(len(i))[:, np.newaxis], dh.shape)
+        summary["means"], summary["weights"] = accumulators.sketch_compress(
+            groups, dh, np.ones(dh.shape), len(i), size=sketch_size
+        )
+        summaries.append(summary)
+
+    return {k: np.concatenate([s[k] for s in summaries]) for k in summaries[0]}
+
+
+def _pairwise_merge(a, b, sketch_size):
+    summary = accumulators.welford_merge(a, b)
+    summary["means"], summary["weights"] = accumulators.sketch_merge(
+        [(a["means"], a["weights"]), (b["means"], b["weights"])], size=sketch_size
+    )
+    return summary
+
+
+def pairwise_differences(
+    DataArray,
+    pairs=None,
+    dim="time",
+    max_bytes=2.5e8,
+    sketch_size=256,
+):
+    """
+    Computes summary statistics of the differences between all pairs of time steps.
+
+    Each spatial chunk is read once with complete time series and all pair differences
+    are computed in memory, in batches of pairs bounded by max_bytes. Per-chunk
+    summaries are merged with mergeable accumulators.
+
+    Inputs
+    DataArray   : xr.DataArray : (time, y, x)
+    pairs       : list : (i, j) index pairs. Differences are DataArray[j] - DataArray[i].
+                         Default is all pairs with i < j.
+    dim         : str  : time dimension
+    max_bytes   : float : working memory per chunk for pair differences
+    sketch_size : int  : centroids per pair used to approximate median and NMAD
+
+    Returns
+    pd.DataFrame with one row per pair
+    """
+    n = DataArray.sizes[dim]
+    if pairs is None:
+        first, second = np.triu_indices(n, k=1)
+    else:
+        first, second = [np.array(i, dtype=int) for i in zip(*pairs)]
+
+    DataArray = DataArray.transpose(dim, ...)
+    data = DataArray.data
+    if not isinstance(data, dask.array.Array):
+        data = dask.array.from_array(data, chunks={0: -1})
+    data = data.rechunk({0: -1})
+
+    summarize = dask.delayed(_pairwise_block_summary)
+    merge = dask.delayed(_pairwise_merge)
+    parts = [
+        summarize(block, first, second, max_bytes, sketch_size)
+        for block in data.to_delayed().ravel()
+    ]
+    while len(parts) > 1:
+        merged = [merge(a, b, sketch_size) for a, b in zip(parts[::2], parts[1::2])]
+        if len(parts) % 2:
+            merged.append(parts[-1])
+        parts = merged
+    (summary,) = dask.compute(parts[0])
+
+    count = summary["n"][:, 0]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        std = np.sqrt(summary["m2"][:, 0] / count)
+
+    pixel_area = np.nan
+    spatial_dims = [d for d in DataArray.dims if d != dim]
+    try:
+        resolution = [np.abs(np.diff(DataArray[d].values[:2]))[0] for d in spatial_dims]
+        pixel_area = np.prod(resolution)
+    except (KeyError, IndexError):
+        pass
+
+    times = DataArray[dim].values
+    df = pd.DataFrame(
+        {
+            "time_1": times[first],
+            "time_2": times[second],
+            "count": count.astype(int),
+            "valid_area": count * pixel_area,
+            "mean": np.where(count > 0, summary["mean"][:, 0], np.nan),
+            "std": std,
+            "median": accumulators.sketch_quantile(
+                summary["means"], summary["weights"], 0.5
+            ),
+            "nmad": accumulators.sketch_nmad(summary["means"], summary["weights"]),
+        }
+    )
+    return df
+
+
+def pairwise_difference_grids(DataArray, pairs, dim="time"):
+    """
+    Lazily computes full difference grids DataArray[j] - DataArray[i] for selected pairs.
+
+    Returns
+    xr.DataArray with a pair dimension
+    """
+    first, second = [list(i) for i in zip(*pairs)]
+    later = DataArray.isel({dim: second}).rename({dim: "pair"})
+    earlier = DataArray.isel({dim: first}).rename({dim: "pair"})
+    result = later.drop_vars("pair") - earlier.drop_vars("pair")
+    result = result.assign_coords(
+        {
+            "time_1": ("pair", DataArray[dim].values[first]),
+            "time_2": ("pair", DataArray[dim].values[second]),
+        }
+    )
+    result.name = "dh"
+    return result
@@ -0,0 +1,487 @@
+import concurrent.futures
+import hashlib
+import http.server
+import os
+import re
+import threading
+import urllib.parse
+import warnings
+from pathlib import Path
+
+import numpy as np
+import psutil
+import rasterio
+import rasterio.warp
+from rasterio.enums import Resampling
+from rasterio.io import MemoryFile
+from rasterio.transform import from_bounds
+from rasterio.vrt import WarpedVRT
+
+from gtsa import io
+
+"""
+Lightweight XYZ tile server for local and remote Cloud Optimized GeoTIFFs (COGs).
+
+Tiles are rendered in WebMercator from the overview closest to the tile resolution
+with windowed reads, so only the internal COG tiles that cover a map tile are fetched.
+Rendered PNGs are kept in an in-memory LRU cache and optionally on disk. Requests
+are handled by a fixed thread pool.
+
+Tiles can also be pre-rendered to a static XYZ directory with export_tiles.
+
+Tile URLs follow titiler, e.g.
+http://127.0.0.1:8080/cog/tiles/WebMercatorQuad/{z}/{x}/{y}?url=<cog>&expression=b1&rescale=0,255
+"""
+
+TILE_SIZE = 256
+WEB_MERCATOR_ORIGIN = 20037508.342789244
+GDAL_HTTP_OPTIONS = {
+    "GDAL_DISABLE_READDIR_ON_OPEN": "EMPTY_DIR",
+    "CPL_VSIL_CURL_ALLOWED_EXTENSIONS": ".tif,.tiff,.TIF,.TIFF",
+    "GDAL_HTTP_MULTIRANGE": "YES",
+    "GDAL_HTTP_MERGE_CONSECUTIVE_RANGES": "YES",
+    "VSI_CACHE": "TRUE",
+}
+TILE_PATTERN = re.compile(
+    r"^/(?:cog/)?tiles/(?:WebMercatorQuad/)?(\d+)/(\d+)/(\d+)(?:@1x)?(?:\.png)?$"
+)
+
+_local = threading.local()
+TILE_FORMATS = {"PNG": "png", "WEBP": "webp"}
+
+_SERVER = None
+_EMPTY_TILE = None
+
+
+def tile_bounds(z, x, y):
+    """
+    Returns xmin, ymin, xmax, ymax of an XYZ tile in EPSG:3857.
+    """
+    size = 2 * WEB_MERCATOR_ORIGIN / 2**z
+    xmin = -WEB_MERCATOR_ORIGIN + x * size
+    ymax = WEB_MERCATOR_ORIGIN - y * size
+    return xmin, ymax - size, xmin + size, ymax
+
+
+def _source_info(url):
+    """
+    Returns native WebMercator bounds, resolution and overview factors of a COG.
+    Cached per thread together with the open dataset handles.
+    """
+    infos = _local.__dict__.setdefault("infos", {})
+    if url not in infos:
+        src = _open(url, None)
+        transform, _, _ = rasterio.warp.calculate_default_transform(
+            src.crs, "EPSG:3857", src.width, src.height, *src.bounds
+        )
+        bounds = rasterio.warp.transform_bounds(src.crs, "EPSG:3857", *src.bounds)
+        infos[url] = (bounds, transform.a, src.overviews(1))
+    return infos[url]
+
+
+def _open(url, overview_level):
+    """
+    Opens a dataset at an overview level. Handles are kept open per thread, since
+    rasterio datasets must not be shared between threads.
+    """
+    datasets = _local.__dict__.setdefault("datasets", {})
+    key = (url, overview_level)
+    if key not in datasets:
+        if overview_level is None:
+            datasets[key] = rasterio.open(url)
+        else:
+            datasets[key] = rasterio.open(url, overview_level=overview_level)
+    return datasets[key]
+
+
+def _overview_level(resolution, tile_resolution, factors):
+    """
+    Selects the coarsest overview that is still at least as fine as the tile.
+    """
+    level = None
+    for i, factor in enumerate(factors):
+        if resolution * factor <= tile_resolution:
+            level = i
+    return level
+
+
+def _encode_tile(gray, alpha, driver="PNG"):
+    """
+    Encodes a grayscale tile with transparency. WebP requires RGBA.
+    """
+    bands = [gray, alpha] if driver == "PNG" else [gray, gray, gray, alpha]
+    warnings.simplefilter("ignore", rasterio.errors.NotGeoreferencedWarning)
+    with MemoryFile() as memfile:
+        with memfile.open(
+            driver=driver,
+            width=gray.shape[1],
+            height=gray.shape[0],
+            count=len(bands),
+            dtype="uint8",
+        ) as dst:
+            for i, array in enumerate(bands):
+                dst.write(array, i + 1)
+        return memfile.read()
+
+
+def _empty_tile():
+    global _EMPTY_TILE
+    if _EMPTY_TILE is None:
+        blank = np.zeros((TILE_SIZE, TILE_SIZE), dtype="uint8")
+        _EMPTY_TILE = _encode_tile(blank, blank)
+    return _EMPTY_TILE
+
+
+def _render_arrays(url, z, x, y, band=1, rescale=(0, 255), resampling="bilinear"):
+    """
+    Returns gray and alpha arrays of a WebMercator tile, or None if the tile does not
+    intersect the COG.
+    """
+    bounds = tile_bounds(z, x, y)
+    with rasterio.Env(**GDAL_HTTP_OPTIONS):
+        source_bounds, resolution, factors = _source_info(url)
+        if (
+            bounds[0] >= source_bounds[2]
+            or bounds[2] <= source_bounds[0]
+            or bounds[1] >= source_bounds[3]
+            or bounds[3] <= source_bounds[1]
+        ):
+            return None
+
+        tile_resolution = (bounds[2] - bounds[0]) / TILE_SIZE
+        level = _overview_level(resolution, tile_resolution, factors)
+        src = _open(url, level)
+        with WarpedVRT(
+            src,
+            crs="EPSG:3857",
+            transform=from_bounds(*bounds, TILE_SIZE, TILE_SIZE),
+            width=TILE_SIZE,
+            height=TILE_SIZE,
+            resampling=Resampling[resampling],
+        ) as vrt:
+            data = vrt.read(band).astype(float)
+            mask = vrt.read_masks(band)
+
+    vmin, vmax = rescale
+    scaled = (data - vmin) / (vmax - vmin) * 255
+    gray = np.clip(np.nan_to_num(scaled), 0, 255).astype("uint8")
+    alpha = np.where(np.isfinite(data), mask, 0).astype("uint8")
+    return gray, alpha
+
+
+def render_tile(url, z, x, y, band=1, rescale=(0, 255), resampling="bilinear"):
+    """
+    Renders a WebMercator tile from a COG as a grayscale PNG with transparency.
+
+    Inputs
+    url        : str   : local path or URL of the COG
+    z, x, y    : int   : tile indices
+    band       : int   : band index
+    rescale    : tuple : min and max value mapped to 0 and 255
+    resampling : str   : resampling method
+
+    Returns
+    bytes
+    """
+    arrays = _render_arrays(url, z, x, y, band, rescale, resampling)
+    if arrays is None:
+        return _empty_tile()
+    return _encode_tile(*arrays)
+
+
+def tile_range(url, zoom):
+    """
+    Returns the x and y tile indices at zoom that cover a COG.
+    """
+    # not using the cached handles, which must not be inherited by forked workers
+    with rasterio.Env(**GDAL_HTTP_OPTIONS), rasterio.open(url) as src:
+        xmin, ymin, xmax, ymax = rasterio.warp.transform_bounds(
+            src.crs, "EPSG:3857", *src.bounds
+        )
+    size = 2 * WEB_MERCATOR_ORIGIN / 2**zoom
+    last = 2**zoom - 1
+    x0 = int(np.clip(np.floor((xmin + WEB_MERCATOR_ORIGIN) / size), 0, last))
+    x1 = int(np.clip(np.ceil((xmax + WEB_MERCATOR_ORIGIN) / size) - 1, 0, last))
+    y0 = int(np.clip(np.floor((WEB_MERCATOR_ORIGIN - ymax) / size), 0, last))
+    y1 = int(np.clip(np.ceil((WEB_MERCATOR_ORIGIN - ymin) / size) - 1, 0, last))
+    return range(x0, x1 + 1), range(y0, y1 + 1)
+
+
+def _export_tile_row(
+    url, output_directory, z, x, ys, band, rescale, resampling, driver
+):
+    """
+    Renders a column of tiles and writes the non-empty ones. Returns the number written.
+    """
+    extension = TILE_FORMATS[driver]
+    written = 0
+    for y in ys:
+        arrays = _render_arrays(url, z, x, y, band, rescale, resampling)
+        if arrays is None or not arrays[1].any():
+            continue
+        out = Path(output_directory, str(z), str(x), f"{y}.{extension}")
+        out.parent.mkdir(parents=True, exist_ok=True)
+        out.write_bytes(_encode_tile(*arrays, driver=driver))
+        written += 1
+    return written
+
+
+def export_tiles(
+    url,
+    output_directory,
+    min_zoom=10,
+    max_zoom=16,
+    band=1,
+    rescale=(0, 255),
+    resampling="bilinear",
+    driver="PNG",
+    workers=None,
+    verbose=True,
+):
+    """
+    Pre-renders a static XYZ tile pyramid from a COG with a process pool.
+
+    Tiles are written to output_directory/{z}/{x}/{y}.png (or .webp). Tiles without
+    valid data are skipped. Each zoom level is read from the closest COG overview.
+
+    Inputs
+    url              : str   : local path or URL of the COG
+    output_directory : str   : tile directory
+    min_zoom         : int   : lowest zoom level
+    max_zoom         : int   : highest zoom level
+    band             : int   : band index
+    rescale          : tuple : min and max value mapped to 0 and 255
+    resampling       : str   : resampling method
+    driver           : str   : 'PNG' or 'WEBP'
+    workers          : int   : number of processes. Default is logical cores -1.
+
+    Returns
+    int : number of tiles written
+    """
+    if driver not in TILE_FORMATS:
+        raise ValueError(f"driver must be one of {list(TILE_FORMATS)}")
+    if not workers:
+        workers = max(psutil.cpu_count(logical=True) - 1, 1)
+
+    tasks = []
+    for z in range(min_zoom, max_zoom + 1):
+        xs, ys = tile_range(url, z)
+        tasks += [(z, x, ys) for x in xs]
+
+    written = 0
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            pool.submit(
+                _export_tile_row,
+                url,
+                output_directory,
+                z,
+                x,
+                ys,
+                band,
+                rescale,
+                resampling,
+                driver,
+            )
+            for z, x, ys in tasks
+        ]
+        for future in concurrent.futures.as_completed(futures):
+            written += future.result()
+    if verbose:
+        print(f"Wrote {written} tiles for {url} to {output_directory}")
+    return written
+
+
+def _parse_query(query):
+    """
+    Parses titiler style query parameters.
+    """
+    params = urllib.parse.parse_qs(query)
+    if "url" not in params:
+        raise ValueError("Missing url parameter.")
+    url = params["url"][0]
+
+    band = 1
+    if "bidx" in params:
+        band = int(params["bidx"][0])
+    if "expression" in params:
+        match = re.fullmatch(r"b(\d+)", params["expression"][0].strip())
+        if not match:
+            raise ValueError("Only single band expressions, e.g. 'b1', are supported.")
+        band = int(match.group(1))
+
+    rescale = (0.0, 255.0)
+    if "rescale" in params:
+        rescale = tuple(float(i) for i in params["rescale"][0].split(","))
+
+    resampling = params.get("resampling", ["bilinear"])[0]
+    if resampling not in Resampling.__members__:
+        raise ValueError(f"Invalid resampling method {resampling}.")
+    return url, band, rescale, resampling
+
+
+class _TileRequestHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        parsed = urllib.parse.urlparse(self.path)
+        match = TILE_PATTERN.match(parsed.path)
+        if not match:
+            self.send_error(404, "Expected /cog/tiles/WebMercatorQuad/{z}/{x}/{y}")
+            return
+        z, x, y = (int(i) for i in match.groups())
+        try:
+            content = self.server.tile_server.get_tile(z, x, y, parsed.query)
+        except ValueError as e:
+            self.send_error(400, str(e))
+            return
+        except rasterio.errors.RasterioIOError as e:
+            self.send_error(404, str(e))
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "image/png")
+        self.send_header("Content-Length", str(len(content)))
+        self.send_header("Access-Control-Allow-Origin", "*")
+        self.send_header("Cache-Control", "max-age=3600")
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        if self.server.tile_server.verbose:
+            super().log_message(format, *args)
+
+
+class _PooledHTTPServer(http.server.HTTPServer):
+    """
+    HTTPServer that handles requests on a fixed thread pool.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address, handler, workers):
+        super().__init__(address, handler)
+        self.pool = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+
+    def process_request(self, request, client_address):
+        self.pool.submit(self._process_request, request, client_address)
+
+    def _process_request(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        self.pool.shutdown(wait=False)
+
+
+class TileServer:
+    """
+    Serves XYZ tiles rendered from COGs.
+
+    Inputs
+    host       : str : host name
+    port       : int : port. 0 selects a free port.
+    cache_dir  : str : directory for rendered tiles. Default is memory only.
+    cache_size : int : number of tiles kept in memory
+    workers    : int : number of request threads. Default is 4 x logical cores.
+    verbose    : bool
+    """
+
+    def __init__(
+        self,
+        host="127.0.0.1",
+        port=8080,
+        cache_dir=None,
+        cache_size=1024,
+        workers=None,
+        verbose=False,
+    ):
+        if not workers:
+            workers = 4 * psutil.cpu_count(logical=True)
+        self.cache = io._BlockCache(maxsize=cache_size)
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        self.verbose = verbose
+        self.httpd = _PooledHTTPServer((host, port), _TileRequestHandler, workers)
+        self.httpd.tile_server = self
+        self.host, self.port = self.httpd.server_address[:2]
+        self._thread = None
+
+    @property
+    def tiles_url(self):
+        return f"http://{self.host}:{self.port}/cog/tiles/WebMercatorQuad/{{z}}/{{x}}/{{y}}"
+
+    def _cache_file(self, z, x, y, query):
+        key = hashlib.sha1(query.encode()).hexdigest()[:16]
+        return Path(self.cache_dir, key, str(z), str(x), f"{y}.png")
+
+    def get_tile(self, z, x, y, query):
+        """
+        Returns a rendered tile from the memory cache, the disk cache or the COG.
+        """
+        key = (query, z, x, y)
+        content = self.cache.get(key)
+        if content is not None:
+            return content
+
+        cache_file = self._cache_file(z, x, y, query) if self.cache_dir else None
+        if cache_file and cache_file.exists():
+            content = cache_file.read_bytes()
+        else:
+            url, band, rescale, resampling = _parse_query(query)
+            content = render_tile(url, z, x, y, band, rescale, resampling)
+            if cache_file:
+                cache_file.parent.mkdir(parents=True, exist_ok=True)
+                tmp_file = cache_file.with_suffix(f".{threading.get_ident()}.tmp")
+                tmp_file.write_bytes(content)
+                os.replace(tmp_file, cache_file)
+
+        self.cache.put(key, content)
+        return content
+
+    def start(self):
+        """
+        Serves tiles from a background thread.
+        """
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        if self.verbose:
+            print("Serving tiles at", self.tiles_url)
+        return self
+
+    def serve_forever(self):
+        """
+        Serves tiles until interrupted.
+        """
+        print("Serving tiles at", self.tiles_url)
+        print("Press Ctrl+C to stop.")
+        try:
+            if self._thread:
+                while self._thread.is_alive():
+                    self._thread.join(1)
+            else:
+                self.httpd.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
+
+    def stop(self):
+        if self._thread:
+            self.httpd.shutdown()
+            self._thread = None
+        self.httpd.server_close()
+
+
+def get_tile_server(**kwargs):
+    """
+    Returns a tile server shared within the process, starting it on first call. Pass
+    its tiles_url as tiler to the plotting functions.
+    Keyword arguments are passed to TileServer.
+    """
+    global _SERVER
+    if _SERVER is None:
+        _SERVER = TileServer(**kwargs).start()
+    return _SERVER
@@ -5,13 +5,15 @@ from __future__ import annotations
 from pathlib import Path
 import psutil
 from tqdm import tqdm
-import concurrent
+import concurrent.futures
 from datetime import datetime, timedelta
 import numpy as np
-import rioxarray
+import rasterio
+import rasterio.shutil
+import rasterio.transform
 from rasterio.enums import Resampling
+from rasterio.vrt import WarpedVRT
 import calendar
-import gtsa
 
 
 def decyear_to_date_time(
@@ -55,8 +57,95 @@ def date_time_to_decyear(date_time: float) -> float:
     return decyear
 
 
+def _resampled_name(dem_file_name, res, output_directory=None):
+    out_file_name = Path(dem_file_name).with_suffix("").name + f"_{res}m.tif"
+    return Path(output_directory or Path(dem_file_name).parent, out_file_name)
+
+
+def _map_in_processes(func, payload, workers=None, max_memory=None, verbose=True):
+    """
+    Runs func(*args, threads=..., cache_mb=...) for each args in payload in worker
+    processes. Cores and the GDAL cache are split evenly between workers.
+
+    Inputs
+    func       : callable : module level function that opens its inputs itself
+    payload    : list     : argument tuples
+    workers    : int      : number of processes. Default is virtual cores -1
+    max_memory : int      : GDAL cache in MB shared by all workers. Default is 1/4 of available memory
+    verbose    : bool     : Print information
+    """
+    cores = psutil.cpu_count(logical=True)
+    if not workers:
+        workers = cores - 1
+    if len(payload) < workers:
+        print("Reducing workers to one per input file")
+        workers = len(payload)
+    workers = max(workers, 1)
+    threads = max(cores // workers, 1)
+
+    if not max_memory:
+        max_memory = psutil.virtual_memory().available // 4 // 1024**2
+    cache_mb = max(int(max_memory // workers), 64)
+
+    if verbose:
+        print("Using", workers, "workers and", threads, "threads per worker")
+    with tqdm(total=len(payload), disable=not verbose) as pbar:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {
+                pool.submit(func, *args, threads=threads, cache_mb=cache_mb): args
+                for args in payload
+            }
+            for future in concurrent.futures.as_completed(futures):
+                future.result()
+                pbar.update(1)
+
+
+def _resample_dem(
+    file_name, out_fn, res, resampling="cubic", nodata=-9999, threads=1, cache_mb=256
+):
+    """
+    Warps one DEM to a target resolution in its own crs and writes a tiled GeoTIFF.
+
+    Matches gdalwarp -tr res res -dstnodata nodata. The output grid starts at the
+    upper left corner of the input and is rounded to whole pixels.
+    """
+    res = float(res)
+    with rasterio.Env(GDAL_CACHEMAX=cache_mb, GDAL_NUM_THREADS=threads):
+        with rasterio.open(file_name) as src:
+            left, bottom, right, top = src.bounds
+            width = max(int((right - left) / res + 0.5), 1)
+            height = max(int((top - bottom) / res + 0.5), 1)
+            with WarpedVRT(
+                src,
+                crs=src.crs,
+                transform=rasterio.transform.from_origin(left, top, res, res),
+                width=width,
+                height=height,
+                nodata=nodata,
+                resampling=Resampling[resampling],
+                warp_mem_limit=cache_mb,
+                warp_extras={"NUM_THREADS": threads},
+            ) as vrt:
+                rasterio.shutil.copy(
+                    vrt,
+                    out_fn,
+                    driver="GTiff",
+                    TILED="YES",
+                    COMPRESS="LZW",
+                    BIGTIFF="IF_SAFER",
+                    NUM_THREADS=threads,
+                )
+    return str(out_fn)
+
+
 def resample_dem(
-    dem_file_name, res=1, out_file_name=None, overwrite=True, verbose=True
+    dem_file_name,
+    res=1,
+    out_file_name=None,
+    overwrite=True,
+    verbose=True,
+    resampling="cubic",
+    max_memory=None,
 ):
     """
     Inputs
@@ -65,45 +154,142 @@ def resample_dem(
     out_file_name : str  : desired output file path and name
     overwrite     : bool : Option to overwrite existing file
     verbose       : bool : Print information
+    resampling    : str  : Resampling method
+    max_memory    : int  : GDAL cache in MB. Default is 1/4 of available memory
 
-    Assumes crs is in UTM
+    Assumes crs is in UTM. Warps in-process with all cores.
+    Use resample_dems to resample many DEMs in parallel.
     """
-    res = str(res)
-
     if not out_file_name:
-        out_file_name = "_".join(
-            [str(Path(dem_file_name).with_suffix("")), res + "m.tif"]
-        )
+        out_file_name = _resampled_name(dem_file_name, res)
 
     Path(out_file_name).parent.mkdir(parents=True, exist_ok=True)
 
     if Path(out_file_name).exists() and not overwrite:
-        return out_file_name
+        return str(out_file_name)
 
     if overwrite:
         Path(out_file_name).unlink(missing_ok=True)
 
-    call = [
-        "gdalwarp",
-        "-r",
-        "cubic",
-        "-tr",
-        res,
-        res,
-        "-co",
-        "TILED=YES",
-        "-co",
-        "COMPRESS=LZW",
-        "-co",
-        "BIGTIFF=IF_SAFER",
-        "-dstnodata",
-        "-9999",
+    if not max_memory:
+        max_memory = psutil.virtual_memory().available // 4 // 1024**2
+
+    if verbose:
+        print("Resampling", dem_file_name, "to", res, "m")
+    return _resample_dem(
         dem_file_name,
         out_file_name,
-    ]
+        res,
+        resampling=resampling,
+        threads=psutil.cpu_count(logical=True),
+        cache_mb=max(int(max_memory), 64),
+    )
+
+
+def resample_dems(
+    files,
+    res=1,
+    output_directory=None,
+    overwrite=False,
+    workers=None,
+    resampling="cubic",
+    max_memory=None,
+    verbose=True,
+):
+    """
+    Inputs
+    files            : list : Path to .tif files
+    res              : int  : target resolution
+    output_directory : str  : Path to write outputs. Default is parent path of each file
+    overwrite        : bool : Option to overwrite existing files. If False, these will be skipped
+    workers          : int  : number of processes to use. Default is virtual cores -1
+    resampling       : str  : Resampling method
+    max_memory       : int  : GDAL cache in MB shared by all workers. Default is 1/4 of available memory
+    verbose          : bool : Print information
 
-    gtsa.io.run_command(call, verbose=verbose)
-    return out_file_name
+    Outputs are named <input>_<res>m.tif, as with resample_dem.
+    Each input is warped inside its own worker process. Cores not used by worker
+    processes are used by GDAL for multithreaded warping and compression.
+    """
+    files = [Path(x) for x in files]
+
+    if output_directory:
+        Path(output_directory).mkdir(parents=True, exist_ok=True)
+
+    outputs = []
+    existing_outputs = []
+    payload = []
+
+    for fn in files:
+        out_fn = _resampled_name(fn, res, output_directory)
+        outputs.append(out_fn.as_posix())
+        if out_fn.exists() and not overwrite:
+            existing_outputs.append(out_fn.as_posix())
+
+        else:
+            out_fn.unlink(missing_ok=True)
+            payload.append((fn.as_posix(), out_fn.as_posix()))
+
+    if existing_outputs and verbose:
+        print("The following files already exist:")
+        for i in existing_outputs:
+            print(i)
+        print("overwrite set to", overwrite)
+
+    if payload:
+        if verbose:
+            print("Resampling", len(payload), "DEMs to", res, "m")
+        payload = [(fn, out, res, resampling) for fn, out in payload]
+        _map_in_processes(_resample_dem, payload, workers, max_memory, verbose)
+
+    return outputs
+
+
+def default_nodata(dtype):
+    """
+    Returns the nodata value rioxarray assigns to dtype when a raster has none.
+    Maximum for unsigned integers, minimum for signed integers and NaN for floats.
+    """
+    dtype = np.dtype(dtype)
+    if np.issubdtype(dtype, np.unsignedinteger):
+        return np.iinfo(dtype).max
+    if np.issubdtype(dtype, np.integer):
+        return np.iinfo(dtype).min
+    return np.nan
+
+
+def _create_cog(file_name, out_fn, crs, resampling="cubic", threads=1, cache_mb=256):
+    """
+    Warps one raster to crs and writes it with the GDAL COG driver.
+
+    The WarpedVRT is read window by window by the COG driver, so memory is bounded
+    by the GDAL block cache rather than the raster size. Sources without nodata get
+    the dtype default, so areas outside the warped footprint are masked.
+    """
+    with rasterio.Env(GDAL_CACHEMAX=cache_mb, GDAL_NUM_THREADS=threads):
+        with rasterio.open(file_name) as src:
+            nodata = src.nodata
+            if nodata is None:
+                nodata = default_nodata(src.dtypes[0])
+            with WarpedVRT(
+                src,
+                crs=crs,
+                nodata=nodata,
+                resampling=Resampling[resampling],
+                warp_mem_limit=cache_mb,
+                warp_extras={"NUM_THREADS": threads},
+            ) as vrt:
+                rasterio.shutil.copy(
+                    vrt,
+                    out_fn,
+                    driver="COG",
+                    COMPRESS="DEFLATE",
+                    BLOCKSIZE=512,
+                    BIGTIFF="IF_SAFER",
+                    NUM_THREADS=threads,
+                    OVERVIEW_RESAMPLING=resampling.upper(),
+                )
+    return str(out_fn)
 
 
 def create_cogs(
@@ -113,6 +299,8 @@ def create_cogs(
     suffix="_COG.tif",
     overwrite=False,
     workers=None,
+    resampling="cubic",
+    max_memory=None,
     verbose=True,
 ):
     """
@@ -122,16 +310,15 @@ def create_cogs(
     crs              : str  : EPSG code. 4326 is currently required for visualization with folium and TiTiler
     suffix           : str  : Suffix with extension for output file names
     overwrite        : bool : Option to overwrite existing files. If False, these will be skipped
-    workers      : int  : nuber of threads to use. Default is virtual cores -1
+    workers          : int  : number of processes to use. Default is virtual cores -1
+    resampling       : str  : Resampling method used for warping and overviews
+    max_memory       : int  : GDAL cache in MB shared by all workers. Default is 1/4 of available memory
     verbose          : bool : Print information
-    """
 
-    if not workers:
-        workers = psutil.cpu_count(logical=True) - 1
-
-    if len(files) < workers:
-        print("Reducing workers to one per input file")
-        workers = len(payload)
+    Each input is opened inside its own worker process. Cores not used by worker
+    processes are used by GDAL for multithreaded warping and compression.
+    """
+    files = [Path(x) for x in files]
 
     if not output_directory:
         output_directory = Path(Path(files[0].parent), "cogs")
@@ -143,18 +330,6 @@ def create_cogs(
     existing_outputs = []
     payload = []
 
-    def to_raster(payload):
-        ds, out, crs = payload
-        ds = ds.rio.reproject(crs, resampling=Resampling.cubic)
-
-        ds.rio.to_raster(
-            out,
-            driver="cog",
-            lock=True,
-            compress="deflate",
-            blocksize=512,
-        )
-
     for fn in files:
         out_fn = Path(output_directory, fn.with_suffix("").name + suffix)
         if out_fn.exists() and not overwrite:
@@ -162,8 +337,7 @@ def create_cogs(
 
         else:
             out_fn.unlink(missing_ok=True)
-            ds = rioxarray.open_rasterio(fn)
-            payload.append((ds, out_fn, crs))
+            payload.append((fn.as_posix(), out_fn.as_posix()))
 
     if existing_outputs and verbose:
         print("The following files already exist:")
@@ -173,12 +347,9 @@ def create_cogs(
 
     if payload:
         if verbose:
-            print("Processing", len(payload), "rasters with", workers, "workers")
-        with tqdm(total=len(payload)) as pbar:
-            pool = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
-            futures = {pool.submit(to_raster, x): x for x in payload}
-            for future in concurrent.futures.as_completed(futures):
-                pbar.update(1)
+            print("Processing", len(payload), "rasters")
+        payload = [(fn, out, crs, resampling) for fn, out in payload]
+        _map_in_processes(_create_cog, payload, workers, max_memory, verbose)
 
     files = sorted(output_directory.glob("*" + suffix))
     return [x.as_posix() for x in files]
@@ -0,0 +1,276 @@
+import numpy as np
+import pandas as pd
+import xarray as xr
+import dask
+import dask.array
+import rasterio.features
+from rasterio.enums import Resampling
+
+from gtsa import accumulators
+from gtsa import io
+
+"""
+Grouped reductions over label grids, e.g. glacier outlines or elevation bands.
+"""
+
+
+def rasterize_labels(gdf, ds, all_touched=False):
+    """
+    Rasterizes all geometries at once into an integer label grid on the grid of ds.
+
+    Pixels in the n-th geometry are labeled n + 1. Background is 0.
+    Where geometries overlap, later geometries take precedence.
+
+    Inputs
+    gdf         : GeoDataFrame : geometries in the crs of ds
+    ds          : xr.Dataset or xr.DataArray with rioxarray extension
+    all_touched : bool : include all pixels touched by geometries
+
+    Returns
+    np.ndarray of shape (y, x)
+    """
+    shapes = ((geometry, i + 1) for i, geometry in enumerate(gdf.geometry))
+    labels = rasterio.features.rasterize(
+        shapes,
+        out_shape=(ds.rio.height, ds.rio.width),
+        transform=ds.rio.transform(),
+        fill=0,
+        dtype="int32",
+        all_touched=all_touched,
+    )
+    return labels
+
+
+def _grouped_block_summary(block, labels, time_offset, n_times, n_labels, size):
+    """
+    Computes per-label, per-time count, mean, sum of squared deviations and sketch
+    for one block.
+    """
+    values = block.reshape(block.shape[0], -1).astype(float)
+    labels = labels.ravel()
+    times = np.arange(block.shape[0])[:, np.newaxis] + time_offset
+    keys = np.broadcast_to(times * n_labels + labels, values.shape)
+    valid = np.isfinite(values)
+    keys, values = keys[valid], values[valid]
+
+    n_groups = n_times * n_labels
+    means, weights = accumulators.sketch_compress(
+        keys, values, np.ones(values.shape), n_groups, size=size
+    )
+    n = np.bincount(keys, minlength=n_groups).astype(float)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = np.where(
+            n > 0, np.bincount(keys, weights=values, minlength=n_groups) / n, 0
+        )
+    m2 = np.bincount(keys, weights=(values - mean[keys]) ** 2, minlength=n_groups)
+    return {
+        "moments": {"n": n, "mean": mean, "m2": m2},
+        "means": means,
+        "weights": weights,
+    }
+
+
+def _grouped_merge(a, b, size):
+    means, weights = accumulators.sketch_merge(
+        [(a["means"], a["weights"]), (b["means"], b["weights"])], size=size
+    )
+    return {
+        "moments": accumulators.welford_merge(a["moments"], b["moments"]),
+        "means": means,
+        "weights": weights,
+    }
+
+
+def grouped_statistics(DataArray, labels, n_labels, dim="time", sketch_size=64):
+    """
+    Computes count, mean, std, median, NMAD and quartiles for every label and time step
+    in one pass.
+
+    Each chunk is read once. Chunks can be split along dim.
+
+    Inputs
+    DataArray   : xr.DataArray : (time, y, x) or (y, x)
+    labels      : np.ndarray   : (y, x) integer labels from 0 to n_labels - 1
+    n_labels    : int  : number of labels
+    dim         : str  : time dimension, ignored if not in DataArray
+    sketch_size : int  : centroids per group used to approximate median and NMAD
+
+    Returns
+    dict of arrays of shape (time, n_labels)
+    """
+    if dim in DataArray.dims:
+        DataArray = DataArray.transpose(dim, ...)
+        data = DataArray.data
+    else:
+        data = DataArray.data[np.newaxis]
+    if not isinstance(data, dask.array.Array):
+        data = dask.array.from_array(data, chunks=(-1, "auto", "auto"))
+
+    n_times = data.shape[0]
+    label_blocks = dask.array.from_array(labels, chunks=data.chunks[1:]).to_delayed()
+    time_offsets = np.cumsum((0,) + data.chunks[0])
+
+    summarize = dask.delayed(_grouped_block_summary)
+    merge = dask.delayed(_grouped_merge)
+    parts = []
+    for index, block in np.ndenumerate(data.to_delayed()):
+        parts.append(
+            summarize(
+                block,
+                label_blocks[index[1:]],
+                time_offsets[index[0]],
+                n_times,
+                n_labels,
+                sketch_size,
+            )
+        )
+    while len(parts) > 1:
+        merged = [merge(a, b, sketch_size) for a, b in zip(parts[::2], parts[1::2])]
+        if len(parts) % 2:
+            merged.append(parts[-1])
+        parts = merged
+    (summary,) = dask.compute(parts[0])
+
+    moments = summary["moments"]
+    count = moments["n"].astype(int)
+    empty = count == 0
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = np.where(empty, np.nan, moments["mean"])
+        std = np.where(empty, np.nan, np.sqrt(moments["m2"] / moments["n"]))
+
+    results = {
+        "count": count,
+        "mean": mean,
+        "std": std,
+        "median": accumulators.sketch_quantile(
+            summary["means"], summary["weights"], 0.5
+        ),
+        "nmad": accumulators.sketch_nmad(summary["means"], summary["weights"]),
+        "q25": accumulators.sketch_quantile(summary["means"], summary["weights"], 0.25),
+        "q75": accumulators.sketch_quantile(summary["means"], summary["weights"], 0.75),
+    }
+    return {k: v.reshape(n_times, n_labels) for k, v in results.items()}
+
+
+def _pixel_area(DataArray):
+    try:
+        resolution = DataArray.rio.resolution()
+        return abs(resolution[0] * resolution[1])
+    except Exception:
+        return np.nan
+
+
+def zonal_statistics(DataArray, gdf, id_column=None, dim="time", all_touched=False):
+    """
+    Computes per-polygon, per-time statistics for all polygons in a single pass.
+
+    Inputs
+    DataArray   : xr.DataArray with rioxarray extension : (time, y, x) or (y, x)
+    gdf         : GeoDataFrame : polygons in the crs of DataArray
+    id_column   : str  : column with polygon ids. Default is the GeoDataFrame index.
+    dim         : str  : time dimension, ignored if not in DataArray
+    all_touched : bool : include all pixels touched by polygons
+
+    Returns
+    pd.DataFrame with one row per polygon and time step. Coverage is the fraction of
+    polygon pixels with valid data. Volume is the mean multiplied by the polygon area.
+    """
+    labels = rasterize_labels(gdf, DataArray, all_touched=all_touched)
+    n_labels = len(gdf) + 1
+    results = grouped_statistics(DataArray, labels, n_labels, dim=dim)
+
+    ids = gdf[id_column].values if id_column else gdf.index.values
+    pixels = np.bincount(labels.ravel(), minlength=n_labels)
+    area = pixels * _pixel_area(DataArray)
+
+    has_time = dim in DataArray.dims
+    times = DataArray[dim].values if has_time else [None]
+    frames = []
+    for t, time in enumerate(times):
+        df = pd.DataFrame({k: v[t, 1:] for k, v in results.items()})
+        with np.errstate(invalid="ignore", divide="ignore"):
+            df["coverage"] = df["count"] / pixels[1:]
+        df["area"] = area[1:]
+        df["volume"] = df["mean"] * df["area"]
+        df.insert(0, id_column or "id", ids)
+        if has_time:
+            df.insert(1, dim, time)
+        frames.append(df)
+
+    return pd.concat(frames, ignore_index=True)
+
+
+def elevation_band_labels(reference_dem, band_width=50):
+    """
+    Bins elevations into bands of band_width.
+
+    Inputs
+    reference_dem : np.ndarray : (y, x) elevations, NaN where missing
+    band_width    : float : elevation band width
+
+    Returns
+    labels : np.ndarray of shape (y, x). 0 where the reference DEM is missing.
+    edges  : np.ndarray of lower band edges for labels 1 to n
+    """
+    valid = np.isfinite(reference_dem)
+    if not valid.any():
+        raise ValueError("Reference DEM contains no valid elevations.")
+    lowest = np.floor(np.nanmin(reference_dem) / band_width) * band_width
+    bands = np.floor((np.where(valid, reference_dem, lowest) - lowest) / band_width)
+    labels = np.where(valid, bands.astype("int32") + 1, 0)
+    edges = lowest + band_width * np.arange(labels.max())
+    return labels, edges
+
+
+def hypsometric_statistics(
+    DataArray, reference_dem, band_width=50, dim="time", resampling="bilinear"
+):
+    """
+    Computes per-elevation-band, per-time statistics in a single pass.
+
+    Inputs
+    DataArray     : xr.DataArray with rioxarray extension : (time, y, x) or (y, x)
+    reference_dem : str or xr.DataArray : reference DEM file or DataArray.
+                    Reprojected to the grid of DataArray if necessary.
+    band_width    : float : elevation band width
+    dim           : str  : time dimension, ignored if not in DataArray
+    resampling    : str  : resampling method used to match the reference DEM grid
+
+    Returns
+    pd.DataFrame with one row per elevation band and time step
+    """
+    if not isinstance(reference_dem, xr.DataArray):
+        reference_dem = io.xr_read_geotif(reference_dem)["band1"]
+    template = DataArray.isel({dim: 0}) if dim in DataArray.dims else DataArray
+    if not (
+        reference_dem.rio.crs == template.rio.crs
+        and reference_dem.rio.transform() == template.rio.transform()
+        and reference_dem.rio.shape == template.rio.shape
+    ):
+        reference_dem = reference_dem.rio.reproject_match(
+            template, resampling=Resampling[resampling]
+        )
+    labels, edges = elevation_band_labels(
+        np.asarray(reference_dem.values, dtype=float), band_width=band_width
+    )
+    n_labels = len(edges) + 1
+    results = grouped_statistics(DataArray, labels, n_labels, dim=dim)
+
+    pixels = np.bincount(labels.ravel(), minlength=n_labels)
+    area = pixels * _pixel_area(DataArray)
+
+    has_time = dim in DataArray.dims
+    times = DataArray[dim].values if has_time else [None]
+    frames = []
+    for t, time in enumerate(times):
+        df = pd.DataFrame({k: v[t, 1:] for k, v in results.items()})
+        with np.errstate(invalid="ignore", divide="ignore"):
+            df["coverage"] = df["count"] / pixels[1:]
+        df["area"] = area[1:]
+        df.insert(0, "band_min", edges)
+        df.insert(1, "band_max", edges + band_width)
+        if has_time:
+            df.insert(2, dim, time)
+        frames.append(df)
+
+    return pd.concat(frames, ignore_index=True)
@@ -15,6 +15,10 @@ setup(
             "create_cogs=gtsa.cli.create_cogs:main",
             "create_cog_map=gtsa.cli.create_cog_map:main",
             "gtsa=gtsa.cli.gtsa:main",
+            "extract_points=gtsa.cli.extract_points:main",
+            "ingest_points=gtsa.cli.ingest_points:main",
+            "export_cogs=gtsa.cli.export_cogs:main",
+            "resample_dems=gtsa.cli.resample_dems:main",
         ]
     },
 )
@@ -0,0 +1,73 @@
+import dask.array as da
+import numpy as np
+import pytest
+import xarray as xr
+
+from gtsa import accumulators
+
+
+@pytest.fixture
+def stack():
+    rng = np.random.default_rng(0)
+    array = rng.normal(100, 20, size=(23, 6, 7))
+    array[rng.random(array.shape) < 0.3] = np.nan
+    array[:, 0, 0] = np.nan  # pixel without data
+    array[:, 0, 1] = np.nan
+    array[5, 0, 1] = 42.0  # pixel with a single value
+    return array
+
+
+STATISTICS = {
+    "count": lambda a: np.isfinite(a).sum(axis=0).astype(float),
+    "sum": lambda a: np.where(np.isfinite(a).any(axis=0), np.nansum(a, axis=0), np.nan),
+    "mean": lambda a: np.nanmean(a, axis=0),
+    "std": lambda a: np.nanstd(a, axis=0),
+    "min": lambda a: np.nanmin(a, axis=0),
+    "max": lambda a: np.nanmax(a, axis=0),
+}
+
+
+@pytest.mark.filterwarnings("ignore::RuntimeWarning")
+@pytest.mark.parametrize("stat", STATISTICS)
+@pytest.mark.parametrize("chunks", [23, 1, 5, (3, 11, 2, 7)])
+def test_streaming_matches_numpy(stack, stat, chunks):
+    expected = STATISTICS[stat](stack)
+    func = getattr(accumulators, "streaming_" + stat)
+
+    np.testing.assert_allclose(func(stack, axis=0), expected)
+    lazy = func(da.from_array(stack, chunks=(chunks, 3, 4)), axis=0)
+    np.testing.assert_allclose(lazy.compute(), expected)
+
+
+@pytest.mark.filterwarnings("ignore::RuntimeWarning")
+@pytest.mark.parametrize("chunks", [32, 1, 7])
+def test_sketch_exact_for_short_series(stack, chunks):
+    array = da.from_array(stack, chunks=(chunks, 3, 4))
+    median = np.nanmedian(stack, axis=0)
+    nmad = accumulators.NMAD_SCALE * np.nanmedian(np.abs(stack - median), axis=0)
+
+    np.testing.assert_allclose(
+        accumulators.streaming_median(array, axis=0, size=32).compute(), median
+    )
+    np.testing.assert_allclose(
+        accumulators.streaming_nmad(array, axis=0, size=32).compute(), nmad
+    )
+
+
+def test_sketch_quantiles_of_long_series():
+    values = np.random.default_rng(1).normal(size=(2000, 1))
+    result = accumulators.streaming_median(values, axis=0, size=64)
+    assert abs(result[0] - np.median(values)) < 0.05
+
+
+@pytest.mark.filterwarnings("ignore::RuntimeWarning")
+def test_dask_streaming_stat(stack):
+    DataArray = xr.DataArray(stack, dims=("time", "y", "x")).chunk({"time": 4})
+    result = accumulators.dask_streaming_stat(DataArray, "mean")
+
+    assert result.name == "mean"
+    assert result.dims == ("y", "x")
+    np.testing.assert_allclose(result.values, np.nanmean(stack, axis=0))
+
+    with pytest.raises(ValueError):
+        accumulators.dask_streaming_stat(DataArray, "mode")
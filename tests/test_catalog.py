@@ -0,0 +1,178 @@
+import os
+import sqlite3
+
+import numpy as np
+import pandas as pd
+import pytest
+import rasterio
+import rasterio.warp
+from rasterio.crs import CRS
+from rasterio.transform import from_origin
+
+from gtsa import catalog, io
+
+
+def _write_geotif(file_name, crs="EPSG:32610", origin=(600000, 5300000)):
+    profile = {
+        "driver": "GTiff",
+        "width": 40,
+        "height": 30,
+        "count": 1,
+        "dtype": "float32",
+        "crs": crs,
+        "transform": from_origin(*origin, 10, 10),
+        "nodata": -9999,
+    }
+    with rasterio.open(file_name, "w", **profile) as dst:
+        dst.write(np.ones((1, 30, 40), dtype="float32"))
+    return file_name
+
+
+@pytest.fixture
+def geotifs(tmp_path):
+    directory = tmp_path / "dems"
+    directory.mkdir()
+    return [
+        _write_geotif(directory / f"dem_{date}_1m.tif")
+        for date in ["20160801", "20150801", "20170801"]
+    ] + [_write_geotif(directory / "reference.tif")]
+
+
+def test_parse_datetimes_matches_list_geotifs(geotifs):
+    files, datetimes = io.list_geotifs_with_timestamps(geotifs[0].parent)
+    df = catalog.update_catalog(geotifs, date_string_format="%Y%m%d")
+    df = df.dropna(subset=["timestamp"]).sort_values("timestamp")
+
+    # files without a date string are skipped by both
+    assert len(files) == 3
+    assert df["path"].tolist() == files
+    assert df["timestamp"].tolist() == datetimes
+    assert datetimes[0] == pd.Timestamp("2015-08-01")
+
+
+def test_parse_datetimes():
+    files = ["dem_20150801_1m.tif", "dem_2015080_1m.tif", "dem_20151301_1m.tif"]
+    assert io.parse_datetimes(files) == [pd.Timestamp("2015-08-01"), None, None]
+    assert io.parse_datetimes(["2015-08-01.tif"], "%Y-%m-%d", "....-..-..", 0) == [
+        pd.Timestamp("2015-08-01")
+    ]
+
+
+def test_rescan_modified_files(geotifs, tmp_path, monkeypatch):
+    catalog_file = tmp_path / "catalog.sqlite"
+    catalog.update_catalog(geotifs, catalog_file=catalog_file, workers=1)
+
+    scanned = []
+    scan_records = catalog._scan_records
+
+    def recording_scan_records(files, workers=None):
+        scanned.extend(files)
+        return scan_records(files, workers=workers)
+
+    monkeypatch.setattr(catalog, "_scan_records", recording_scan_records)
+    df = catalog.update_catalog(geotifs, catalog_file=catalog_file, workers=1)
+    assert scanned == []
+    assert df["path"].tolist() == [str(i) for i in geotifs]
+
+    _write_geotif(geotifs[0], origin=(600100, 5300000))
+    os.utime(geotifs[0], ns=(0, 0))
+    df = catalog.update_catalog(geotifs, catalog_file=catalog_file, workers=1)
+    assert scanned == [str(geotifs[0])]
+    assert df.loc[0, "xmin"] == 600100
+
+
+def test_common_crs():
+    crs = CRS.from_epsg(32610)
+    df = pd.DataFrame(
+        {
+            # same crs with differently formatted WKT
+            "crs": [crs.to_wkt(), crs.to_wkt("WKT2_2019")],
+            "epsg": [32610, 32610],
+            "path": ["a.tif", "b.tif"],
+        }
+    )
+    assert catalog.common_crs(df, verbose=False)
+
+    df.loc[1, ["crs", "epsg"]] = [CRS.from_epsg(32611).to_wkt(), 32611]
+    assert not catalog.common_crs(df, verbose=False)
+
+    # without EPSG codes, CRS are compared as objects
+    custom = CRS.from_proj4("+proj=aeqd +lat_0=46 +lon_0=-121 +datum=WGS84")
+    df["crs"] = [custom.to_wkt(), custom.to_wkt("WKT2_2019")]
+    df["epsg"] = [None, None]
+    assert catalog.common_crs(df, verbose=False)
+
+
+def test_migrate_old_catalog(geotifs, tmp_path):
+    catalog_file = tmp_path / "catalog.sqlite"
+    old_columns = {k: v for k, v in catalog.CATALOG_COLUMNS.items() if k != "overviews"}
+    record = catalog.scan_geotif(str(geotifs[0]))
+    connection = sqlite3.connect(str(catalog_file))
+    columns = ", ".join(f'"{k}" {v}' for k, v in old_columns.items())
+    connection.execute(f"CREATE TABLE {catalog.CATALOG_TABLE} ({columns})")
+    placeholders = ", ".join("?" for _ in old_columns)
+    connection.execute(
+        f"INSERT INTO {catalog.CATALOG_TABLE} VALUES ({placeholders})",
+        tuple(record[k] for k in old_columns),
+    )
+    connection.commit()
+    connection.close()
+
+    df = catalog.update_catalog(geotifs, catalog_file=catalog_file, workers=1)
+
+    assert sorted(df.columns) == sorted(catalog.CATALOG_COLUMNS)
+    # the existing entry is kept, new entries are inserted with all columns
+    assert np.isnan(df.loc[0, "overviews"])
+    assert (df.loc[1:, "overviews"] == 0).all()
+    assert (df["xmin"] == 600000).all()
+
+
+def test_lonlat_bounds(tmp_path):
+    utm = _write_geotif(tmp_path / "utm.tif")
+    lonlat = tmp_path / "lonlat.tif"
+    with rasterio.open(utm) as src:
+        profile = src.profile
+    profile.update(crs="EPSG:4326", transform=from_origin(-120.0, 48.0, 0.01, 0.01))
+    with rasterio.open(lonlat, "w", **profile) as dst:
+        dst.write(np.ones((1, 30, 40), dtype="float32"))
+
+    df = catalog.update_catalog([utm, lonlat], workers=1)
+    xmin, xmax, ymin, ymax = catalog.lonlat_bounds(df)
+    expected = rasterio.warp.transform_bounds(
+        "EPSG:32610", "EPSG:4326", 600000, 5299700, 600400, 5300000
+    )
+
+    # the UTM file west of -120 E and the lonlat file span the bounds
+    assert xmin == pytest.approx(expected[0])
+    assert ymin == pytest.approx(47.7)
+    assert xmax == pytest.approx(-119.6)
+    assert ymax == pytest.approx(48.0)
+    assert catalog.lonlat_centroid(df) == pytest.approx(
+        ((xmin + xmax) / 2, (ymin + ymax) / 2)
+    )
+
+    # bounds of a single file in EPSG:4326 are unchanged
+    assert catalog.lonlat_bounds(df.iloc[[1]]) == pytest.approx(
+        (-120.0, -119.6, 47.7, 48.0)
+    )
+
+
+def test_plot_cog_metadata_cache(geotifs, tmp_path, monkeypatch):
+    folium = pytest.importorskip("folium")
+    from gtsa import plotting
+
+    catalog_file = tmp_path / "catalog.sqlite"
+    m = plotting.plot_cog(str(geotifs[0]), catalog_file=catalog_file, draw=False)
+    assert isinstance(m, folium.Map)
+    df = catalog.read_catalog(catalog_file)
+    assert df["path"].tolist() == [str(geotifs[0])]
+    lon, lat = catalog.lonlat_centroid(df)
+    assert m.location == pytest.approx([lat, lon])
+
+    # the cached metadata are used for the next map
+    def failing_scan_records(files, workers=None):
+        raise AssertionError(f"rescanned {files}")
+
+    monkeypatch.setattr(catalog, "_scan_records", failing_scan_records)
+    m = plotting.plot_cog(str(geotifs[0]), catalog_file=catalog_file, draw=False)
+    assert m.location == pytest.approx([lat, lon])
@@ -0,0 +1,79 @@
+import numpy as np
+import pytest
+import rasterio
+import xarray as xr
+from rasterio.transform import from_origin
+
+from gtsa import io, utils
+
+
+@pytest.fixture
+def zarr_file(tmp_path):
+    rng = np.random.default_rng(0)
+    data = rng.normal(1000, 50, size=(2, 300, 200))
+    data[:, :20, :30] = np.nan
+    times = [
+        utils.date_time_to_decyear(i)
+        for i in [
+            np.datetime64("2012-06-01", "s").item(),
+            np.datetime64("2016-01-15", "s").item(),
+        ]
+    ]
+    ds = xr.Dataset(
+        {"band1": (("time", "y", "x"), data)},
+        coords={
+            "time": times,
+            "y": 5300000 - 10 * (np.arange(300) + 0.5),
+            "x": 600000 + 10 * (np.arange(200) + 0.5),
+        },
+    )
+    # as written by gtsa
+    ds.attrs["crs"] = "EPSG:32610"
+    file_name = tmp_path / "stack.zarr"
+    ds.chunk({"time": 1, "y": 100, "x": 100}).to_zarr(file_name)
+    return file_name, data
+
+
+def test_write_cog(tmp_path):
+    data = np.arange(300 * 200, dtype="float32").reshape(300, 200)
+    data[:5, :5] = np.nan
+    DataArray = xr.DataArray(
+        data,
+        dims=("y", "x"),
+        coords={
+            "y": 5300000 - 10 * (np.arange(300) + 0.5),
+            "x": 600000 + 10 * (np.arange(200) + 0.5),
+        },
+    ).chunk(70)
+    output_file = io.write_cog(
+        DataArray, tmp_path / "cog.tif", crs="EPSG:32610", blocksize=64, batch_size=3
+    )
+
+    with rasterio.open(output_file) as src:
+        assert src.crs.to_epsg() == 32610
+        assert src.transform == from_origin(600000, 5300000, 10, 10)
+        assert src.block_shapes[0] == (64, 64)
+        assert src.overviews(1) == [2, 4, 8]
+        result = src.read(1, masked=True)
+    np.testing.assert_array_equal(result.mask, np.isnan(data))
+    np.testing.assert_array_equal(result.compressed(), data[np.isfinite(data)])
+    assert not list(tmp_path.glob("*.tmp.tif"))
+
+
+def test_export_cogs_time_labels(zarr_file, tmp_path):
+    file_name, data = zarr_file
+    outputs = io.export_cogs(file_name, tmp_path / "cogs", verbose=False)
+
+    assert [i.rsplit("/", 1)[1] for i in outputs] == [
+        "stack_band1_20120601.tif",
+        "stack_band1_20160115.tif",
+    ]
+    for output_file, expected in zip(outputs, data):
+        with rasterio.open(output_file) as src:
+            np.testing.assert_allclose(
+                src.read(1, masked=True).filled(np.nan), expected, rtol=1e-6
+            )
+
+    outputs = io.export_cogs(file_name, tmp_path / "bands", bands=True, verbose=False)
+    with rasterio.open(outputs[0]) as src:
+        assert src.descriptions == ("20120601", "20160115")
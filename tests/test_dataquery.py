@@ -0,0 +1,220 @@
+import hashlib
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import numpy as np
+import pytest
+import requests
+
+from gtsa import dataquery
+
+DATA = np.random.default_rng(0).bytes(300_000)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """
+    Serves DATA with byte range support. Behavior is set on the server object.
+    """
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        header = self.headers.get("Range")
+        server.ranges.append(header)
+        if server.ignore_ranges or (
+            server.ignore_segment_ranges and header != "bytes=0-0"
+        ):
+            header = None
+        start, stop = 0, len(DATA)
+        if header:
+            first, last = header.split("=")[1].split("-")
+            start = int(first)
+            stop = int(last) + 1 if last else len(DATA)
+            if start >= len(DATA):
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{len(DATA)}")
+                self.end_headers()
+                return
+            if server.fail_segments and header != "bytes=0-0":
+                self.send_response(404)
+                self.end_headers()
+                return
+        self.send_response(206 if header else 200)
+        if header:
+            self.send_header("Content-Range", f"bytes {start}-{stop - 1}/{len(DATA)}")
+        if server.content_length:
+            self.send_header("Content-Length", str(stop - start))
+        self.end_headers()
+        body = DATA[start:stop]
+        if server.interrupt:
+            # drop the connection half way through the first response
+            server.interrupt = False
+            body = body[: len(body) // 2]
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    httpd.ranges = []
+    httpd.interrupt = False
+    httpd.fail_segments = False
+    httpd.ignore_ranges = False
+    httpd.ignore_segment_ranges = False
+    httpd.content_length = True
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    httpd.url = f"http://127.0.0.1:{httpd.server_port}/data.bin"
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def _download(server, out, checksum=None, segment_size=None):
+    payload = (server.url, out, checksum) if checksum else (server.url, out)
+    session = dataquery.create_session(retries=0)
+    return dataquery.download_data(
+        payload, session=session, chunk_size=10_000, segment_size=segment_size
+    )
+
+
+def test_resume_partial_download(server, tmp_path):
+    out = Path(tmp_path, "data.bin")
+    Path(str(out) + ".part").write_bytes(DATA[:1000])
+
+    _download(server, out)
+
+    assert out.read_bytes() == DATA
+    assert server.ranges == ["bytes=1000-"]
+    assert not Path(str(out) + ".part").exists()
+
+
+def test_resume_interrupted_download(server, tmp_path):
+    out = Path(tmp_path, "data.bin")
+    server.interrupt = True
+
+    _download(server, out)
+
+    assert out.read_bytes() == DATA
+    assert server.ranges[0] is None
+    assert server.ranges[1] == f"bytes={len(DATA) // 2}-"
+
+
+def test_complete_part_file(server, tmp_path):
+    out = Path(tmp_path, "data.bin")
+    Path(str(out) + ".part").write_bytes(DATA)
+
+    _download(server, out)
+
+    assert out.read_bytes() == DATA
+    assert server.ranges == [f"bytes={len(DATA)}-"]
+
+
+def test_stale_part_file(server, tmp_path):
+    out = Path(tmp_path, "data.bin")
+    Path(str(out) + ".part").write_bytes(bytes(len(DATA) + 10))
+
+    _download(server, out)
+
+    assert out.read_bytes() == DATA
+    assert server.ranges == [f"bytes={len(DATA) + 10}-", None]
+
+
+def test_checksum_mismatch(server, tmp_path):
+    out = Path(tmp_path, "data.bin")
+
+    with pytest.raises(ValueError):
+        _download(server, out, checksum="md5:" + "0" * 32)
+
+    assert not out.exists()
+    assert not Path(str(out) + ".part").exists()
+
+
+def test_checksum_match(server, tmp_path):
+    out = Path(tmp_path, "data.bin")
+
+    _download(server, out, checksum="md5:" + hashlib.md5(DATA).hexdigest())
+
+    assert out.read_bytes() == DATA
+
+
+def test_resume_segmented_download(server, tmp_path):
+    out = Path(tmp_path, "data.bin")
+    server.fail_segments = True
+
+    with pytest.raises(requests.HTTPError):
+        _download(server, out, segment_size=50_000)
+
+    # the preallocated part file is recorded, so it is not mistaken for a partial stream
+    assert Path(str(out) + ".part.json").exists()
+
+    server.fail_segments = False
+    _download(server, out, segment_size=50_000)
+
+    assert out.read_bytes() == DATA
+    assert not Path(str(out) + ".part.json").exists()
+
+
+def test_stream_after_failed_segmented_download(server, tmp_path):
+    out = Path(tmp_path, "data.bin")
+    server.fail_segments = True
+
+    with pytest.raises(requests.HTTPError):
+        _download(server, out, segment_size=50_000)
+
+    server.fail_segments = False
+    _download(server, out)
+
+    assert out.read_bytes() == DATA
+
+
+def test_segmented_download(server, tmp_path):
+    out = Path(tmp_path, "data.bin")
+
+    _download(server, out, segment_size=50_000)
+
+    assert out.read_bytes() == DATA
+    assert not Path(str(out) + ".part").exists()
+    assert not Path(str(out) + ".part.json").exists()
+    # the size is probed with the first byte, then each segment is requested once
+    assert server.ranges[0] == "bytes=0-0"
+    assert sorted(server.ranges[1:], key=lambda r: int(r[6:].split("-")[0])) == [
+        f"bytes={i}-{i + 49_999}" for i in range(0, len(DATA), 50_000)
+    ]
+
+
+def test_stream_small_file(server, tmp_path):
+    out = Path(tmp_path, "data.bin")
+
+    # files up to two segments are streamed
+    _download(server, out, segment_size=len(DATA) // 2)
+
+    assert out.read_bytes() == DATA
+    assert server.ranges == ["bytes=0-0", None]
+
+
+@pytest.mark.parametrize("content_length", [True, False])
+def test_stream_without_range_support(server, tmp_path, content_length):
+    out = Path(tmp_path, "data.bin")
+    server.ignore_ranges = True
+    server.content_length = content_length
+
+    _download(server, out, segment_size=50_000)
+
+    assert out.read_bytes() == DATA
+    assert server.ranges == ["bytes=0-0", None]
+
+
+def test_stream_when_segment_ranges_ignored(server, tmp_path):
+    out = Path(tmp_path, "data.bin")
+    server.ignore_segment_ranges = True
+
+    _download(server, out, segment_size=50_000)
+
+    # the preallocated part file is discarded and the file streamed from the start
+    assert out.read_bytes() == DATA
+    assert server.ranges[-1] is None
+    assert not Path(str(out) + ".part.json").exists()
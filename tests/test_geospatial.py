@@ -0,0 +1,139 @@
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+from shapely.geometry import Polygon, box
+
+from gtsa import geospatial
+
+HEIGHT, WIDTH = 40, 50
+
+
+@pytest.fixture
+def ds():
+    rng = np.random.default_rng(0)
+    data = rng.normal(1500, 20, size=(3, HEIGHT, WIDTH))
+    ds = xr.Dataset(
+        {"band1": (("time", "y", "x"), data)},
+        coords={
+            "time": np.arange(3),
+            "y": 5300000 - 10 * (np.arange(HEIGHT) + 0.5),
+            "x": 600000 + 10 * (np.arange(WIDTH) + 0.5),
+        },
+    )
+    return ds.rio.write_crs("EPSG:32610")
+
+
+@pytest.fixture
+def gdf():
+    return gpd.GeoDataFrame(
+        geometry=[
+            Polygon([(600050, 5299950), (600250, 5299900), (600120, 5299700)]),
+            box(600300, 5299800, 600420, 5299720),
+        ],
+        crs="EPSG:32610",
+    )
+
+
+@pytest.mark.parametrize("chunks", [None, {"y": 16, "x": 16}])
+def test_clip_to_geometry(ds, gdf, chunks, tmp_path):
+    source = ds.chunk(chunks) if chunks else ds
+    result = geospatial.clip_to_geometry(
+        source, gdf, cache_dir=tmp_path, verbose=False
+    ).compute()
+    expected = ds.rio.clip(gdf.geometry, drop=False)
+
+    # cropped to the extent of the rasterized geometries
+    cropped = expected.sel(x=result["x"], y=result["y"])
+    xr.testing.assert_equal(result["band1"], cropped["band1"])
+    assert expected["band1"].count() == result["band1"].count()
+    for edge in [result["band1"][0, 0], result["band1"][0, -1]]:
+        assert edge.notnull().any()
+    for edge in [result["band1"][0, :, 0], result["band1"][0, :, -1]]:
+        assert edge.notnull().any()
+    assert list(tmp_path.glob("*.npy"))
+
+
+@pytest.mark.parametrize("chunks", [None, {"y": 16, "x": 16}])
+def test_clip_to_geometry_invert(ds, gdf, chunks):
+    source = ds.chunk(chunks) if chunks else ds
+    result = geospatial.clip_to_geometry(source, gdf, invert=True, verbose=False)
+    expected = ds.rio.clip(gdf.geometry, drop=False, invert=True)
+
+    xr.testing.assert_equal(result["band1"].compute(), expected["band1"])
+
+
+def test_clip_to_geometry_outside(ds):
+    gdf = gpd.GeoDataFrame(geometry=[box(0, 0, 10, 10)], crs="EPSG:32610")
+    with pytest.raises(ValueError):
+        geospatial.clip_to_geometry(ds, gdf, verbose=False)
+
+
+def test_prune_blocks(ds, gdf):
+    keep = geospatial.rasterize_geometry_mask(gdf, ds, verbose=False)
+    reads = []
+
+    def read(block, block_info=None):
+        reads.append(block_info[0]["chunk-location"])
+        return block
+
+    data = ds["band1"].chunk({"y": 16, "x": 16}).data
+    data = data.map_blocks(read, meta=np.array((), dtype=data.dtype))
+    pruned = geospatial._prune_blocks(data, keep, 1, 2)
+
+    np.testing.assert_array_equal(
+        pruned.compute(), np.where(keep, ds["band1"].values, np.nan)
+    )
+    # chunks without geometries are never read
+    intersecting = geospatial._block_any(keep, data.chunks[1], data.chunks[2])
+    assert not intersecting.all()
+    assert sorted(i[1:] for i in reads) == [tuple(i) for i in np.argwhere(intersecting)]
+
+
+@pytest.fixture
+def points(ds):
+    rng = np.random.default_rng(1)
+    df = pd.DataFrame(
+        {
+            "x": 600000 + rng.uniform(-20, 520, 60),
+            "y": 5300000 - rng.uniform(-20, 420, 60),
+        }
+    )
+    df["name"] = [f"p{i}" for i in range(len(df))]
+    return df
+
+
+@pytest.mark.parametrize("chunks", [None, {"y": 16, "x": 16}])
+def test_extract_point_timeseries_nearest(ds, points, chunks):
+    DataArray = ds["band1"].chunk(chunks) if chunks else ds["band1"]
+    df = geospatial.extract_point_timeseries(
+        DataArray, points, x="x", y="y", crs="EPSG:32610", id_column="name"
+    )
+
+    inside = points["x"].between(600000, 600500) & points["y"].between(5299600, 5300000)
+    assert set(df["name"]) == set(points.loc[inside, "name"])
+    assert len(df) == 3 * inside.sum()
+    for row in df.itertuples():
+        expected = (
+            ds["band1"].sel(time=row.time).sel(x=row.x, y=row.y, method="nearest")
+        )
+        assert row.value == expected.item()
+
+
+def test_extract_point_timeseries_bilinear(ds, points):
+    df = geospatial.extract_point_timeseries(
+        ds["band1"].chunk({"y": 16, "x": 16}),
+        points,
+        x="x",
+        y="y",
+        crs="EPSG:32610",
+        method="bilinear",
+    )
+    # interpolation between pixel centers, nearest edge values beyond them
+    interp = ds["band1"].interp(
+        x=xr.DataArray(df["x"].clip(600005, 600495)),
+        y=xr.DataArray(df["y"].clip(5299605, 5299995)),
+        time=xr.DataArray(df["time"]),
+    )
+    np.testing.assert_allclose(df["value"], interp.values)
@@ -0,0 +1,99 @@
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+import zarr
+
+from gtsa import io
+
+HEIGHT, WIDTH, CHUNK = 60, 80, 20
+
+
+@pytest.fixture
+def zarr_stack_file(tmp_path):
+    ds = xr.Dataset(
+        {"band1": (("time", "y", "x"), np.zeros((2, HEIGHT, WIDTH)))},
+        coords={
+            "time": pd.to_datetime(["2015-01-01", "2016-01-01"]),
+            "y": 5300000 - 10 * (np.arange(HEIGHT) + 0.5),
+            "x": 600000 + 10 * (np.arange(WIDTH) + 0.5),
+        },
+        attrs={"crs": "EPSG:32610"},
+    )
+    file_name = tmp_path / "stack.zarr"
+    ds.chunk({"time": 1, "y": CHUNK, "x": CHUNK}).to_zarr(file_name)
+    return file_name
+
+
+@pytest.fixture
+def points_file(tmp_path):
+    rng = np.random.default_rng(0)
+    n = 1000
+    df = pd.DataFrame(
+        {
+            # two of the 12 chunks, and points outside of the stack
+            "x": 600000 + rng.uniform(-50, 350, n),
+            "y": 5300000 - rng.uniform(-50, 150, n),
+            "h": rng.normal(1500, 30, n),
+            "time": rng.choice(
+                pd.to_datetime(
+                    ["2018-08-01 10:00", "2018-08-01 22:00", "2019-07-15 09:00"]
+                ),
+                n,
+            ),
+        }
+    )
+    df.loc[::50, "h"] = np.nan
+    file_name = tmp_path / "points.csv"
+    df.to_csv(file_name, index=False)
+    return file_name, df
+
+
+def test_ingest_points_matches_groupby(zarr_stack_file, points_file):
+    file_name, df = points_file
+    result = io.ingest_points(
+        file_name,
+        zarr_stack_file,
+        x="x",
+        y="y",
+        crs="EPSG:32610",
+        chunksize=97,
+        verbose=False,
+    ).compute()
+
+    df = df.dropna()
+    df["row"] = np.floor((5300000 - df["y"]) / 10).astype(int)
+    df["col"] = np.floor((df["x"] - 600000) / 10).astype(int)
+    df = df[df["row"].between(0, HEIGHT - 1) & df["col"].between(0, WIDTH - 1)]
+    df["time"] = pd.to_datetime(df["time"]).dt.floor("D")
+    expected = df.groupby(["time", "row", "col"])["h"].agg(["median", "count"])
+    assert expected["count"].max() <= 16  # sketches are exact
+
+    times = result["points_time"].values
+    np.testing.assert_array_equal(times, np.unique(df["time"].values))
+    median = np.full((len(times), HEIGHT, WIDTH), np.nan)
+    count = np.zeros((len(times), HEIGHT, WIDTH))
+    index = (
+        np.searchsorted(times, expected.index.get_level_values("time").values),
+        expected.index.get_level_values("row"),
+        expected.index.get_level_values("col"),
+    )
+    median[index] = expected["median"]
+    count[index] = expected["count"]
+
+    np.testing.assert_allclose(result["points_median"].values, median)
+    np.testing.assert_array_equal(result["points_count"].values, count)
+
+
+def test_ingest_points_writes_touched_chunks(zarr_stack_file, points_file):
+    file_name, df = points_file
+    # zarr skips chunks of fill values by default, so count every chunk written
+    with zarr.config.set({"array.write_empty_chunks": True}):
+        io.ingest_points(
+            file_name, zarr_stack_file, x="x", y="y", crs="EPSG:32610", verbose=False
+        )
+    for name in ["points_median", "points_count"]:
+        chunks = [i for i in (zarr_stack_file / name).rglob("*") if i.is_file()]
+        chunks = [i for i in chunks if not i.name.startswith((".z", "zarr.json"))]
+        # two time slices with two chunks each
+        assert len(chunks) == 4
@@ -0,0 +1,119 @@
+import datetime
+import multiprocessing
+from functools import partial
+from http.server import ThreadingHTTPServer
+
+import numpy as np
+import pytest
+import rasterio
+import rasterio.shutil
+from rasterio.io import MemoryFile
+from rasterio.transform import from_origin
+
+from gtsa import io
+
+from .test_tileserver import _RangeRequestHandler
+
+PREDICTORS = {1: "NO", 2: "STANDARD", 3: "FLOATING_POINT"}
+TIMES = [datetime.datetime(2010 + i, 6, 1) for i in range(3)]
+
+
+@pytest.fixture
+def file_server(tmp_path):
+    """
+    Serves tmp_path from a separate process, so GDAL can block while reading.
+    """
+    pytest.importorskip("aiohttp")
+    handler = partial(_RangeRequestHandler, directory=str(tmp_path))
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    process = multiprocessing.get_context("fork").Process(
+        target=httpd.serve_forever, daemon=True
+    )
+    process.start()
+    httpd.server_close()
+    yield f"http://127.0.0.1:{httpd.server_port}"
+    process.terminate()
+    process.join()
+
+
+def _write_cogs(directory, dtype, predictor, nodata):
+    """
+    Writes one COG per time stamp on a 200 x 300 grid with 128 pixel tiles.
+    """
+    rng = np.random.default_rng(predictor)
+    profile = {
+        "driver": "GTiff",
+        "width": 300,
+        "height": 200,
+        "count": 1,
+        "dtype": dtype,
+        "crs": "EPSG:32610",
+        "transform": from_origin(600000, 5300000, 10, 10),
+        "nodata": nodata,
+    }
+    file_names = []
+    for i, _ in enumerate(TIMES):
+        data = (rng.random((200, 300)) * 2000 - 500).astype(dtype)
+        data[rng.random(data.shape) < 0.1] = nodata
+        data[:128, :128] = nodata  # empty tile
+        file_name = directory / f"dem_{i}.tif"
+        with MemoryFile() as memfile:
+            with memfile.open(**profile) as dst:
+                dst.write(data, 1)
+            rasterio.shutil.copy(
+                memfile.name,
+                file_name,
+                driver="COG",
+                BLOCKSIZE=128,
+                COMPRESS="DEFLATE",
+                PREDICTOR=PREDICTORS[predictor],
+                SPARSE_OK=True,
+            )
+        file_names.append(file_name)
+    return file_names
+
+
+@pytest.mark.parametrize(
+    "dtype, predictor, nodata",
+    [("float32", 1, -9999), ("int16", 2, -9999), ("float32", 3, -9999)],
+)
+def test_reference_stack_over_http(tmp_path, file_server, dtype, predictor, nodata):
+    file_names = _write_cogs(tmp_path, dtype, predictor, nodata)
+    with rasterio.open(file_names[0]) as src:
+        assert src.tags(ns="IMAGE_STRUCTURE").get("PREDICTOR", "1") == str(predictor)
+
+    urls = [f"{file_server}/{i.name}" for i in file_names]
+    index = io.create_reference_index(
+        urls, TIMES, file_names[0], output_file=tmp_path / "stack.json", verbose=False
+    )
+    ds = io.open_reference_stack(index).compute()
+
+    expected = io.xr_stack_geotifs(
+        file_names, TIMES, file_names[0], resampling="nearest", verbose=False
+    ).compute()
+
+    assert ds.rio.crs == expected.rio.crs
+    np.testing.assert_array_equal(ds["time"], expected["time"])
+    np.testing.assert_allclose(ds["x"], expected["x"])
+    np.testing.assert_allclose(ds["y"], expected["y"])
+    np.testing.assert_array_equal(ds["band1"].values, expected["band1"].values)
+    assert np.isnan(ds["band1"].values[:, :64, :64]).all()
+
+
+def test_reference_index_rejects_other_grids(tmp_path):
+    file_names = _write_cogs(tmp_path, "float32", 1, -9999)
+    other = tmp_path / "other.tif"
+    with rasterio.open(file_names[0]) as src:
+        profile = src.profile
+        profile["transform"] = from_origin(600010, 5300000, 10, 10)
+        with rasterio.open(other, "w", **profile) as dst:
+            dst.write(src.read())
+
+    with pytest.raises(ValueError):
+        io.create_reference_index(
+            [file_names[0], other],
+            TIMES[:2],
+            file_names[0],
+            output_file=tmp_path / "stack.json",
+            verbose=False,
+        )
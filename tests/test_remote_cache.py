@@ -0,0 +1,176 @@
+import uuid
+
+import fsspec
+import numpy as np
+import pytest
+import rasterio
+import xarray as xr
+from rasterio.io import MemoryFile
+from rasterio.transform import from_origin
+
+from gtsa import io
+
+DATA = np.random.default_rng(0).bytes(10_000)
+BLOCK_SIZE = 1024
+
+
+class _CountingFileSystem:
+    """
+    Counts calls to the in-memory filesystem shared by all memory:// URLs.
+    """
+
+    def __init__(self, monkeypatch):
+        self.fs = fsspec.filesystem("memory")
+        self.calls = 0
+        for name in ["cat_ranges", "size"]:
+            monkeypatch.setattr(self.fs, name, self._count(getattr(self.fs, name)))
+
+    def _count(self, func):
+        def wrapper(*args, **kwargs):
+            self.calls += 1
+            return func(*args, **kwargs)
+
+        return wrapper
+
+
+@pytest.fixture
+def url():
+    url = f"memory://gtsa-tests/{uuid.uuid4().hex}"
+    fs = fsspec.filesystem("memory")
+    fs.pipe(f"{url}/data.bin", DATA)
+    yield url
+    fs.rm(url, recursive=True)
+
+
+@pytest.fixture
+def remote_cache():
+    yield io.configure_remote_cache(memory_size=64)
+    xr.backends.file_manager.FILE_CACHE.clear()
+    io.configure_remote_cache()
+
+
+def test_is_remote():
+    assert io.is_remote("s3://bucket/stack.zarr")
+    assert io.is_remote("memory://stack.zarr")
+    assert not io.is_remote("file:///tmp/stack.zarr")
+    assert not io.is_remote("data/stack.zarr")
+
+
+def test_read_across_blocks(url):
+    cache = io.RemoteCache(block_size=BLOCK_SIZE)
+    file_name = f"{url}/data.bin"
+    for start, stop in [(0, 10), (1000, 3000), (9000, 20_000), (5000, 5000)]:
+        assert cache.read(file_name, start, stop) == DATA[start:stop]
+
+
+def test_cache_hits(url, monkeypatch):
+    counter = _CountingFileSystem(monkeypatch)
+    cache = io.RemoteCache(block_size=BLOCK_SIZE)
+    file_name = f"{url}/data.bin"
+
+    cache.read(file_name, 0, len(DATA))
+    calls = counter.calls
+    assert calls > 0
+
+    assert cache.read(file_name, 500, 7000) == DATA[500:7000]
+    assert counter.calls == calls
+
+
+def test_memory_eviction(url):
+    cache = io.RemoteCache(memory_size=3 * BLOCK_SIZE / 2**20, block_size=BLOCK_SIZE)
+    file_name = f"{url}/data.bin"
+
+    cache.read(file_name, 0, len(DATA))
+
+    assert cache._memory_bytes <= 3 * BLOCK_SIZE
+    # least recently used blocks are evicted first
+    assert (file_name, 0) not in cache._memory
+    assert (file_name, len(DATA) // BLOCK_SIZE) in cache._memory
+
+
+def test_disk_cache(url, tmp_path, monkeypatch):
+    file_name = f"{url}/data.bin"
+    io.RemoteCache(cache_dir=tmp_path, block_size=BLOCK_SIZE).read(
+        file_name, 0, len(DATA)
+    )
+
+    counter = _CountingFileSystem(monkeypatch)
+    cache = io.RemoteCache(cache_dir=tmp_path, block_size=BLOCK_SIZE)
+    assert cache.read(file_name, 0, len(DATA)) == DATA
+    assert counter.calls == 0
+
+
+def test_disk_eviction(url, tmp_path):
+    disk_size = 4 * BLOCK_SIZE
+    cache = io.RemoteCache(
+        cache_dir=tmp_path, disk_size=disk_size / 2**20, block_size=BLOCK_SIZE
+    )
+
+    assert cache.read(f"{url}/data.bin", 0, len(DATA)) == DATA
+
+    total = sum(i.stat().st_size for i in tmp_path.rglob("*") if i.is_file())
+    assert total <= disk_size
+
+
+def test_missing_file(url, monkeypatch):
+    counter = _CountingFileSystem(monkeypatch)
+    cache = io.RemoteCache(block_size=BLOCK_SIZE)
+
+    for _ in range(2):
+        with pytest.raises(FileNotFoundError):
+            cache.open(f"{url}/missing.tif")
+    assert counter.calls == 1
+
+
+def test_remote_file(url):
+    cache = io.RemoteCache(block_size=BLOCK_SIZE)
+    with cache.open(f"{url}/data.bin") as f:
+        f.seek(2000)
+        assert f.read(100) == DATA[2000:2100]
+        f.seek(-10, 2)
+        assert f.read() == DATA[-10:]
+
+
+def test_read_geotif(url, remote_cache):
+    array = np.arange(64 * 48, dtype="float32").reshape(64, 48)
+    profile = {
+        "driver": "GTiff",
+        "width": 48,
+        "height": 64,
+        "count": 1,
+        "dtype": "float32",
+        "crs": "EPSG:32610",
+        "transform": from_origin(600000, 5300000, 10, 10),
+    }
+    with MemoryFile() as memfile:
+        with memfile.open(**profile) as dst:
+            dst.write(array, 1)
+        fsspec.filesystem("memory").pipe(f"{url}/dem.tif", memfile.read())
+
+    ds = io.xr_read_geotif(f"{url}/dem.tif")
+
+    np.testing.assert_array_equal(ds["band1"].values, array)
+    assert ds.rio.crs == rasterio.crs.CRS.from_epsg(32610)
+
+
+def test_zarr_chunks_read_through_cache(url, remote_cache):
+    fs = fsspec.filesystem("memory")
+    zarr_file = f"{url}/stack.zarr"
+    expected = xr.Dataset(
+        {"band1": (("time", "y", "x"), np.random.default_rng(1).random((3, 8, 8)))},
+        coords={"time": np.arange(3), "y": np.arange(8.0), "x": np.arange(8.0)},
+    ).chunk({"time": 1, "y": 4, "x": 4})
+    expected.to_zarr(zarr_file, zarr_format=3, consolidated=False)
+
+    ds = io.open_stack_level(zarr_file)
+    xr.testing.assert_equal(ds.compute(), expected.compute())
+    chunks = [i for i, key in remote_cache._memory if "/band1/c/" in i]
+    assert len(chunks) == 12
+
+    # chunks are served from the cache once read
+    removed = fs.find(f"{zarr_file}/band1/c")
+    assert len(removed) == 12
+    for i in removed:
+        fs.rm(i)
+    ds = io.open_stack_level(zarr_file)
+    xr.testing.assert_equal(ds.compute(), expected.compute())
@@ -0,0 +1,216 @@
+import datetime
+
+import numpy as np
+import pytest
+import rasterio
+import rasterio.warp
+from rasterio.transform import from_origin
+
+from gtsa import catalog, geospatial, io
+
+TIMES = [datetime.datetime(2015 + i, 8, 1) for i in range(3)]
+
+
+def _write_geotif(file_name, data, transform, crs="EPSG:32610", nodata=-9999):
+    profile = {
+        "driver": "GTiff",
+        "width": data.shape[1],
+        "height": data.shape[0],
+        "count": 1,
+        "dtype": data.dtype,
+        "crs": crs,
+        "transform": transform,
+        "nodata": nodata,
+    }
+    with rasterio.open(file_name, "w", **profile) as dst:
+        dst.write(data, 1)
+    return file_name
+
+
+@pytest.fixture
+def dems(tmp_path):
+    """
+    DEMs on a reference grid, a shifted grid and a coarser grid.
+    """
+    rng = np.random.default_rng(0)
+    transforms = [
+        from_origin(600000, 5300000, 10, 10),
+        from_origin(600030, 5299980, 10, 10),
+        from_origin(599990, 5300010, 20, 20),
+    ]
+    shapes = [(40, 50), (40, 50), (22, 27)]
+    file_names = []
+    for i, (transform, shape) in enumerate(zip(transforms, shapes)):
+        data = rng.normal(1500, 20, size=shape).astype("float32")
+        data[rng.random(shape) < 0.1] = -9999
+        file_names.append(_write_geotif(tmp_path / f"dem_{i}.tif", data, transform))
+    return file_names
+
+
+@pytest.mark.parametrize("chunks", [512, (16, 20)])
+def test_virtual_stack_matches_xr_stack_geotifs(dems, chunks):
+    # reversed, so that sorting by time is tested
+    ds = io.open_virtual_stack(
+        dems[::-1], TIMES[::-1], dems[0], resampling="nearest", chunks=chunks
+    )
+    expected = io.xr_stack_geotifs(
+        dems, TIMES, dems[0], resampling="nearest", verbose=False
+    ).compute()
+
+    assert ds.rio.crs == expected.rio.crs
+    assert ds.rio.transform() == expected.rio.transform()
+    np.testing.assert_array_equal(ds["time"], expected["time"])
+    np.testing.assert_allclose(ds["x"], expected["x"])
+    np.testing.assert_allclose(ds["y"], expected["y"])
+    np.testing.assert_array_equal(ds["band1"].values, expected["band1"].values)
+    # the shifted DEM leaves part of the reference grid empty
+    assert np.isnan(ds["band1"].values[1, :2]).all()
+
+
+def test_virtual_stack_cache(dems, monkeypatch):
+    ds = io.open_virtual_stack(dems, TIMES, dems[0], chunks=(16, 20))
+    reads = []
+    open_kwargs = io._open_kwargs
+
+    def recording_open_kwargs(file_name):
+        reads.append(file_name)
+        return open_kwargs(file_name)
+
+    io.VIRTUAL_BLOCK_CACHE.clear()
+    monkeypatch.setattr(io, "_open_kwargs", recording_open_kwargs)
+    first = ds["band1"].values
+    assert len(reads) == 3 * 3 * 3
+    second = ds["band1"].values
+    assert len(reads) == 3 * 3 * 3
+    np.testing.assert_array_equal(first, second)
+
+
+@pytest.mark.parametrize("resampling", ["nearest", "bilinear"])
+def test_stack_bounds(dems, resampling):
+    bounds = (600105, 5299705, 600355, 5299905)
+    ds = io.xr_stack_geotifs(
+        dems, TIMES, dems[0], resampling=resampling, bounds=bounds, verbose=False
+    ).compute()
+    expected = io.xr_stack_geotifs(
+        dems, TIMES, dems[0], resampling=resampling, verbose=False
+    ).compute()
+    expected = expected.rio.clip_box(*bounds)
+
+    assert ds.sizes == expected.sizes
+    np.testing.assert_allclose(ds["x"], expected["x"])
+    np.testing.assert_allclose(ds["y"], expected["y"])
+    np.testing.assert_allclose(ds["band1"].values, expected["band1"].values)
+
+
+def test_query_footprints(dems, tmp_path):
+    # a DEM in another UTM zone, east of the others
+    utm11 = _write_geotif(
+        tmp_path / "dem_utm11.tif",
+        np.ones((10, 10), dtype="float32"),
+        from_origin(150000, 5300000, 10, 10),
+        crs="EPSG:32611",
+    )
+    df = catalog.update_catalog(dems + [utm11], workers=1)
+    assert not catalog.common_crs(df, verbose=False)
+
+    aoi = geospatial.bounds2polygon(600100, 5299700, 600120, 5299720, "EPSG:32610")
+    np.testing.assert_array_equal(
+        catalog.query_footprints(df, aoi), [True, True, True, False]
+    )
+    x, y = rasterio.warp.transform("EPSG:32611", "EPSG:4326", [150050], [5299950])
+    aoi = geospatial.bounds2polygon(
+        x[0] - 1e-4, y[0] - 1e-4, x[0] + 1e-4, y[0] + 1e-4, "EPSG:4326"
+    )
+    np.testing.assert_array_equal(
+        catalog.query_footprints(df, aoi), [False, False, False, True]
+    )
+
+
+@pytest.fixture
+def orthos(tmp_path):
+    """
+    8-bit orthoimages with nodata 0 on a reference grid and a shifted grid.
+    """
+    rng = np.random.default_rng(3)
+    transforms = [
+        from_origin(600000, 5300000, 10, 10),
+        from_origin(600020, 5299990, 10, 10),
+    ]
+    file_names = []
+    for i, transform in enumerate(transforms):
+        data = rng.integers(1, 256, size=(40, 50), dtype="uint8")
+        data[:5, :5] = 0
+        file_names.append(
+            _write_geotif(tmp_path / f"ortho_{i}.tif", data, transform, nodata=0)
+        )
+    return file_names
+
+
+@pytest.mark.parametrize("save_to_nc", [False, True])
+def test_native_dtype_stack(orthos, tmp_path, save_to_nc):
+    ds = io.xr_stack_geotifs(
+        orthos,
+        TIMES[:2],
+        orthos[0],
+        resampling="bilinear",
+        masked=False,
+        save_to_nc=save_to_nc,
+        nc_out_dir=tmp_path / "nc",
+        verbose=False,
+    )
+    assert ds["band1"].dtype == np.uint8
+
+    # 8-bit data are resampled with nearest neighbor
+    expected = io.xr_stack_geotifs(
+        orthos, TIMES[:2], orthos[0], resampling="nearest", verbose=False
+    )
+    values = ds["band1"].values
+    valid = np.isfinite(expected["band1"].values)
+    np.testing.assert_array_equal(values[valid], expected["band1"].values[valid])
+    assert (values[~valid] == 0).all()
+
+    stack = io.create_zarr_stack(ds, output_directory=tmp_path / "stack", verbose=False)
+    assert stack["band1"].dtype == np.uint8
+    np.testing.assert_array_equal(stack["band1"].values, values)
+
+
+@pytest.mark.filterwarnings("ignore::RuntimeWarning")
+@pytest.mark.parametrize("time_contiguous", [True, False])
+def test_pyramid_levels(dems, tmp_path, time_contiguous):
+    ds = io.xr_stack_geotifs(dems, TIMES, dems[0], verbose=False)
+    io.create_zarr_stack(
+        ds,
+        output_directory=tmp_path,
+        time_contiguous=time_contiguous,
+        pyramid_levels=2,
+        verbose=False,
+    )
+    full = io.open_stack_level(tmp_path / "stack.zarr")["band1"].values
+
+    for level in [1, 2, 3]:
+        factor = 2**level
+        result = io.open_stack_level(tmp_path / "stack.zarr", level=level)
+        expected = np.nanmean(
+            full[:, : 40 // factor * factor, : 50 // factor * factor].reshape(
+                3, 40 // factor, factor, 50 // factor, factor
+            ),
+            axis=(2, 4),
+        )
+        np.testing.assert_allclose(result["band1"].values, expected, rtol=1e-6)
+        np.testing.assert_allclose(
+            result["x"], ds["x"].coarsen(x=factor, boundary="trim").mean()
+        )
+    # level 3 is not stored and coarsened on the fly
+    pyramid = tmp_path / "stack.zarr" / "pyramid"
+    assert sorted(i.name for i in pyramid.iterdir() if i.is_dir()) == ["2", "4"]
+
+
+def test_coarsen_native_dtype(orthos):
+    ds = io.xr_stack_geotifs(orthos, TIMES[:2], orthos[0], masked=False, verbose=False)
+    coarse = io.coarsen_stack(ds, 2)
+
+    values = ds["band1"].values.astype(float)
+    values[values == 0] = np.nan
+    expected = np.nanmean(values.reshape(2, 20, 2, 25, 2), axis=(2, 4))
+    assert coarse["band1"].dtype == np.float32
+    np.testing.assert_allclose(coarse["band1"].values, expected, rtol=1e-6)
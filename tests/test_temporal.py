@@ -0,0 +1,176 @@
+import numpy as np
+import pytest
+import scipy.stats
+import xarray as xr
+
+from gtsa import accumulators, temporal
+
+
+@pytest.fixture
+def series():
+    rng = np.random.default_rng(0)
+    times = np.sort(rng.uniform(1950, 2020, 15))
+    values = 1200 - 0.5 * (times - 1950) + rng.normal(0, 2, size=(40, 15))
+    values[rng.random(values.shape) < 0.2] = np.nan
+    values[0] = np.nan  # pixel without data
+    return times, values
+
+
+def test_theilsen_matches_scipy(series):
+    times, values = series
+    coefficients, std = temporal.theilsen(values, times)
+
+    assert np.isnan(coefficients[0]).all()
+    for v, (slope, intercept) in zip(values[1:], coefficients[1:]):
+        valid = np.isfinite(v)
+        expected = scipy.stats.theilslopes(v[valid], times[valid])
+        assert slope == pytest.approx(expected.slope)
+        assert intercept == pytest.approx(np.median(v[valid] - slope * times[valid]))
+
+
+def test_theilsen_batches(series):
+    times, values = series
+    expected = temporal.theilsen(values, times)
+    # one pixel per batch
+    result = temporal.theilsen(values, times, max_bytes=1)
+    for a, b in zip(result, expected):
+        np.testing.assert_array_equal(a, b)
+
+
+def test_theilsen_batch_size(series, monkeypatch):
+    times, values = series
+    batches = []
+    pixel_batches = temporal._pixel_batches
+
+    def recording_pixel_batches(*args, **kwargs):
+        for b in pixel_batches(*args, **kwargs):
+            batches.append(b)
+            yield b
+
+    monkeypatch.setattr(temporal, "_pixel_batches", recording_pixel_batches)
+    temporal.theilsen(values, times, max_bytes=1)
+    assert len(batches) == len(values)
+
+
+def test_irls_without_iterations_matches_polyfit(series):
+    times, values = series
+    for deg in [1, 2]:
+        coefficients, _ = temporal.irls(values, times, deg=deg, max_iter=0)
+
+        assert np.isnan(coefficients[0]).all()
+        for v, c in zip(values[1:], coefficients[1:]):
+            valid = np.isfinite(v)
+            expected = np.polyfit(times[valid], v[valid], deg)
+            # quadratic coefficients in calendar years are ill-conditioned,
+            # so compare the fits
+            np.testing.assert_allclose(
+                np.polyval(c, times), np.polyval(expected, times), rtol=1e-9
+            )
+            if deg == 1:
+                np.testing.assert_allclose(c, expected, rtol=1e-6)
+
+
+def test_irls_rejects_outliers():
+    times = np.arange(2000, 2020, dtype=float)
+    values = 3 * (times - 2000) + 100
+    values[5] += 500
+    coefficients, _ = temporal.irls(values[np.newaxis], times)
+    np.testing.assert_allclose(coefficients[0], [3, 100 - 3 * 2000], rtol=1e-6)
+
+
+def test_irls_exact_fits():
+    # residuals are exactly zero, so the robust scale is zero
+    times = np.arange(10, dtype=float)
+    values = np.stack([np.full(10, 3.0), 2 * times + 1])
+    values[1, 4] = np.nan
+    coefficients, std = temporal.irls(values, times)
+
+    np.testing.assert_allclose(coefficients, [[0, 3], [2, 1]], atol=1e-9)
+    np.testing.assert_allclose(std, 0, atol=1e-9)
+
+
+def _brute_force_bootstrap(v, times, n_replicates, percentiles, seed=0):
+    mask = np.isfinite(v)
+    t, y = times[mask], v[mask]
+    rng = np.random.default_rng([seed, *np.packbits(mask).tolist()])
+    samples = rng.integers(0, len(t), (n_replicates, len(t)))
+    slopes = [
+        np.polyfit(t[s], y[s], 1)[0] if np.ptp(t[s]) > 0 else np.nan for s in samples
+    ]
+    return np.nanpercentile(slopes, percentiles)
+
+
+def test_bootstrap_matches_brute_force(series):
+    times, values = series
+    percentiles = (2.5, 50, 97.5)
+    result = temporal.bootstrap_trend(
+        values, times, n_replicates=200, percentiles=percentiles, batch_size=64
+    )
+
+    assert np.isnan(result[0]).all()
+    for v, r in zip(values[1:], result[1:]):
+        expected = _brute_force_bootstrap(v, times, 200, percentiles)
+        np.testing.assert_allclose(r, expected, rtol=1e-6)
+
+
+@pytest.mark.parametrize("method", ["bootstrap", "jackknife"])
+def test_bootstrap_batches(series, method):
+    times, values = series
+    expected = temporal.bootstrap_trend(values, times, method=method)
+    # one pixel per batch
+    result = temporal.bootstrap_trend(values, times, method=method, max_bytes=1)
+    np.testing.assert_allclose(result, expected, rtol=1e-12)
+
+
+@pytest.fixture
+def stack():
+    rng = np.random.default_rng(2)
+    data = rng.normal(1500, 5, size=(5, 12, 14)) + np.arange(5)[:, None, None]
+    data[rng.random(data.shape) < 0.2] = np.nan
+    return xr.DataArray(
+        data,
+        dims=("time", "y", "x"),
+        coords={
+            "time": np.arange(2015.0, 2020.0),
+            "y": 5300000 - 2 * np.arange(12.0),
+            "x": 600000 + 2 * np.arange(14.0),
+        },
+    )
+
+
+@pytest.mark.filterwarnings("ignore::RuntimeWarning")
+@pytest.mark.parametrize("max_bytes", [2.5e8, 1])
+def test_pairwise_differences(stack, max_bytes):
+    DataArray = stack.chunk({"y": 5, "x": 6})
+    df = temporal.pairwise_differences(DataArray, max_bytes=max_bytes)
+
+    assert len(df) == 10
+    values = stack.values
+    for row in df.itertuples():
+        i = list(stack["time"].values).index(row.time_1)
+        j = list(stack["time"].values).index(row.time_2)
+        assert i < j
+        dh = (values[j] - values[i]).ravel()
+        dh = dh[np.isfinite(dh)]
+        assert row.count == len(dh)
+        assert row.valid_area == pytest.approx(4 * len(dh))
+        assert row.mean == pytest.approx(dh.mean())
+        assert row.std == pytest.approx(dh.std())
+        # fewer differences than sketch centroids are kept exactly
+        assert row.median == pytest.approx(np.median(dh))
+        assert row.nmad == pytest.approx(
+            accumulators.NMAD_SCALE * np.median(np.abs(dh - np.median(dh))), rel=1e-3
+        )
+
+
+def test_pairwise_difference_grids(stack):
+    result = temporal.pairwise_difference_grids(stack, [(0, 4), (1, 2)])
+
+    assert result.dims == ("pair", "y", "x")
+    np.testing.assert_array_equal(result["time_1"], [2015, 2016])
+    np.testing.assert_array_equal(result["time_2"], [2019, 2017])
+    np.testing.assert_array_equal(result[0], stack[4].values - stack[0].values)
+    np.testing.assert_allclose(
+        temporal.pairwise_differences(stack, pairs=[(1, 2)])["mean"],
+        np.nanmean(result[1]),
+    )
@@ -0,0 +1,229 @@
+import os
+import threading
+import urllib.error
+import urllib.request
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from functools import partial
+from pathlib import Path
+
+import numpy as np
+import pytest
+import rasterio
+import rasterio.shutil
+from rasterio.io import MemoryFile
+from rasterio.transform import from_bounds
+
+from gtsa import tileserver
+
+Z, X, Y = 12, 655, 1429
+QUERY = "expression=b1&rescale=0,255&resampling=nearest"
+
+
+class _RangeRequestHandler(SimpleHTTPRequestHandler):
+    """
+    Static file server with the byte range support GDAL needs to read COGs.
+    """
+
+    def log_message(self, *args):
+        pass
+
+    def send_head(self):
+        header = self.headers.get("Range")
+        path = self.translate_path(self.path)
+        if not header or not os.path.isfile(path):
+            return super().send_head()
+        size = os.path.getsize(path)
+        first, last = header.split("=")[1].split("-")
+        start = int(first)
+        stop = min(int(last) + 1 if last else size, size)
+        f = open(path, "rb")
+        f.seek(start)
+        self.send_response(206)
+        self.send_header("Content-Type", "image/tiff")
+        self.send_header("Content-Range", f"bytes {start}-{stop - 1}/{size}")
+        self.send_header("Content-Length", str(stop - start))
+        self.end_headers()
+        self.range_length = stop - start
+        return f
+
+    def copyfile(self, source, outputfile):
+        if hasattr(self, "range_length"):
+            outputfile.write(source.read(self.range_length))
+        else:
+            super().copyfile(source, outputfile)
+
+
+@pytest.fixture
+def cog(tmp_path):
+    """
+    COG in EPSG:3857 covering exactly tile Z/X/Y at the tile resolution.
+    """
+    data = np.add.outer(np.arange(256), np.arange(256)).astype("float32") / 2
+    data[:10, :10] = -9999
+    profile = {
+        "driver": "GTiff",
+        "width": 256,
+        "height": 256,
+        "count": 1,
+        "dtype": "float32",
+        "crs": "EPSG:3857",
+        "transform": from_bounds(*tileserver.tile_bounds(Z, X, Y), 256, 256),
+        "nodata": -9999,
+    }
+    file_name = tmp_path / "cog.tif"
+    with MemoryFile() as memfile:
+        with memfile.open(**profile) as dst:
+            dst.write(data, 1)
+        rasterio.shutil.copy(memfile.name, file_name, driver="COG", BLOCKSIZE=128)
+    return file_name, data
+
+
+@pytest.fixture
+def file_server(tmp_path):
+    handler = partial(_RangeRequestHandler, directory=str(tmp_path))
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_port}"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.fixture
+def tile_server(tmp_path):
+    server = tileserver.TileServer(port=0, cache_dir=tmp_path / "tiles").start()
+    yield server
+    server.stop()
+
+
+def _decode(content):
+    with MemoryFile(content) as memfile, memfile.open() as src:
+        return src.read()
+
+
+def test_tile_bounds():
+    origin = tileserver.WEB_MERCATOR_ORIGIN
+    assert tileserver.tile_bounds(0, 0, 0) == (-origin, -origin, origin, origin)
+    assert tileserver.tile_bounds(1, 1, 0) == (0, 0, origin, origin)
+
+
+def test_tiles_url(tile_server):
+    template = tile_server.tiles_url
+    assert template == (
+        f"http://127.0.0.1:{tile_server.port}/cog/tiles/WebMercatorQuad/{{z}}/{{x}}/{{y}}"
+    )
+    path = template.format(z=Z, x=X, y=Y).split(str(tile_server.port), 1)[1]
+    match = tileserver.TILE_PATTERN.match(path)
+    assert tuple(int(i) for i in match.groups()) == (Z, X, Y)
+
+
+def test_render_tile(cog):
+    file_name, data = cog
+    gray, alpha = _decode(
+        tileserver.render_tile(str(file_name), Z, X, Y, resampling="nearest")
+    )
+
+    valid = data != -9999
+    np.testing.assert_array_equal(gray[valid], data[valid].astype("uint8"))
+    np.testing.assert_array_equal(alpha > 0, valid)
+
+
+def test_render_empty_tile(cog):
+    file_name, _ = cog
+    gray, alpha = _decode(tileserver.render_tile(str(file_name), Z, X + 1, Y))
+    assert not alpha.any()
+
+
+def test_tile_over_http(cog, file_server, tile_server):
+    file_name, data = cog
+    url = f"{file_server}/{file_name.name}"
+    request = tile_server.tiles_url.format(z=Z, x=X, y=Y) + f"?url={url}&{QUERY}"
+
+    with urllib.request.urlopen(request) as r:
+        assert r.headers["Content-Type"] == "image/png"
+        content = r.read()
+
+    assert content == tileserver.render_tile(
+        str(file_name), Z, X, Y, resampling="nearest"
+    )
+
+
+def test_tile_errors(cog, file_server, tile_server):
+    file_name, _ = cog
+    base = tile_server.tiles_url.format(z=Z, x=X, y=Y)
+    requests = {
+        f"?url={file_name}&expression=b1*2": 400,
+        f"?url={file_server}/missing.tif": 404,
+    }
+    for query, status in requests.items():
+        with pytest.raises(urllib.error.HTTPError) as e:
+            urllib.request.urlopen(base + query)
+        assert e.value.code == status
+
+
+def test_cache_reuse(cog, tmp_path, monkeypatch):
+    file_name, _ = cog
+    query = f"url={file_name}&{QUERY}"
+    calls = []
+    render_tile = tileserver.render_tile
+
+    def counting_render_tile(*args):
+        calls.append(args)
+        return render_tile(*args)
+
+    monkeypatch.setattr(tileserver, "render_tile", counting_render_tile)
+
+    server = tileserver.TileServer(port=0, cache_dir=tmp_path / "tiles")
+    content = server.get_tile(Z, X, Y, query)
+    assert server.get_tile(Z, X, Y, query) == content
+    assert len(calls) == 1
+    assert list((tmp_path / "tiles").rglob("*.png"))
+    server.stop()
+
+    # a new server reads rendered tiles from the disk cache
+    server = tileserver.TileServer(port=0, cache_dir=tmp_path / "tiles")
+    assert server.get_tile(Z, X, Y, query) == content
+    assert len(calls) == 1
+    server.stop()
+
+
+def test_export_tiles(cog, tmp_path):
+    file_name, _ = cog
+    out = tmp_path / "xyz"
+    written = tileserver.export_tiles(
+        str(file_name),
+        out,
+        min_zoom=Z - 1,
+        max_zoom=Z,
+        resampling="nearest",
+        workers=2,
+        verbose=False,
+    )
+
+    # tiles without valid data are not written
+    tiles = sorted(i.relative_to(out).as_posix() for i in out.rglob("*.png"))
+    assert tiles == [f"{Z - 1}/{X // 2}/{Y // 2}.png", f"{Z}/{X}/{Y}.png"]
+    assert written == 2
+    assert Path(out, f"{Z}/{X}/{Y}.png").read_bytes() == tileserver.render_tile(
+        str(file_name), Z, X, Y, resampling="nearest"
+    )
+
+    _, alpha = _decode(Path(out, f"{Z - 1}/{X // 2}/{Y // 2}.png").read_bytes())
+    # the COG covers the quadrant of the parent tile given by the child indices
+    quadrant = np.zeros((256, 256), dtype=bool)
+    row, col = 128 * (Y % 2), 128 * (X % 2)
+    quadrant[row : row + 128, col : col + 128] = True
+    assert alpha[quadrant].any()
+    assert not alpha[~quadrant].any()
+
+
+def test_export_webp_tiles(cog, tmp_path):
+    file_name, _ = cog
+    out = tmp_path / "xyz"
+    tileserver.export_tiles(
+        str(file_name), out, min_zoom=Z, max_zoom=Z, driver="WEBP", verbose=False
+    )
+    assert [i.name for i in out.rglob("*.*")] == [f"{Y}.webp"]
+
+    with pytest.raises(ValueError):
+        tileserver.export_tiles(str(file_name), out, driver="JPEG")
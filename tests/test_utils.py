@@ -0,0 +1,112 @@
+from pathlib import Path
+
+import numpy as np
+import pytest
+import rasterio
+from rasterio.transform import from_origin
+
+from gtsa import utils
+
+
+@pytest.fixture
+def dems(tmp_path):
+    rng = np.random.default_rng(0)
+    profile = {
+        "driver": "GTiff",
+        "width": 40,
+        "height": 30,
+        "count": 1,
+        "dtype": "float32",
+        "crs": "EPSG:32610",
+        "transform": from_origin(600000, 5300000, 2, 2),
+        "nodata": -9999,
+    }
+    file_names = []
+    for date in ["20150801", "20160801", "20170801"]:
+        file_name = tmp_path / f"dem_{date}.tif"
+        with rasterio.open(file_name, "w", **profile) as dst:
+            dst.write(rng.normal(1500, 10, (1, 30, 40)).astype("float32"))
+        file_names.append(file_name)
+    return file_names
+
+
+def test_resampled_name():
+    assert utils._resampled_name("dems/dem.tif", 1.0) == Path("dems/dem_1.0m.tif")
+    assert utils._resampled_name("dems/dem.tif", 2, "out") == Path("out/dem_2m.tif")
+
+
+def test_resample_dems(dems, tmp_path):
+    outputs = utils.resample_dems(
+        dems, res=4.0, output_directory=tmp_path / "resampled", workers=2, verbose=False
+    )
+    assert [Path(i).name for i in outputs] == [
+        i.name.replace(".tif", "_4.0m.tif") for i in dems
+    ]
+    for dem, output in zip(dems, outputs):
+        with rasterio.open(output) as src, rasterio.open(dem) as ref:
+            assert src.crs == ref.crs
+            assert src.transform == from_origin(600000, 5300000, 4, 4)
+            assert (src.width, src.height) == (20, 15)
+            assert src.nodata == -9999
+            assert src.profile["tiled"]
+            np.testing.assert_allclose(src.read(1).mean(), ref.read(1).mean(), atol=1)
+
+    # existing outputs are skipped
+    mtimes = [Path(i).stat().st_mtime_ns for i in outputs]
+    utils.resample_dems(
+        dems, res=4.0, output_directory=tmp_path / "resampled", verbose=False
+    )
+    assert [Path(i).stat().st_mtime_ns for i in outputs] == mtimes
+
+
+def test_default_nodata():
+    assert utils.default_nodata("uint8") == 255
+    assert utils.default_nodata("int16") == -32768
+    assert np.isnan(utils.default_nodata("float32"))
+
+
+def test_create_cogs(dems, tmp_path):
+    outputs = utils.create_cogs(
+        dems, output_directory=tmp_path / "cogs", workers=2, verbose=False
+    )
+    assert [Path(i).name for i in outputs] == [
+        i.name.replace(".tif", "_COG.tif") for i in dems
+    ]
+    for dem, output in zip(dems, outputs):
+        with rasterio.open(output) as src, rasterio.open(dem) as ref:
+            assert src.crs.to_epsg() == 4326
+            assert src.nodata == -9999
+            assert src.tags(ns="IMAGE_STRUCTURE")["LAYOUT"] == "COG"
+            assert src.profile["blockxsize"] == 512
+            data = src.read(1, masked=True)
+            # edges outside the rotated footprint are masked
+            assert data.mask.any() and not data.mask.all()
+            assert abs(data.mean() - ref.read(1).mean()) < 1
+
+    # existing outputs are skipped
+    mtimes = [Path(i).stat().st_mtime_ns for i in outputs]
+    utils.create_cogs(dems, output_directory=tmp_path / "cogs", verbose=False)
+    assert [Path(i).stat().st_mtime_ns for i in outputs] == mtimes
+
+
+def test_create_cogs_without_nodata(tmp_path):
+    profile = {
+        "driver": "GTiff",
+        "width": 40,
+        "height": 30,
+        "count": 1,
+        "dtype": "uint8",
+        "crs": "EPSG:32610",
+        "transform": from_origin(600000, 5300000, 2, 2),
+    }
+    file_name = tmp_path / "ortho.tif"
+    with rasterio.open(file_name, "w", **profile) as dst:
+        dst.write(np.full((1, 30, 40), 100, dtype="uint8"))
+
+    (output,) = utils.create_cogs([file_name], verbose=False)
+    with rasterio.open(output) as src:
+        assert src.nodata == 255
+        data = src.read(1, masked=True)
+    # areas outside the warped footprint are masked, not black
+    assert data.mask.any()
+    assert (data.compressed() == 100).all()
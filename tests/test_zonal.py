@@ -0,0 +1,155 @@
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+from click.testing import CliRunner
+from shapely.geometry import box
+
+from gtsa import zonal
+from gtsa.cli import gtsa as gtsa_cli
+
+HEIGHT, WIDTH = 40, 50
+
+
+@pytest.fixture
+def stack():
+    rng = np.random.default_rng(0)
+    data = rng.normal(1500, 20, size=(4, HEIGHT, WIDTH))
+    data[rng.random(data.shape) < 0.2] = np.nan
+    DataArray = xr.DataArray(
+        data,
+        dims=("time", "y", "x"),
+        coords={
+            "time": pd.date_range("2015-08-01", periods=4, freq="YS"),
+            "y": 5300000 - 10 * (np.arange(HEIGHT) + 0.5),
+            "x": 600000 + 10 * (np.arange(WIDTH) + 0.5),
+        },
+    )
+    return DataArray.rio.write_crs("EPSG:32610")
+
+
+@pytest.fixture
+def polygons():
+    return gpd.GeoDataFrame(
+        {"name": ["a", "b", "c"]},
+        geometry=[
+            box(600000, 5299800, 600200, 5300000),
+            box(600150, 5299700, 600400, 5299900),  # overlaps a, takes precedence
+            box(600300, 5299600, 600500, 5299700),
+        ],
+        crs="EPSG:32610",
+    )
+
+
+def _groupby(DataArray, labels):
+    """
+    Reference statistics per time step and label with pandas.
+    """
+    df = DataArray.to_dataframe(name="value").reset_index()
+    df["label"] = np.tile(labels.ravel(), DataArray.sizes["time"])
+    df = df[df["label"] > 0].dropna()
+    return df.groupby(["time", "label"])["value"].agg(
+        count="count",
+        mean="mean",
+        std=lambda i: i.std(ddof=0),
+        median="median",
+        q25=lambda i: i.quantile(0.25),
+        q75=lambda i: i.quantile(0.75),
+    )
+
+
+@pytest.mark.parametrize("chunks", [None, {"time": 1, "y": 15, "x": 20}])
+def test_zonal_statistics_matches_groupby(stack, polygons, chunks):
+    DataArray = stack.chunk(chunks) if chunks else stack
+    result = zonal.zonal_statistics(DataArray, polygons, id_column="name")
+
+    labels = zonal.rasterize_labels(polygons, stack)
+    expected = _groupby(stack, labels).reset_index()
+    expected["name"] = polygons["name"].values[expected["label"] - 1]
+
+    assert len(result) == 4 * len(polygons)
+    result = result.set_index(["time", "name"]).loc[
+        expected.set_index(["time", "name"]).index
+    ]
+    for column in ["count", "mean", "std"]:
+        np.testing.assert_allclose(result[column], expected[column], rtol=1e-10)
+    # quantiles are approximated with sketches of 64 centroids
+    for column in ["median", "q25", "q75"]:
+        np.testing.assert_allclose(result[column], expected[column], atol=2)
+
+    pixels = np.bincount(labels.ravel())[1:]
+    np.testing.assert_allclose(
+        result["coverage"], result["count"] / pixels[expected["label"] - 1]
+    )
+    np.testing.assert_allclose(result["area"], pixels[expected["label"] - 1] * 100)
+    np.testing.assert_allclose(result["volume"], result["mean"] * result["area"])
+
+
+def test_grouped_std_with_large_offset():
+    # the naive sum of squares loses all precision for values around 1e9
+    rng = np.random.default_rng(1)
+    values = 1e9 + rng.normal(0, 0.01, size=(1, 20, 20))
+    labels = np.ones((20, 20), dtype="int32")
+    DataArray = xr.DataArray(values, dims=("time", "y", "x")).chunk({"y": 7, "x": 7})
+
+    result = zonal.grouped_statistics(DataArray, labels, n_labels=2)
+
+    np.testing.assert_allclose(result["std"][0, 1], values.std(), rtol=1e-6)
+    assert result["count"][0, 0] == 0
+    assert np.isnan(result["mean"][0, 0]) and np.isnan(result["std"][0, 0])
+
+
+@pytest.fixture
+def reference_dem(stack, tmp_path):
+    # elevations increasing downslope from 1000 to 1390 m
+    elevation = np.broadcast_to(
+        1000 + 10 * np.arange(HEIGHT, dtype=float)[:, np.newaxis], (HEIGHT, WIDTH)
+    ).copy()
+    elevation[:3, :3] = np.nan
+    DataArray = stack.isel(time=0).copy(data=elevation)
+    file_name = tmp_path / "reference.tif"
+    DataArray.rio.to_raster(file_name)
+    return file_name, elevation
+
+
+def test_hypsometric_statistics_matches_groupby(stack, reference_dem):
+    file_name, elevation = reference_dem
+    result = zonal.hypsometric_statistics(stack, file_name, band_width=50)
+
+    labels, edges = zonal.elevation_band_labels(elevation, band_width=50)
+    np.testing.assert_array_equal(edges, 1000 + 50 * np.arange(8))
+    expected = _groupby(stack, labels).reset_index()
+    expected["band_min"] = edges[expected["label"] - 1]
+
+    result = result.set_index(["time", "band_min"]).loc[
+        expected.set_index(["time", "band_min"]).index
+    ]
+    np.testing.assert_allclose(
+        result["band_max"], result.index.get_level_values(1) + 50
+    )
+    for column in ["count", "mean", "std"]:
+        np.testing.assert_allclose(result[column], expected[column], rtol=1e-10)
+    for column in ["median", "q25", "q75"]:
+        np.testing.assert_allclose(result[column], expected[column], atol=2)
+
+
+def test_trend_tables_only_for_linear_fits(stack, reference_dem, tmp_path):
+    file_name, _ = reference_dem
+    ds = stack.to_dataset(name="band1")
+    ds.attrs["crs"] = ds.rio.crs.to_wkt()
+    ds.attrs["reference_geotif_file"] = str(file_name)
+    ds.drop_vars("spatial_ref").to_zarr(tmp_path / "stack.zarr")
+
+    # fmt: off
+    args = [
+        "-if", tmp_path / "stack.zarr", "-od", tmp_path / "outputs",
+        "-c", "polyfit", "-deg", "1", "-c", "polyfit", "-deg", "2",
+        "-c", "hypsometry", "-bw", "100", "-si",
+    ]
+    # fmt: on
+    result = CliRunner().invoke(gtsa_cli.main, [str(i) for i in args])
+    assert result.exit_code == 0, result.output
+
+    tables = sorted(i.name for i in (tmp_path / "outputs").glob("*.csv"))
+    assert tables == ["hypsometry.csv", "hypsometry_polyfit_deg1.csv"]